@@ -11,9 +11,22 @@ if not api_key:
 
 openai.api_key = api_key
 
+# LLM 호출 한 번의 제한 시간(초). 재시도는 utils/llm_scheduler에서 하므로 SDK 자체 재시도는 끔
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+
 client = openai.OpenAI(
     api_key=api_key,
-    http_client=httpx.Client(verify=False)
+    http_client=httpx.Client(verify=False),
+    timeout=LLM_REQUEST_TIMEOUT,
+    max_retries=0
+)
+
+# 비동기 클라이언트 (chunk 병렬 요청용)
+async_client = openai.AsyncOpenAI(
+    api_key=api_key,
+    http_client=httpx.AsyncClient(verify=False),
+    timeout=LLM_REQUEST_TIMEOUT,
+    max_retries=0
 )
 
 logging.basicConfig(level=logging.INFO)
@@ -31,4 +44,39 @@ LANGUAGE_RULES = {
     "html": "- 구조 변경 없이 들여쓰기만 조정하세요. 들여쓰기는 탭 사용.",
     "python": "- 들여쓰기는 탭으로. 구조나 순서 변경 금지."
 }
-MAX_CHARS_PER_CHUNK = 10000
\ No newline at end of file
+MAX_CHARS_PER_CHUNK = 10000
+# 모델별 (컨텍스트 토큰 수, 최대 출력 토큰 수) - chunk 크기 계산용
+MODEL_TOKEN_LIMITS = {
+    "gpt-3.5-turbo": (16385, 4096),
+    "gpt-4": (8192, 8192),
+    "gpt-4-turbo": (128000, 4096),
+    "gpt-4o": (128000, 16384),
+    "gpt-4o-mini": (128000, 16384),
+    "gpt-4.1": (1047576, 32768),
+    "gpt-4.1-mini": (1047576, 32768),
+}
+DEFAULT_MODEL_TOKEN_LIMITS = (8192, 4096)
+# chunk 하나가 차지할 수 있는 컨텍스트 비율 (나머지는 프롬프트/요약/응답용)
+CHUNK_CONTEXT_RATIO = float(os.getenv("CHUNK_CONTEXT_RATIO", "0.25"))
+# chunk 경계에서 앞 chunk의 마지막 N줄을 다음 chunk 앞에 겹쳐 넣음 (리뷰용)
+CHUNK_OVERLAP_LINES = int(os.getenv("CHUNK_OVERLAP_LINES", "5"))
+# chunk 요약을 전체 요약으로 합칠 때 한 번에 묶는 요약 수 (단계마다 1/N로 줄어듦)
+SUMMARY_REDUCE_FANOUT = int(os.getenv("SUMMARY_REDUCE_FANOUT", "8"))
+# 요청 하나당 동시에 보낼 수 있는 LLM 호출 수
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "5"))
+# 모델별 (분당 요청 수 RPM, 분당 토큰 수 TPM) - 계정 등급에 맞게 조정
+MODEL_RATE_LIMITS = {
+    "gpt-3.5-turbo": (3500, 200000),
+    "gpt-4": (500, 10000),
+    "gpt-4-turbo": (500, 30000),
+    "gpt-4o": (500, 30000),
+    "gpt-4o-mini": (500, 200000),
+    "gpt-4.1": (500, 30000),
+    "gpt-4.1-mini": (500, 200000),
+}
+DEFAULT_MODEL_RATE_LIMITS = (
+    int(os.getenv("LLM_DEFAULT_RPM", "500")),
+    int(os.getenv("LLM_DEFAULT_TPM", "30000")),
+)
+# 전체 한도 중 이 비율만 사용 (다른 프로세스/오차 여유분)
+LLM_RATE_LIMIT_RATIO = float(os.getenv("LLM_RATE_LIMIT_RATIO", "0.9"))
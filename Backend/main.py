@@ -1,8 +1,17 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import format, review, gpt_format, sast
+from routers import format, review, gpt_format, sast, admin, jobs, repo_scan
+from utils.job_queue import job_queue
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 백그라운드 작업 워커 시작/종료
+    job_queue.start()
+    yield
+    await job_queue.stop()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -15,6 +24,9 @@ app.include_router(format.router)
 app.include_router(review.router)
 app.include_router(gpt_format.router)
 app.include_router(sast.router)
+app.include_router(admin.router)
+app.include_router(jobs.router)
+app.include_router(repo_scan.router)
 
 # 아래는 uvicorn 실행용 예시
-# python -m uvicorn main:app --reload --port 8513
\ No newline at end of file
+# python -m uvicorn main:app --reload --port 8513
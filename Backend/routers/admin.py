@@ -0,0 +1,34 @@
+from fastapi import APIRouter
+from utils.gpt_feedback_cache import cache_size, cache_stats, clear_cache
+from utils.llm_scheduler import llm_scheduler
+from utils.llm_resilience import resilience_stats
+from utils.metrics import metrics, llm_prompt_cache_stats
+from utils.admission import admission
+
+router = APIRouter()
+
+@router.get("/admin/cache/feedback")
+async def feedback_cache_status():
+    return {"size": cache_size(), **cache_stats()}
+
+@router.delete("/admin/cache/feedback")
+async def feedback_cache_clear():
+    cleared = cache_size()
+    clear_cache()
+    return {"cleared": cleared}
+
+@router.get("/admin/llm/scheduler")
+async def llm_scheduler_status():
+    return llm_scheduler.stats()
+
+@router.get("/admin/llm/circuits")
+async def llm_circuit_status():
+    return resilience_stats()
+
+@router.get("/admin/metrics")
+async def metrics_status():
+    return {"counters": metrics.snapshot(), "llm_prompt_cache": llm_prompt_cache_stats()}
+
+@router.get("/admin/admission")
+async def admission_status():
+    return admission.stats()
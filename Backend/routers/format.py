@@ -1,10 +1,13 @@
-from fastapi import APIRouter, UploadFile, File, Form
-from utils.formatters import format_sql_extended, format_block_style_extended, format_html
+import asyncio
+from fastapi import APIRouter, UploadFile, File, Form, Request
+from utils.formatters import local_format, join_spans
+from utils.admission import admission, AdmissionRejected, rejected_response
 
 router = APIRouter()
 
 @router.post("/format/")
 async def format_code(
+    request: Request,
     file: UploadFile = File(...),
     indent: str = Form("4"),
     brace: str = Form("same-line"),
@@ -18,13 +21,17 @@ async def format_code(
             return "\t"
         return " " * int(indent)
 
-    if ext == "sql":
-        result = format_sql_extended(code, get_indent, comma)
-    elif ext in ("java", "js", "ts", "py", "c", "cpp"):
-        result = format_block_style_extended(code, get_indent, brace)
-    elif ext in ("jsp", "html"):
-        result = format_html(code, format_block_style_extended, get_indent, brace)
-    else:
-        result = format_block_style_extended(code, get_indent, brace)
+    # 로컬 엔진이 확신하지 못한 구간(짝이 안 맞는 괄호 등)과 지원하지 않는 언어는 원본 그대로
+    # CPU 작업이라 이벤트 루프 밖에서 실행하고, 동시에 도는 수는 제한
+    try:
+        async with admission.slot("format", request):
+            spans = await asyncio.to_thread(local_format, code, ext, indent=get_indent(), brace=brace, comma=comma)
+    except AdmissionRejected as e:
+        return rejected_response(e)
+    if spans is None:
+        return {"formatted": code, "unformatted_regions": 1}
 
-    return {"formatted": result}
\ No newline at end of file
+    return {
+        "formatted": join_spans(spans),
+        "unformatted_regions": sum(1 for span in spans if span.formatted is None)
+    }
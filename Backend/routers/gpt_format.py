@@ -1,80 +1,309 @@
-from fastapi import APIRouter, UploadFile, File, Form, Response
-from config import client, logger, LANGUAGE_RULES, LANGUAGE_MAP, MAX_CHARS_PER_CHUNK
-from utils.chunk import smart_chunking, smart_chunking_html
-from utils.common import extract_code_from_markdown, convert_2space_to_tab_only_at_line_start, count_indent_level
+import asyncio
+from fastapi import APIRouter, UploadFile, File, Form, Request, Response
+from fastapi.responses import StreamingResponse, JSONResponse
+from config import logger, LANGUAGE_RULES, LANGUAGE_MAP, LLM_MAX_CONCURRENCY
+from utils.chunk import token_budget_chunking
+from utils.formatters import local_format, indent_levels, FormatSpan
+from utils.llm_scheduler import chat_completion, concurrency_slot, PRIORITY_INTERACTIVE
+from utils.cancellation import cancel_on_disconnect, RequestCancelled
+from utils.single_flight import single_flight, flight_key
+from utils.admission import admission, AdmissionRejected, rejected_response
+from utils.common import extract_code_from_markdown, convert_2space_to_tab_only_at_line_start, count_indent_level, StreamingCodeExtractor
 
 router = APIRouter()
 
+_DONE = object()
+
+
+def build_format_messages(language: str, rule: str, chunk: str, anchor: int) -> list[dict]:
+    """
+    정렬 요청 메시지. 언어/규칙 지시문은 chunk와 상관없이 같으므로 system 메시지에 고정된 순서로 두고,
+    chunk마다 달라지는 시작 깊이와 코드는 user 메시지로 보낸다. (provider 프롬프트 prefix 캐시)
+    """
+    system_prompt = (
+        f"사용자가 보내는 {language.upper()} 코드를 정렬합니다.\n"
+        f"{rule}\n"
+        f"- 정렬 전 코드의 각 줄 들여쓰기(탭 개수)는 반드시 입력 그대로 보존해야 합니다.\n"
+        f"- 들여쓰기는 오직 탭(tab)만 사용하고, 공백(스페이스)은 절대 사용하지 마세요.\n"
+        f"- 줄마다 들여쓰기 깊이(탭 수)가 달라도 원본 코드의 계층 구조를 반드시 유지해야 합니다.\n"
+        f"- 원본 구조, 태그, 계층, 줄 개수, 들여쓰기 단계를 임의로 바꾸거나 동일하게 맞추지 마세요.\n"
+        f"- 정렬할 코드는 전체 파일의 일부이며, 첫 줄의 들여쓰기 깊이(탭 수)가 함께 주어집니다.\n"
+        f"  첫 줄을 반드시 그 깊이로 시작하고, 나머지 줄은 그 기준에서 원래 계층대로 맞추세요.\n"
+        f"정렬된 코드만 결과로 보여 주세요."
+    )
+
+    prompt = (
+        f"첫 줄 들여쓰기: 탭 {anchor}개\n\n"
+        f"정렬 전 코드:\n"
+        f"```{language.lower()}\n{chunk}\n```"
+    )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+
+
+class _AnchorShift:
+    """LLM 결과의 첫 줄이 anchor 깊이에서 시작하도록 모든 줄의 탭 수를 같은 만큼 옮긴다"""
+
+    def __init__(self, anchor: int):
+        self.anchor = anchor
+        self.delta = None
+
+    def __call__(self, line: str) -> str:
+        if not line.strip():
+            return line
+        tabs = len(line) - len(line.lstrip("\t"))
+        if self.delta is None:
+            self.delta = self.anchor - tabs
+        if self.delta > 0:
+            return "\t" * self.delta + line
+        return line[min(tabs, -self.delta):]
+
+
+def _format_segments(content: str, language: str, model: str, engine: str) -> list[tuple]:
+    """
+    로컬 엔진으로 먼저 정렬하고, 엔진이 확신하지 못한 구간만 LLM chunk로 나눈다.
+    chunk마다 원본 구조로 계산한 시작 깊이(anchor)를 함께 정해 두므로 chunk끼리 동시에 보낼 수 있다.
+
+    Returns:
+        list[tuple]: 원본 순서대로 (로컬 정렬 결과, None) 또는 (None, [(chunk, anchor), ...])
+    """
+    spans = local_format(content, language) if engine != "llm" else None
+    if spans is None:
+        spans = [FormatSpan(content, None)]
+
+    levels = None
+    segments = []
+    line_offset = 0
+    for span in spans:
+        if span.formatted is not None:
+            segments.append((span.formatted, None))
+            line_offset += span.original.count("\n") + 1
+            continue
+
+        if levels is None:
+            levels = indent_levels(content, language) or []
+        # 모델 토큰 예산 기준으로 분할 (HTML/JSP 등 패턴이 없는 언어는 줄 단위)
+        # 결과를 그대로 이어 붙이므로 겹침(overlap)은 사용하지 않음
+        chunks = []
+        chunk_line = line_offset
+        for chunk in token_budget_chunking(span.original, model, LANGUAGE_MAP.get(language.lower(), "Plain Text")):
+            lines = chunk.splitlines()
+            first = next((i for i, line in enumerate(lines) if line.strip()), 0)
+            if chunk_line + first < len(levels):
+                anchor = levels[chunk_line + first]
+            else:
+                # 구조로 깊이를 못 구하는 언어(SQL 등)는 원본 들여쓰기 기준
+                anchor = count_indent_level(convert_2space_to_tab_only_at_line_start(lines[first]) if lines else "")
+            chunks.append((chunk, anchor))
+            chunk_line += chunk.count("\n")
+        segments.append((None, chunks))
+        line_offset += span.original.count("\n") + 1
+    return segments
+
+
+def _engine_header(segments: list[tuple]) -> str:
+    """X-Format-Engine 헤더 값: local(LLM 호출 없음) / mixed / llm"""
+    local = any(formatted is not None for formatted, _ in segments)
+    llm = any(chunks for _, chunks in segments)
+    return "mixed" if local and llm else ("llm" if llm else "local")
+
+
+async def _format_chunk(chunk: str, anchor: int, language: str, rule: str, model: str, semaphore: asyncio.Semaphore) -> str:
+    messages = build_format_messages(language, rule, chunk, anchor)
+    async with concurrency_slot(semaphore, model, messages):
+        response = await chat_completion(
+            model=model,
+            messages=messages,
+            priority=PRIORITY_INTERACTIVE,
+            temperature=0.3
+        )
+    formatted_code = extract_code_from_markdown(response.choices[0].message.content)
+    shift = _AnchorShift(anchor)
+    return "\n".join(shift(convert_2space_to_tab_only_at_line_start(line)) for line in formatted_code.splitlines())
+
+
+async def _stream_chunk(chunk: str, anchor: int, language: str, rule: str, model: str, semaphore: asyncio.Semaphore, queue: asyncio.Queue):
+    """chunk 하나의 정렬 결과를 완성된 줄 단위로 queue에 넣는다 (끝은 _DONE, 실패하면 예외 객체)"""
+    messages = build_format_messages(language, rule, chunk, anchor)
+    try:
+        async with concurrency_slot(semaphore, model, messages):
+            stream = await chat_completion(
+                model=model,
+                messages=messages,
+                priority=PRIORITY_INTERACTIVE,
+                temperature=0.3,
+                stream=True
+            )
+            extractor = StreamingCodeExtractor()
+            shift = _AnchorShift(anchor)
+            async for event in stream:
+                if not event.choices:
+                    continue
+                for line in extractor.feed(event.choices[0].delta.content or ""):
+                    queue.put_nowait(shift(line))
+            for line in extractor.finish():
+                queue.put_nowait(shift(line))
+        queue.put_nowait(_DONE)
+    except Exception as e:
+        queue.put_nowait(e)
+
+
+async def _stream_formatted(segments: list[tuple], language: str, rule: str, model: str):
+    """
+    모든 LLM chunk를 한꺼번에 시작하고, 결과는 원본 순서대로 내보낸다.
+    로컬 엔진 결과는 바로, 앞 chunk는 토큰이 오는 대로, 뒤 chunk는 그동안 받아 둔 줄부터 이어서 보낸다.
+    정렬은 줄 수를 유지하므로, 중간에 실패하면 원본의 남은 줄을 이어서 내보낸다.
+    """
+    semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    queues = {}
+    tasks = []
+    for seg_idx, (_, chunks) in enumerate(segments):
+        for chunk_idx, (chunk, anchor) in enumerate(chunks or []):
+            queue = queues[(seg_idx, chunk_idx)] = asyncio.Queue()
+            tasks.append(asyncio.create_task(_stream_chunk(chunk, anchor, language, rule, model, semaphore, queue)))
+
+    first_line = True
+    idx = 0
+    try:
+        for seg_idx, (local, chunks) in enumerate(segments):
+            if local is not None:
+                yield local if first_line else "\n" + local
+                first_line = False
+                continue
+
+            for chunk_idx, (chunk, _) in enumerate(chunks):
+                idx += 1
+                queue = queues[(seg_idx, chunk_idx)]
+                sent = 0
+                while True:
+                    item = await queue.get()
+                    if item is _DONE:
+                        break
+                    if isinstance(item, Exception):
+                        # 재시도까지 실패하면 아직 내보내지 않은 줄은 원본 그대로 (출력에 오류 문구를 섞지 않음)
+                        logger.error(f"[GPT 정렬 오류] Chunk {idx} 실패, 원본 유지: {str(item)}")
+                        for line in chunk.splitlines()[sent:]:
+                            yield line if first_line else "\n" + line
+                            first_line = False
+                        break
+                    sent += 1
+                    yield item if first_line else "\n" + item
+                    first_line = False
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _format_all(segments: list[tuple], language: str, rule: str, model: str) -> tuple[str, list[str]]:
+    """
+    모든 LLM chunk를 동시에 정렬해 원본 순서대로 합친다.
+
+    Returns:
+        tuple: (정렬 결과, 실패해서 원본을 유지한 chunk 번호 목록)
+    """
+    semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    llm_chunks = [item for _, chunks in segments for item in chunks or []]
+    results = iter(await asyncio.gather(
+        *(_format_chunk(chunk, anchor, language, rule, model, semaphore) for chunk, anchor in llm_chunks),
+        return_exceptions=True
+    ))
+
+    formatted_blocks = []
+    failed_chunks = []
+    idx = 0
+    for local, chunks in segments:
+        if local is not None:
+            formatted_blocks.append(local)
+            continue
+
+        for chunk, _ in chunks:
+            idx += 1
+            result = next(results)
+            if isinstance(result, Exception):
+                # 재시도까지 실패한 chunk는 원본 그대로 두고, 실패한 chunk 번호는 헤더로 알림
+                logger.error(f"[GPT 정렬 오류] Chunk {idx} 실패, 원본 유지: {str(result)}")
+                formatted_blocks.append(chunk)
+                failed_chunks.append(str(idx))
+            else:
+                formatted_blocks.append(result)
+
+    return "\n".join(formatted_blocks), failed_chunks
+
+
 @router.post("/gpt_format/")
 async def gpt_format_code(
+    request: Request,
     file: UploadFile = File(...),
     language: str = Form(...),
-    model: str = Form("gpt-3.5-turbo")
+    model: str = Form("gpt-3.5-turbo"),
+    stream: str = Form("false"),
+    engine: str = Form("auto")
 ):
-    content = (await file.read()).decode("utf-8")
+    """
+    engine="auto"(기본)면 로컬 정렬 엔진을 먼저 쓰고 엔진이 확신하지 못한 구간만 LLM으로 보낸다.
+    engine="llm"이면 전체를 LLM으로 정렬 (이전 동작).
+    LLM chunk는 원본 구조로 계산한 시작 깊이를 프롬프트에 넣어 동시에 보낸다.
+    같은 파일/언어/모델/옵션으로 동시에 들어온 요청은 LLM 정렬 하나를 함께 기다린다.
+    클라이언트 연결이 끊기면 남은 LLM 호출은 취소한다. (함께 기다리는 요청이 없을 때)
+    """
+    raw = await file.read()
+    content = raw.decode("utf-8")
 
     additional_rule = "\n- 특히 들여쓰기는 반드시 '탭(tab)'으로 해 주세요. 절대 스페이스(공백)로 들여쓰지 마세요."
     additional_rule += "\n- 코드 외에 불필요한 설명, 주석, 메타 정보는 절대 추가하지 마세요. 원본에 없는 주석은 생성하지 마세요."
 
     rule = LANGUAGE_RULES.get(language.lower(), "\n- 들여쓰기 기준만 맞춰 정렬해 주세요.") + additional_rule
 
-    if language.lower() in ["html", "jsp"]:
-        chunks = smart_chunking_html(content, MAX_CHARS_PER_CHUNK)
-    else:
-        chunks = smart_chunking(content, MAX_CHARS_PER_CHUNK, LANGUAGE_MAP.get(language, "Plain Text"))
+    # 스트리밍 모드: 정렬된 줄을 준비되는 대로 전송
+    if stream.lower() in ["true", "1", "yes"]:
+        key = flight_key("gpt_format_stream", raw, language.lower(), model, engine=engine.lower())
+        try:
+            ticket = await admission.admit_stream("gpt_format", request, bypass=single_flight.in_flight(key))
+        except AdmissionRejected as e:
+            return rejected_response(e)
+        except RequestCancelled:
+            return JSONResponse(status_code=499, content={"error": "클라이언트 연결이 끊겨 정렬을 중단했습니다."})
 
-    formatted_blocks = []
-    context_tail = ""
-
-    for idx, chunk in enumerate(chunks):
-        indent_level = count_indent_level(context_tail)
-        prompt = (
-            f"다음은 {language.upper()} 코드입니다.\n"
-            f"{rule}\n"
-            f"- 정렬 전 코드의 각 줄 들여쓰기(탭 개수)는 반드시 입력 그대로 보존해야 합니다.\n"
-            f"- 들여쓰기는 오직 탭(tab)만 사용하고, 공백(스페이스)은 절대 사용하지 마세요.\n"
-            f"- 줄마다 들여쓰기 깊이(탭 수)가 달라도 원본 코드의 계층 구조를 반드시 유지해야 합니다.\n"
-            f"- 원본 구조, 태그, 계층, 줄 개수, 들여쓰기 단계를 임의로 바꾸거나 동일하게 맞추지 마세요.\n"
-        )
+        try:
+            # 로컬 정렬도 /format/처럼 자리를 얻은 뒤에 실행 (CPU 작업이라 이벤트 루프 밖에서)
+            segments = await asyncio.to_thread(_format_segments, content, language, model, engine.lower())
+        except BaseException:
+            if ticket:
+                ticket.release()
+            raise
+        headers = {"X-Format-Engine": _engine_header(segments)}
 
-        if context_tail:
-            prompt += (
-                f"이 청크는 이전 코드 맥락(아래 코드 블록) 바로 뒤에 이어지는 부분입니다.\n"
-                f"첫 줄의 들여쓰기를 반드시 이전 맥락의 마지막 줄과 동일하게 맞추고,\n"
-                f"청크 내부의 계층(들여쓰기)는 절대로 임의로 변경하지 마세요.\n"
-                f"들여쓰기는 반드시 탭(tab)만 사용하세요.\n"
-                f"이전 코드 맥락:\n"
-                f"이전 코드 맥락 (들여쓰기 계층 유지를 위해 참고):\n"
-                f"```{language.lower()}\n{context_tail}\n```\n\n"
-            )
+        async def stream_body():
+            try:
+                async with cancel_on_disconnect(request, "gpt_format_stream"):
+                    async for piece in single_flight.stream(key, lambda: _stream_formatted(segments, language, rule, model)):
+                        yield piece
+            except RequestCancelled:
+                logger.info(f"[연결 종료] 정렬 스트리밍 중단 : {file.filename}")
 
-        prompt += (
-            f"정렬 전 코드:\n"
-            f"```{language.lower()}\n{chunk}\n```\n\n"
-            f"정렬된 코드만 결과로 보여 주세요."
-        )
+        body = stream_body()
+        return StreamingResponse(ticket.hold(body) if ticket else body, media_type="text/plain", headers=headers)
 
-        try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-            formatted = response.choices[0].message.content
-            formatted_code = extract_code_from_markdown(formatted)
-            lines = formatted_code.splitlines()
-            corrected = [convert_2space_to_tab_only_at_line_start(line) for line in lines]
-            formatted_code = "\n".join(corrected)
-            formatted_blocks.append(formatted_code)
-
-            CONTEXT_LINES = 30
-            last_lines = formatted_code.rstrip().splitlines()[-CONTEXT_LINES:]
-            context_tail = "\n".join(last_lines)
-
-        except Exception as e:
-            logger.error(f"[GPT 정렬 오류] Chunk {idx+1} 실패: {str(e)}")
-            formatted_blocks.append(f"/* 오류: {str(e)} */")
-            context_tail = ""
-
-    final_code = "\n".join(formatted_blocks)
-    return Response(content=final_code, media_type="text/plain")
\ No newline at end of file
+    key = flight_key("gpt_format", raw, language.lower(), model, engine=engine.lower())
+    try:
+        async with cancel_on_disconnect(request, "gpt_format"):
+            async with admission.slot("gpt_format", request, bypass=single_flight.in_flight(key)):
+                # 로컬 정렬도 /format/처럼 자리를 얻은 뒤에 실행 (CPU 작업이라 이벤트 루프 밖에서)
+                segments = await asyncio.to_thread(_format_segments, content, language, model, engine.lower())
+                # 일부 chunk가 실패한 결과는 캐시하지 않음
+                final_code, failed_chunks = await single_flight.do(
+                    key, lambda: _format_all(segments, language, rule, model),
+                    cache_if=lambda result: not result[1]
+                )
+    except AdmissionRejected as e:
+        return rejected_response(e)
+    except RequestCancelled:
+        logger.info(f"[연결 종료] 정렬 중단 : {file.filename}")
+        return JSONResponse(status_code=499, content={"error": "클라이언트 연결이 끊겨 정렬을 중단했습니다."})
+
+    headers = {"X-Format-Engine": _engine_header(segments)}
+    if failed_chunks:
+        headers["X-Format-Failed-Chunks"] = ",".join(failed_chunks)
+    return Response(content=final_code, media_type="text/plain", headers=headers)
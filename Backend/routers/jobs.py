@@ -0,0 +1,101 @@
+import asyncio
+from fastapi import APIRouter, UploadFile, File, Form
+from fastapi.responses import JSONResponse
+from config import logger
+from utils.security import allowed_file, file_size_okay
+from utils.job_queue import job_queue, JobQueueFull
+from routers.review import review_events
+from routers.sast import run_sast_detail
+from utils.llm_scheduler import llm_priority, PRIORITY_BULK
+
+router = APIRouter()
+
+
+# 백그라운드 작업의 LLM 호출은 화면에서 기다리는 요청보다 뒤로 보냄
+async def _run_review_job(payload: dict):
+    result = None
+    with llm_priority(PRIORITY_BULK):
+        async for event in review_events(payload["code"], payload["ext"], payload["model"]):
+            if event["event"] == "done":
+                result = event["result"]
+    return result
+
+
+async def _run_sast_job(payload: dict):
+    with llm_priority(PRIORITY_BULK):
+        results = await run_sast_detail(payload["code"], payload["ext"], payload["use_gpt"], payload["gpt_model"])
+    if results is None:
+        raise ValueError("[지원되지 않는 파일 유형이거나 SAST 분석 불가]")
+    return {"sast_result": results}
+
+
+job_queue.register("review", _run_review_job)
+job_queue.register("sast", _run_sast_job)
+
+
+async def _read_upload(file: UploadFile):
+    """확장자/용량 검사 후 (code, ext) 반환. 실패 시 JSONResponse"""
+    if not allowed_file(file.filename):
+        return JSONResponse(status_code=400, content={"error": "허용되지 않는 확장자입니다."})
+
+    content = await file.read()
+    if not file_size_okay(content):
+        return JSONResponse(status_code=400, content={"error": "파일 용량이 너무 큽니다."})
+
+    return content.decode("utf-8"), file.filename.split('.')[-1].lower()
+
+
+async def _submit(kind: str, payload: dict):
+    try:
+        job_id = await job_queue.submit(kind, payload)
+    except JobQueueFull as e:
+        return JSONResponse(status_code=429, content={"error": str(e)})
+    logger.info(f"[작업 등록] {kind}: {job_id}")
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status": "queued"})
+
+
+@router.post("/jobs/review")
+async def submit_review_job(
+    file: UploadFile = File(...),
+    model: str = Form("gpt-3.5-turbo")
+):
+    upload = await _read_upload(file)
+    if isinstance(upload, JSONResponse):
+        return upload
+    code, ext = upload
+    return await _submit("review", {"code": code, "ext": ext, "model": model})
+
+
+@router.post("/jobs/sast")
+async def submit_sast_job(
+    file: UploadFile = File(...),
+    use_gpt_feedback: str = Form("false"),
+    gpt_model: str = Form("gpt-3.5-turbo")
+):
+    upload = await _read_upload(file)
+    if isinstance(upload, JSONResponse):
+        return upload
+    code, ext = upload
+    use_gpt = use_gpt_feedback.lower() in ["true", "1", "yes"]
+    return await _submit("sast", {"code": code, "ext": ext, "use_gpt": use_gpt, "gpt_model": gpt_model})
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "작업을 찾을 수 없습니다."})
+    job.pop("result")
+    return job
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "작업을 찾을 수 없습니다."})
+    if job["status"] == "failed":
+        return JSONResponse(status_code=500, content={"error": job["error"]})
+    if job["status"] != "done":
+        return JSONResponse(status_code=202, content={"job_id": job_id, "status": job["status"]})
+    return job["result"]
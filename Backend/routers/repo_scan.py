@@ -0,0 +1,117 @@
+import os
+import json
+import hashlib
+import shutil
+import asyncio
+import tempfile
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Form, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from config import logger
+from utils.repo_scan import scan_tree_events, extract_archive
+from utils.admission import admission, AdmissionRejected, rejected_response
+from utils.cancellation import RequestCancelled
+
+router = APIRouter()
+
+REPO_SCAN_MAX_ARCHIVE_BYTES = int(os.getenv("REPO_SCAN_MAX_ARCHIVE_BYTES", str(200 * 1024 * 1024)))
+# 서버 경로 분석은 이 폴더 아래만 허용 (비어 있으면 서버 경로 분석 불가)
+REPO_SCAN_ROOT = os.getenv("REPO_SCAN_ROOT", "")
+# 서버 경로 분석 시 폴더별 매니페스트(이전 결과) 저장 위치
+REPO_SCAN_MANIFEST_DIR = os.getenv("REPO_SCAN_MANIFEST_DIR", "scan_manifests")
+
+
+def _save_upload(file: UploadFile, dest_path: str) -> bool:
+    """업로드 파일을 디스크에 저장. 용량 초과 시 False"""
+    written = 0
+    with open(dest_path, "wb") as out:
+        while True:
+            block = file.file.read(1024 * 1024)
+            if not block:
+                return True
+            written += len(block)
+            if written > REPO_SCAN_MAX_ARCHIVE_BYTES:
+                return False
+            out.write(block)
+
+
+def _resolve_server_path(path: str) -> Optional[str]:
+    if not REPO_SCAN_ROOT:
+        return None
+    allowed_root = os.path.realpath(REPO_SCAN_ROOT)
+    target = os.path.realpath(os.path.join(allowed_root, path))
+    if target != allowed_root and not target.startswith(allowed_root + os.sep):
+        return None
+    return target if os.path.isdir(target) else None
+
+
+def _manifest_path(root: str) -> str:
+    os.makedirs(REPO_SCAN_MANIFEST_DIR, exist_ok=True)
+    name = hashlib.sha256(root.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(REPO_SCAN_MANIFEST_DIR, f"{name}.json")
+
+
+@router.post("/scan/repo")
+async def scan_repository(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    path: str = Form(""),
+    incremental: str = Form("true"),
+    since_ref: str = Form("")
+):
+    """
+    압축 파일(zip/tar) 또는 서버 경로(REPO_SCAN_ROOT 하위)의 소스 전체를 병렬 정적분석.
+    결과는 JSONL로 스트리밍: start → file(파일별, 완료 순) → done
+
+    서버 경로 분석은 기본적으로 이전 결과(매니페스트)를 재사용해 바뀐 파일만 다시 분석하고,
+    since_ref를 주면 git diff 기준으로 바뀐 파일만 다시 분석한다.
+
+    동시에 도는 저장소 분석 수는 제한하며(클라이언트별로 돌아가며 자리 배정), 대기열이 가득 차면 429.
+    """
+    tempdir = None
+    manifest_path = None
+    if file is not None and file.filename:
+        tempdir = tempfile.mkdtemp(prefix="repo-scan-")
+        archive_path = os.path.join(tempdir, "upload")
+        root = os.path.join(tempdir, "src")
+        try:
+            if not await asyncio.to_thread(_save_upload, file, archive_path):
+                shutil.rmtree(tempdir, ignore_errors=True)
+                return JSONResponse(status_code=400, content={"error": "압축 파일 용량이 너무 큽니다."})
+            os.makedirs(root)
+            await asyncio.to_thread(extract_archive, archive_path, root)
+        except Exception as e:
+            shutil.rmtree(tempdir, ignore_errors=True)
+            return JSONResponse(status_code=400, content={"error": str(e)})
+    elif path:
+        root = _resolve_server_path(path)
+        if root is None:
+            return JSONResponse(status_code=400, content={"error": "허용되지 않는 경로입니다."})
+        if incremental.lower() in ["true", "1", "yes"] or since_ref:
+            manifest_path = _manifest_path(root)
+    else:
+        return JSONResponse(status_code=400, content={"error": "압축 파일 또는 경로가 필요합니다."})
+
+    try:
+        ticket = await admission.admit_stream("scan_repo", request)
+    except (AdmissionRejected, RequestCancelled) as e:
+        if tempdir:
+            shutil.rmtree(tempdir, ignore_errors=True)
+        if isinstance(e, AdmissionRejected):
+            return rejected_response(e)
+        return JSONResponse(status_code=499, content={"error": "클라이언트 연결이 끊겨 분석을 중단했습니다."})
+
+    logger.info(f"저장소 정적분석 시작 : {file.filename if tempdir else root}")
+
+    async def event_stream():
+        try:
+            async for event in scan_tree_events(root, manifest_path, since_ref or None):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"[저장소 분석 오류] {str(e)}")
+            yield json.dumps({"event": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+        finally:
+            if tempdir:
+                shutil.rmtree(tempdir, ignore_errors=True)
+
+    return StreamingResponse(ticket.hold(event_stream()), media_type="application/x-ndjson")
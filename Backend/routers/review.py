@@ -1,37 +1,53 @@
 import re
-from fastapi import APIRouter, UploadFile, File, Form
-from fastapi.responses import JSONResponse
-from config import client, logger, LANGUAGE_MAP, MAX_CHARS_PER_CHUNK
-from utils.chunk import smart_chunking
-from utils.common import build_chunk_prompt, extract_refactored_code
+import json
+import asyncio
+from fastapi import APIRouter, UploadFile, File, Form, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from config import client, logger, LANGUAGE_MAP, CHUNK_OVERLAP_LINES, SUMMARY_REDUCE_FANOUT, LLM_MAX_CONCURRENCY
+from utils.chunk import chunk_with_overlap
+from utils.tokens import chunk_token_budget, clip_to_tokens
+from utils.common import build_chunk_system_prompt, build_chunk_prompt, extract_refactored_code, drop_overlap
 from utils.security import allowed_file, file_size_okay
-from utils.sast import semgrep_scan_code
+from utils.sast import semgrep_scan_code, semgrep_scan_parts, format_findings_summary
 from utils.mask_utils import mask_all_sensitive_in_result
-from utils.split_utils import split_jsp, split_aspx, split_html
-from utils.gpt_sidekick import ask_sidekick
+from utils.split_utils import split_embedded, PART_LABELS
+from utils.gpt_sidekick import ask_sidekick_async, ask_sidekick_as_completed
+from utils.llm_scheduler import concurrency_slot
+from utils.cancellation import cancel_on_disconnect, raise_if_cancelled, RequestCancelled
+from utils.single_flight import single_flight, flight_key
+from utils.admission import admission, AdmissionRejected, rejected_response
 
 router = APIRouter()
 
 def format_review_output(raw_result: dict) -> str:
+    """
+    리뷰 결과를 텍스트로 정리. 스트리밍 도중의 부분 결과
+    (요약/리뷰 일부가 아직 없는 상태)도 그대로 넘겨도 된다.
+    """
     output = []
 
     # [정적 분석 결과]
     output.append("🔍 [정적 분석 결과]")
-    output.append(raw_result.get("sast_result", "").strip())
+    output.append((raw_result.get("sast_result") or "").strip())
 
     # [전체 요약]
     output.append("\n🧩 [전체 코드 요약]")
-    output.append(raw_result.get("summary", "").strip())
+    output.append((raw_result.get("summary") or "").strip())
 
     # [리뷰 섹션]
     output.append("\n🧠 [코드 리뷰]")
-    for review in raw_result.get("reviews", []):
-        index = review["chunk_index"] + 1
-        markdown = review.get("markdown", "").strip()
-        refactor = review.get("refactored_code", "").strip()
+    reviews = [r for r in raw_result.get("reviews") or [] if r]
+    for review in sorted(reviews, key=lambda r: r.get("chunk_index", 0)):
+        index = review.get("chunk_index", 0) + 1
+        markdown = (review.get("markdown") or "").strip()
+        refactor = (review.get("refactored_code") or "").strip()
 
         output.append(f"\n--- ⬛ Chunk {index} ⬛ ---")
 
+        if review.get("error"):
+            output.append(f"[리뷰 실패: {review['error']}]")
+            continue
+
         # 리뷰 분석 블록
         if "기능 설명:" in markdown or "개선이 필요한 부분:" in markdown:
             # 이미 구분돼 있는 경우
@@ -44,7 +60,7 @@ def format_review_output(raw_result: dict) -> str:
             output.append("\n리팩토링 코드:\n" + refactor)
 
     # 최종 통합 리팩토링 코드
-    final = raw_result.get("final_refactored", "").strip()
+    final = (raw_result.get("final_refactored") or "").strip()
     if final:
         output.append("\n✅ [최종 리팩토링 코드 통합]")
         output.append(final)
@@ -53,119 +69,248 @@ def format_review_output(raw_result: dict) -> str:
 
 
 
-@router.post("/review/")
-async def review_code(
-    file: UploadFile = File(...),
-    model: str = Form("gpt-3.5-turbo")
-):
+def run_sast(code: str, ext: str) -> str:
+    """
+    업로드 코드 1건에 대한 SAST(semgrep) 결과 텍스트를 만든다.
+    semgrep 배치 스케줄러에서 대기하므로 이벤트 루프 밖(스레드)에서 호출할 것.
+    """
+    # JSP/ASPX 분리 분석 분기 (언어별 코드를 semgrep 한 번으로 스캔, 라인은 원본 기준)
+    sast_result = ""
+    if ext in ["jsp", "aspx"]:
+        parts = list(split_embedded(code, ext).values())
+        # html은 비어 있어도 분석, 나머지는 코드가 있을 때만
+        targets = [part for part in parts if part.ext == "html" or part.code.strip()]
+        scanned = dict(zip((part.ext for part in targets), semgrep_scan_parts(targets)))
+
+        sections = []
+        for part in parts:
+            label = PART_LABELS[part.ext]
+            if part.ext in scanned:
+                sections.append(f"[{label} 분석]\n{format_findings_summary(scanned[part.ext])}")
+            else:
+                sections.append(f"[{label} 분석]\n[{label} 코드 없음]")
+        sast_result = "\n\n".join(sections)
+
+    elif ext in ["java", "js", "html", "py", "cs", "css"]:
+        sast_result = semgrep_scan_code(code, ext)
+    else:
+        sast_result = "[지원되지 않는 파일 유형이거나 SAST 분석 불가]"
+
+    return sast_result
+
+
+def build_summary_system_prompt(language: str) -> str:
+    """chunk 요약 요청이 공유하는 지시문 (user 메시지에는 코드만 보냄)"""
+    return f"사용자가 보내는 코드는 전체 {language} 코드의 일부야. 이 부분의 구조와 주요 기능을 간단히 요약해줘."
+
+
+def build_group_summary_system_prompt(language: str) -> str:
+    """요약 합치기 요청이 공유하는 지시문 (user 메시지에는 요약들만 보냄)"""
+    return (
+        f"사용자가 보내는 내용은 {language} 코드 파일의 연속된 구간들을 순서대로 요약한 것이야.\n"
+        "이 요약들을 하나로 합쳐서 이 구간 전체의 구조와 주요 기능을 간결하게 요약해줘.\n"
+        "중복은 빼고, 클래스/함수 이름과 역할 같은 핵심 정보는 남겨줘."
+    )
+
+
+def build_group_summary_prompt(summaries: list[str]) -> str:
+    return "\n\n".join(f"[요약 {idx}]\n{summary}" for idx, summary in enumerate(summaries, 1))
+
+
+async def reduce_summaries(summaries: list[str], language: str, model: str, fanout: int = SUMMARY_REDUCE_FANOUT) -> list[str]:
+    """
+    chunk 요약을 fanout 개씩 묶어 하나로 합치기를 반복해(트리 형태) fanout 개 이하로 줄인다.
+
+    - 요약은 모두 (chunk 토큰 예산 / fanout) 토큰 이내로 잘라서 넣으므로 어느 단계든 프롬프트 크기가 일정
+    - 묶음은 자식 묶음이 끝나는 즉시 합치기 시작 (같은 단계 전체를 기다리지 않음), 순차 단계는 O(log n)
+    - 합치기에 실패한 묶음은 입력 요약을 이어 붙여 다음 단계로 넘김
+
+    Returns:
+        list[str]: 파일 순서대로의 요약 (fanout 개 이하, 각각 예산 이내)
+    """
+    fanout = max(2, fanout)
+    item_budget = max(1, chunk_token_budget(model) // fanout)
+    semaphore = asyncio.Semaphore(max(1, LLM_MAX_CONCURRENCY))
+    system_prompt = build_group_summary_system_prompt(language)
+    tasks = []
+
+    async def _resolve(node):
+        return await node if isinstance(node, asyncio.Task) else node
+
+    async def _merge(children: list) -> str:
+        parts = [clip_to_tokens(part, item_budget, model) for part in await asyncio.gather(*map(_resolve, children))]
+        prompt = build_group_summary_prompt(parts)
+        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
+        async with concurrency_slot(semaphore, model, messages):
+            try:
+                return await ask_sidekick_async(prompt, model, 0.2, system_prompt, use_cache=True)
+            except Exception as e:
+                logger.error(f"[요약 합치기 실패] {len(parts)}개 묶음: {e}")
+                return "\n".join(parts)
+
+    nodes = [summary for summary in summaries if summary]
+    levels = 0
+    while len(nodes) > fanout:
+        nodes = [asyncio.create_task(_merge(nodes[i:i + fanout])) for i in range(0, len(nodes), fanout)]
+        tasks.extend(nodes)
+        levels += 1
+    if levels:
+        logger.info(f"▶ 요약 {len(summaries)}개를 {levels}단계로 합치는 중... 모델: {model}")
+
     try:
-        if not allowed_file(file.filename):
-            return JSONResponse(status_code=400, content={"error": "허용되지 않는 확장자입니다."})
+        return [clip_to_tokens(summary, item_budget, model) for summary in await asyncio.gather(*map(_resolve, nodes))]
+    finally:
+        for task in tasks:
+            task.cancel()
 
-        content = await file.read()
-        if not file_size_okay(content):
-            return JSONResponse(status_code=400, content={"error": "파일 용량이 너무 큽니다."})
-            
-        code = content.decode("utf-8")
-        ext = file.filename.split('.')[-1].lower()
-        language = LANGUAGE_MAP.get(ext, "Plain Text")
 
-        logger.info(f"정적분석 시작 : {file.filename}")
+async def _interleave(items, task: asyncio.Task):
+    """
+    비동기 제너레이터 items의 값을 (False, 값)으로 흘려보내면서,
+    task가 끝나면 그 즉시 (True, task 결과)를 한 번 끼워 넣는다.
+    items가 먼저 끝나면 task는 기다리지 않고 종료 (호출한 쪽에서 await).
+    """
+    next_item = asyncio.ensure_future(items.__anext__())
+    try:
+        while True:
+            waiting = {next_item, task} if task is not None else {next_item}
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            if task in done:
+                yield True, task.result()
+                task = None
+            if next_item in done:
+                try:
+                    value = next_item.result()
+                except StopAsyncIteration:
+                    return
+                yield False, value
+                next_item = asyncio.ensure_future(items.__anext__())
+    finally:
+        if not next_item.done():
+            next_item.cancel()
+            await asyncio.gather(next_item, return_exceptions=True)
+        await items.aclose()
 
-        # JSP/ASPX 분리 분석 분기
-        sast_result = ""
-        if ext == "jsp":
-            # html, java, js, css 분리
-            html_part, java_part, js_part, css_part = split_jsp(code)
-            sast_html = semgrep_scan_code(html_part, 'html')
-            sast_java = semgrep_scan_code(java_part, 'java') if java_part.strip() else "[Java 코드 없음]"
-            sast_js = semgrep_scan_code(js_part, 'js') if js_part.strip() else "[JS 코드 없음]"
-            sast_css = semgrep_scan_code(css_part, 'css') if css_part.strip() else "[CSS 코드 없음]"
-            sast_result = (
-                f"[HTML 분석]\n{sast_html}\n\n"
-                f"[Java 분석]\n{sast_java}\n\n"
-                f"[JS 분석]\n{sast_js}\n\n"
-                f"[CSS 분석]\n{sast_css}"
-            )
-
-        elif ext == "aspx":
-            # html, cs, js, css 분리
-            html_part, cs_part, js_part, css_part = split_aspx(code)
-            sast_html = semgrep_scan_code(html_part, 'html')
-            sast_cs = semgrep_scan_code(cs_part, 'cs') if cs_part.strip() else "[C# 코드 없음]"
-            sast_js = semgrep_scan_code(js_part, 'js') if js_part.strip() else "[JS 코드 없음]"
-            sast_css = semgrep_scan_code(css_part, 'css') if css_part.strip() else "[CSS 코드 없음]"
-            sast_result = (
-                f"[HTML 분석]\n{sast_html}\n\n"
-                f"[C# 분석]\n{sast_cs}\n\n"
-                f"[JS 분석]\n{sast_js}\n\n"
-                f"[CSS 분석]\n{sast_css}"
-            )
-        elif ext in ["java", "js", "html", "py", "cs", "css"]:
-            sast_result = semgrep_scan_code(code, ext)
-        elif ext == "html":
-            html_only, js_code, css_code = split_html(code)
-            sast_html = semgrep_scan_code(html_only, 'html')
-            sast_js = semgrep_scan_code(js_code, 'js') if js_code.strip() else "[JS 코드 없음]"
-            sast_css = semgrep_scan_code(css_code, 'css') if css_code.strip() else "[CSS 코드 없음]"
-            sast_result = (
-                f"[HTML 분석]\n{sast_html}\n\n"
-                f"[JS 분석]\n{sast_js}\n\n"
-                f"[CSS 분석]\n{sast_css}"
-            )
-        else:
-            sast_result = "[지원되지 않는 파일 유형이거나 SAST 분석 불가]"
 
-        #print(f"[정적분석(분리 결과)]\n{sast_result}")
-        
-        # 1. 코드 chunk 분할
-        chunks = smart_chunking(code, MAX_CHARS_PER_CHUNK, language)
+async def review_events(code: str, ext: str, model: str):
+    """
+    리뷰 파이프라인을 단계별 이벤트(dict)로 흘려보내는 비동기 제너레이터.
+    마지막 이벤트는 {"event": "done", "result": raw_result}.
+
+    정적분석(semgrep)은 chunk 요약과 동시에 진행하고, 둘은 전체 요약 단계에서 합류한다.
+    (chunk 요약은 정적분석 결과가 필요 없고, 전체 요약 프롬프트만 사용)
+
+    이벤트 순서:
+        chunks → chunk_summary(완료 순)와 sast_result → summary → chunk_review(완료 순) → done
+
+    cancel_on_disconnect() 안에서 실행하면 단계 사이마다 클라이언트 연결을 확인하고,
+    끊겼으면 RequestCancelled로 중단한다. (남은 LLM 호출 취소, semgrep 프로세스 종료)
+    """
+    language = LANGUAGE_MAP.get(ext, "Plain Text")
+
+    # 정적분석은 스레드에서 실행 (semgrep 배치 대기 중에도 다른 요청 처리 가능)
+    sast_task = asyncio.create_task(asyncio.to_thread(run_sast, code, ext))
+    try:
+        # 1. 코드 chunk 분할 (모델 토큰 예산 기준, 경계는 N줄 겹침)
+        chunked = chunk_with_overlap(code, model, language, CHUNK_OVERLAP_LINES)
+        chunks = [chunk for chunk, _ in chunked]
+        overlaps = [overlap for _, overlap in chunked]
         total = len(chunks)
-        
-        # 2. 각 chunk별 요약
-        chunk_summaries = []
-        
-        for idx, chunk in enumerate(chunks):
-            chunk_summary_prompt = f"""
-아래는 전체 {language} 코드의 일부야. 이 부분의 구조와 주요 기능을 간단히 요약해줘.
+        yield {"event": "chunks", "total": total}
 
-[코드 시작]
-{chunk}
-[코드 끝]
-"""
-            logger.info(f"▶ Chunk {idx+1}/{total} 요약 요청 중... 모델: {model}")
-            chunk_summary = ask_sidekick(chunk_summary_prompt, model, 0.2)
-            chunk_summaries.append(chunk_summary)
+        # 2. 각 chunk별 요약 (동시 요청, 결과는 chunk 순서 유지)
+        # 지시문은 system 메시지로 공유하고 user 메시지에는 코드만 넣음 (프롬프트 prefix 캐시)
+        chunk_summary_prompts = [f"[코드 시작]\n{chunk}\n[코드 끝]" for chunk in chunks]
+
+        logger.info(f"▶ Chunk {total}개 요약 요청 중... 모델: {model}")
+        # 바뀌지 않은 chunk는 캐시된 요약을 그대로 사용
+        # 재시도 후에도 실패한 chunk는 요약 없이 진행하고 이벤트에 error로 알림
+        chunk_summaries = [""] * total
+        sast_result = None
+        summaries = ask_sidekick_as_completed(
+            chunk_summary_prompts, model, 0.2, use_cache=True, return_exceptions=True,
+            system_prompt=build_summary_system_prompt(language)
+        )
+        async for is_sast, value in _interleave(summaries, sast_task):
+            if is_sast:
+                sast_result = value
+                yield {"event": "sast_result", "sast_result": sast_result}
+                continue
+
+            idx, chunk_summary = value
+            if isinstance(chunk_summary, Exception):
+                logger.error(f"[요약 실패] Chunk {idx+1}: {chunk_summary}")
+                yield {"event": "chunk_summary", "chunk_index": idx, "summary": "", "error": str(chunk_summary)}
+                continue
+            chunk_summaries[idx] = chunk_summary
+            yield {"event": "chunk_summary", "chunk_index": idx, "summary": chunk_summary}
 
-        # 3. chunk별 요약으로 전체 요약 생성
+        # 3. chunk 요약이 많으면 트리 형태로 합쳐서 줄임 (전체 요약 프롬프트 크기는 파일 크기와 무관)
+        raise_if_cancelled()
+        reduced_summaries = await reduce_summaries(chunk_summaries, language, model)
+
+        # 정적분석이 요약보다 늦으면 여기서 합류
+        raise_if_cancelled()
+        if sast_result is None:
+            sast_result = await sast_task
+            yield {"event": "sast_result", "sast_result": sast_result}
+
+        #print(f"[정적분석(분리 결과)]\n{sast_result}")
+
+        # 4. 합친 요약으로 전체 요약 생성 (정적분석 결과도 예산 절반 이내로 자름)
         total_summary_prompt = f"""
 아래는 대형 {language} 코드 파일을 여러 개 chunk로 나눠서 각 부분별로 요약한 내용이야.
 
 [정적분석(분리 결과)]
-{sast_result}
+{clip_to_tokens(sast_result, chunk_token_budget(model) // 2, model)}
 
 각 chunk별 요약을 바탕으로 전체 코드의 구조와 기능을 통합적으로 요약해줘.
 중복 없이 전체적인 흐름, 주요 역할, 핵심 구조 위주로 정리해줘.
 
-{chr(10).join(chunk_summaries)}
+{chr(10).join(reduced_summaries)}
 """
-        code_summary = ask_sidekick(total_summary_prompt, model, 0.2)
+        raise_if_cancelled()
+        try:
+            # 전체 요약은 chunk 리뷰의 system 메시지에 들어가므로 캐시해서, 같은 파일을 다시 리뷰하면
+            # 리뷰 요청의 캐시 키도 그대로 유지되게 함
+            code_summary = await ask_sidekick_async(total_summary_prompt, model, 0.2, use_cache=True)
+            yield {"event": "summary", "summary": code_summary}
+        except Exception as e:
+            # 전체 요약 없이도 chunk 리뷰는 진행
+            logger.error(f"[전체 요약 실패] {e}")
+            code_summary = ""
+            yield {"event": "summary", "summary": "", "error": str(e)}
 
-        # 4. chunk별 코드 리뷰/리팩터
-        chunk_reviews = []
-        for idx, chunk in enumerate(chunks):
-            prompt = build_chunk_prompt(chunk, ext, language, idx, total, code_summary)
-            logger.info(f"▶ Chunk {idx+1}/{total} 리뷰 요청 중... 모델: {model}")
-            
-            part_review = ask_sidekick(prompt, model, 0.2)
+        # 5. chunk별 코드 리뷰/리팩터 (동시 요청)
+        # 역할/리뷰 항목/전체 요약은 모든 chunk가 같은 system 메시지로 공유 (프롬프트 prefix 캐시)
+        review_system_prompt = build_chunk_system_prompt(language, ext, code_summary)
+        review_prompts = [
+            build_chunk_prompt(chunk, ext, idx, total, overlaps[idx])
+            for idx, chunk in enumerate(chunks)
+        ]
+        raise_if_cancelled()
+        logger.info(f"▶ Chunk {total}개 리뷰 요청 중... 모델: {model}")
 
-            chunk_reviews.append({
-                "chunk_index": idx,
-                "markdown": part_review,
-                "refactored_code": extract_refactored_code(part_review)
-            })
+        chunk_reviews = [None] * total
+        async for idx, part_review in ask_sidekick_as_completed(
+            review_prompts, model, 0.2, use_cache=True, return_exceptions=True,
+            system_prompt=review_system_prompt
+        ):
+            if isinstance(part_review, Exception):
+                logger.error(f"[리뷰 실패] Chunk {idx+1}: {part_review}")
+                chunk_reviews[idx] = {"chunk_index": idx, "markdown": "", "refactored_code": "", "error": str(part_review)}
+            else:
+                chunk_reviews[idx] = {
+                    "chunk_index": idx,
+                    "markdown": part_review,
+                    "refactored_code": extract_refactored_code(part_review)
+                }
+            yield {"event": "chunk_review", **chunk_reviews[idx]}
 
-        final_refactor = "\n".join([r["refactored_code"] for r in chunk_reviews if r["refactored_code"]])
+        # 각 chunk 앞의 겹침 줄은 앞 chunk 결과에 이미 있으므로 떼고 이어 붙임
+        final_refactor = "\n".join(filter(None, (
+            drop_overlap(r["refactored_code"], chunks[idx], overlaps[idx]) for idx, r in enumerate(chunk_reviews)
+        )))
 
         raw_result = {
             "sast_result": sast_result,
@@ -173,10 +318,109 @@ async def review_code(
             "reviews": chunk_reviews,
             "final_refactored": final_refactor
         }
+        yield {"event": "done", "result": raw_result}
+    finally:
+        # 중간에 끝나면(오류/연결 종료) 정적분석 결과를 기다리지 않음
+        sast_task.cancel()
+
+
+def review_flight_key(content: bytes, ext: str, model: str) -> tuple:
+    """/review/와 /review/stream은 같은 이벤트를 쓰므로 같은 키로 합친다"""
+    return flight_key("review", content, ext, model)
+
+
+def _encode_event(event: dict, stream_format: str) -> str:
+    data = json.dumps(event, ensure_ascii=False)
+    if stream_format == "sse":
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+@router.post("/review/")
+async def review_code(
+    request: Request,
+    file: UploadFile = File(...),
+    model: str = Form("gpt-3.5-turbo")
+):
+    try:
+        if not allowed_file(file.filename):
+            return JSONResponse(status_code=400, content={"error": "허용되지 않는 확장자입니다."})
+
+        content = await file.read()
+        if not file_size_okay(content):
+            return JSONResponse(status_code=400, content={"error": "파일 용량이 너무 큽니다."})
+            
+        code = content.decode("utf-8")
+        ext = file.filename.split('.')[-1].lower()
+
+        logger.info(f"정적분석 시작 : {file.filename}")
+
+        # 같은 파일/모델로 동시에 들어온 리뷰(스트리밍 포함)는 파이프라인 하나를 함께 기다림 (합류는 자리 없이)
+        key = review_flight_key(content, ext, model)
+        raw_result = None
+        async with cancel_on_disconnect(request, "review"):
+            async with admission.slot("review", request, bypass=single_flight.in_flight(key)):
+                async for event in single_flight.stream(key, lambda: review_events(code, ext, model)):
+                    if event["event"] == "done":
+                        raw_result = event["result"]
         
         return raw_result
         #return mask_all_sensitive_in_result(raw_result)
 
+    except AdmissionRejected as e:
+        return rejected_response(e)
+    except RequestCancelled:
+        logger.info(f"[연결 종료] 리뷰 중단 : {file.filename}")
+        return JSONResponse(status_code=499, content={"error": "클라이언트 연결이 끊겨 리뷰를 중단했습니다."})
     except Exception as e:
         logger.error(f"[에러 발생] {str(e)}")
         return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+@router.post("/review/stream")
+async def review_code_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    model: str = Form("gpt-3.5-turbo"),
+    stream_format: str = Form("ndjson")
+):
+    """
+    /review/ 의 스트리밍 버전. 단계별 결과를 끝나는 즉시 전송한다.
+    stream_format: "ndjson" (한 줄에 JSON 이벤트 하나) 또는 "sse"
+    같은 파일/모델의 리뷰가 이미 진행 중이면 그때까지의 이벤트부터 이어서 받는다.
+    """
+    if not allowed_file(file.filename):
+        return JSONResponse(status_code=400, content={"error": "허용되지 않는 확장자입니다."})
+
+    content = await file.read()
+    if not file_size_okay(content):
+        return JSONResponse(status_code=400, content={"error": "파일 용량이 너무 큽니다."})
+
+    code = content.decode("utf-8")
+    ext = file.filename.split('.')[-1].lower()
+    stream_format = stream_format.lower()
+
+    key = review_flight_key(content, ext, model)
+    try:
+        ticket = await admission.admit_stream("review", request, bypass=single_flight.in_flight(key))
+    except AdmissionRejected as e:
+        return rejected_response(e)
+    except RequestCancelled:
+        return JSONResponse(status_code=499, content={"error": "클라이언트 연결이 끊겨 리뷰를 중단했습니다."})
+
+    logger.info(f"정적분석 시작(스트리밍) : {file.filename}")
+
+    async def event_stream():
+        try:
+            async with cancel_on_disconnect(request, "review_stream"):
+                async for event in single_flight.stream(key, lambda: review_events(code, ext, model)):
+                    yield _encode_event(event, stream_format)
+        except RequestCancelled:
+            logger.info(f"[연결 종료] 리뷰 스트리밍 중단 : {file.filename}")
+        except Exception as e:
+            logger.error(f"[에러 발생] {str(e)}")
+            yield _encode_event({"event": "error", "error": str(e)}, stream_format)
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    body = event_stream()
+    return StreamingResponse(ticket.hold(body) if ticket else body, media_type=media_type)
@@ -1,12 +1,54 @@
-from fastapi import APIRouter, UploadFile, File, Form
-from utils.sast import semgrep_scan_code_detail_with_gpt
+import asyncio
+from fastapi import APIRouter, UploadFile, File, Form, Request
+from fastapi.responses import JSONResponse
+from utils.sast import semgrep_scan_json, semgrep_scan_parts, format_findings_detail_with_gpt_async
 from utils.security import allowed_file, file_size_okay
-from utils.split_utils import split_jsp, split_aspx, split_html
+from utils.split_utils import split_embedded, PART_LABELS
+from utils.cancellation import cancel_on_disconnect, RequestCancelled
+from utils.single_flight import single_flight, flight_key
+from utils.admission import admission, AdmissionRejected, rejected_response
 
 router = APIRouter()
 
+def scan_sast_detail(code: str, ext: str):
+    """
+    업로드 코드 1건을 (JSP/ASPX는 분리해서) semgrep으로 분석한다.
+    semgrep 배치 스케줄러에서 대기하므로 이벤트 루프 밖(스레드)에서 호출할 것.
+
+    Returns:
+        list | None: [(언어, semgrep JSON)], 지원하지 않는 확장자면 None
+    """
+    if ext in ["jsp", "aspx"]:
+        # 언어별 코드를 semgrep 한 번으로 스캔 (CSS는 제외, 라인은 원본 파일 기준)
+        parts = [
+            part for part in split_embedded(code, ext).values()
+            if part.ext != "css" and part.code.strip()
+        ]
+        return [(PART_LABELS[part.ext], findings) for part, findings in zip(parts, semgrep_scan_parts(parts))]
+
+    if ext in ["java", "js", "py", "cs", "css"]:
+        return [(ext, semgrep_scan_json(code, ext))]
+
+    return None
+
+
+async def run_sast_detail(code: str, ext: str, use_gpt: bool, gpt_model: str):
+    """
+    업로드 코드 1건 상세 분석. semgrep은 스레드에서, GPT 피드백은 비동기로 한꺼번에 요청한다.
+
+    Returns:
+        list | None: 언어별 결과 목록, 지원하지 않는 확장자면 None
+    """
+    scanned = await asyncio.to_thread(scan_sast_detail, code, ext)
+    if scanned is None:
+        return None
+
+    details = await format_findings_detail_with_gpt_async([findings for _, findings in scanned], use_gpt, gpt_model)
+    return [{"language": language, **detail} for (language, _), detail in zip(scanned, details)]
+
 @router.post("/sast/")
 async def analyze_code_with_sast_gpt(
+    request: Request,
     file: UploadFile = File(...),
     use_gpt_feedback: str = Form("false"),
     gpt_model: str = Form("gpt-3.5-turbo")
@@ -23,49 +65,21 @@ async def analyze_code_with_sast_gpt(
         ext = file.filename.split('.')[-1].lower()
 
         use_gpt = use_gpt_feedback.lower() in ["true", "1", "yes"]
-        results = []
-
-        if ext == "jsp":
-            html_part, java_part, js_part, css_part = split_jsp(code)
-
-            if html_part.strip():
-                r = semgrep_scan_code_detail_with_gpt(html_part, "html", use_gpt, gpt_model)
-                results.append({"language": "HTML", **r})
-            if java_part.strip():
-                r = semgrep_scan_code_detail_with_gpt(java_part, "java", use_gpt, gpt_model)
-                results.append({"language": "Java", **r})
-            if js_part.strip():
-                r = semgrep_scan_code_detail_with_gpt(js_part, "js", use_gpt, gpt_model)
-                results.append({"language": "JS", **r})
-            #if css_part.strip():
-                #r = semgrep_scan_code_detail_with_gpt(css_part, "css", use_gpt, gpt_model)
-                #results.append({"language": "CSS", **r})
-
-        elif ext == "aspx":
-            html_part, cs_part, js_part, css_part = split_aspx(code)
-
-            if html_part.strip():
-                r = semgrep_scan_code_detail_with_gpt(html_part, "html", use_gpt, gpt_model)
-                results.append({"language": "HTML", **r})
-            if cs_part.strip():
-                r = semgrep_scan_code_detail_with_gpt(cs_part, "cs", use_gpt, gpt_model)
-                results.append({"language": "C#", **r})
-            if js_part.strip():
-                r = semgrep_scan_code_detail_with_gpt(js_part, "js", use_gpt, gpt_model)
-                results.append({"language": "JS", **r})
-            #if css_part.strip():
-                #r = semgrep_scan_code_detail_with_gpt(css_part, "css", use_gpt, gpt_model)
-                #results.append({"language": "CSS", **r})
-
-        elif ext in ["java", "js", "py", "cs", "css"]:
-            r = semgrep_scan_code_detail_with_gpt(code, ext, use_gpt, gpt_model)
-            results.append({"language": ext, **r})
-
-        else:
+        # 같은 파일/옵션으로 동시에 들어온 요청은 분석 하나를 함께 기다림
+        # 연결이 끊기면 semgrep 프로세스와 남은 GPT 피드백 요청을 중단 (함께 기다리는 요청이 없을 때)
+        key = flight_key("sast", content, ext, gpt_model, use_gpt=use_gpt)
+        async with cancel_on_disconnect(request, "sast"):
+            async with admission.slot("sast", request, bypass=single_flight.in_flight(key)):
+                results = await single_flight.do(key, lambda: run_sast_detail(code, ext, use_gpt, gpt_model))
+        if results is None:
             return {"error": "[지원되지 않는 파일 유형이거나 SAST 분석 불가]"}
 
         return {"sast_result": results}
 
+    except AdmissionRejected as e:
+        return rejected_response(e)
+    except RequestCancelled:
+        return JSONResponse(status_code=499, content={"error": "[클라이언트 연결 종료]"})
     except Exception as e:
         return {
             "error": "[서버 처리 오류]",
@@ -0,0 +1,244 @@
+import os
+import math
+import time
+import asyncio
+import weakref
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse
+from config import logger
+from utils.metrics import metrics
+from utils.cancellation import cancel_on_disconnect
+
+# 엔드포인트별 "동시 실행 수:대기열 길이". 예) ADMISSION_LIMITS="review=2:8,scan_repo=1:2" (동시 실행 수 0이면 제한 없음)
+ADMISSION_LIMITS = os.getenv("ADMISSION_LIMITS", "")
+_DEFAULT_LIMITS = {
+    "review": (4, 16),
+    "sast": (8, 32),
+    "gpt_format": (8, 32),
+    "format": (8, 64),
+    "scan_repo": (2, 4),
+}
+# 클라이언트별로 돌아가며 자리를 주고, 한 클라이언트가 대기열의 일정 비율 이상을 차지하지 못하게 함
+ADMISSION_FAIR = os.getenv("ADMISSION_FAIR", "true").lower() in ["true", "1", "yes"]
+ADMISSION_CLIENT_QUEUE_RATIO = float(os.getenv("ADMISSION_CLIENT_QUEUE_RATIO", "0.5"))
+# 클라이언트 구분 헤더 (없으면 접속 IP)
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "X-Client-Id")
+# 처리 시간을 아직 관측하지 못했을 때 Retry-After 계산에 쓰는 값(초)
+ADMISSION_DEFAULT_SERVICE_SECONDS = float(os.getenv("ADMISSION_DEFAULT_SERVICE_SECONDS", "10"))
+# 처리 시간 이동 평균에서 새 관측값의 비중
+_SERVICE_TIME_ALPHA = 0.2
+
+
+def _parse_limits(spec: str) -> dict:
+    limits = dict(_DEFAULT_LIMITS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        running, _, queued = value.partition(":")
+        limits[name.strip()] = (int(running), int(queued or 0))
+    return limits
+
+
+class AdmissionRejected(Exception):
+    """대기열이 가득 차서 요청을 받지 않음 (429)"""
+
+    def __init__(self, endpoint: str, retry_after: int, reason: str):
+        super().__init__(f"요청이 많아 처리할 수 없습니다. {retry_after}초 후 다시 시도하세요.")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def rejected_response(e: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"error": str(e), "retry_after": e.retry_after},
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+class AdmissionGate:
+    """
+    엔드포인트 하나의 동시 실행 수 제한 + 길이 제한이 있는 대기열.
+
+    - 자리가 없으면 대기열에서 기다리고, 대기열도 가득 차면 바로 AdmissionRejected
+    - Retry-After는 관측한 처리 시간(이동 평균)으로 대기열이 한 자리 빌 때까지의 시간을 추정
+    - fair=True면 대기열을 클라이언트별로 나눠 돌아가며 자리를 주므로 한 클라이언트의 요청 폭주가
+      다른 클라이언트를 굶기지 않는다
+    이벤트 루프 안에서만 사용한다.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, fair: bool = ADMISSION_FAIR):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.fair = fair
+        self.client_max_queue = max(1, math.ceil(max_queue * ADMISSION_CLIENT_QUEUE_RATIO))
+        self.running = 0
+        self.queued = 0
+        self._queues: OrderedDict[str, deque] = OrderedDict()
+        self.service_time = None
+
+    def retry_after(self) -> int:
+        service = self.service_time or ADMISSION_DEFAULT_SERVICE_SECONDS
+        return max(1, math.ceil(service * (self.queued + 1) / max(1, self.limit)))
+
+    def _reject(self, reason: str):
+        metrics.inc("admission_rejected", endpoint=self.name, reason=reason)
+        retry_after = self.retry_after()
+        logger.warning(f"[요청 거절] {self.name}: {reason} (실행 {self.running}, 대기 {self.queued}, Retry-After {retry_after}s)")
+        raise AdmissionRejected(self.name, retry_after, reason)
+
+    async def acquire(self, client: str):
+        if self.limit <= 0 or (self.running < self.limit and not self.queued):
+            self.running += 1
+            return
+
+        key = client if self.fair else ""
+        queue = self._queues.get(key)
+        if self.queued >= self.max_queue:
+            self._reject("queue_full")
+        if self.fair and queue is not None and len(queue) >= self.client_max_queue:
+            self._reject("client_queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append(waiter)
+        self.queued += 1
+        metrics.inc("admission_queued", endpoint=self.name)
+        started = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 자리를 넘겨받은 직후 취소됨 → 다음 대기자에게 넘김
+                self._hand_over()
+            else:
+                self._remove(key, waiter)
+            raise
+        metrics.inc("admission_wait_seconds", time.monotonic() - started, endpoint=self.name)
+
+    def release(self, service_time: float):
+        if self.service_time is None:
+            self.service_time = service_time
+        else:
+            self.service_time += _SERVICE_TIME_ALPHA * (service_time - self.service_time)
+        self._hand_over()
+
+    def _remove(self, key: str, waiter: asyncio.Future):
+        queue = self._queues.get(key)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self.queued -= 1
+            if not queue:
+                del self._queues[key]
+
+    def _hand_over(self):
+        """끝난 요청의 자리를 다음 대기자에게 (fair면 클라이언트를 돌아가며, 아니면 도착 순)"""
+        while self._queues:
+            key, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self.queued -= 1
+            if not queue:
+                del self._queues[key]
+            else:
+                self._queues.move_to_end(key)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.running -= 1
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queued": self.queued,
+            "queued_by_client": {key: len(queue) for key, queue in self._queues.items()} if self.fair else {},
+            "service_time": round(self.service_time, 3) if self.service_time is not None else None,
+            "retry_after": self.retry_after(),
+        }
+
+
+class AdmissionTicket:
+    """받은 자리 하나. release()는 여러 번 불러도 한 번만 반영"""
+
+    def __init__(self, gate: AdmissionGate):
+        self.gate = gate
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.gate.release(time.monotonic() - self.started)
+
+    def hold(self, body):
+        """
+        스트리밍 응답 본문이 끝날 때까지 자리를 잡아 둔다.
+        본문을 읽기 전에 연결이 끊겨 제너레이터가 시작되지 않아도, 버려질 때 자리를 돌려준다.
+        """
+        async def _body():
+            try:
+                async for piece in body:
+                    yield piece
+            finally:
+                try:
+                    await body.aclose()
+                finally:
+                    self.release()
+
+        wrapped = _body()
+        weakref.finalize(wrapped, self.release)
+        return wrapped
+
+
+class Admission:
+    def __init__(self, limits: dict):
+        self.gates = {name: AdmissionGate(name, running, queued) for name, (running, queued) in limits.items()}
+
+    @staticmethod
+    def client_id(request) -> str:
+        client = request.headers.get(ADMISSION_CLIENT_HEADER)
+        if client:
+            return client
+        return request.client.host if request.client else ""
+
+    async def admit(self, endpoint: str, request) -> AdmissionTicket:
+        """자리를 얻을 때까지 기다린다. 대기열이 가득 차면 AdmissionRejected"""
+        gate = self.gates[endpoint]
+        await gate.acquire(self.client_id(request))
+        return AdmissionTicket(gate)
+
+    async def admit_stream(self, endpoint: str, request, bypass: bool = False):
+        """
+        스트리밍 응답용: 응답을 시작하기 전에 자리를 얻는다 (대기열이 가득 차면 바로 429를 줄 수 있도록).
+        기다리는 동안 연결이 끊기면 RequestCancelled. 본문은 ticket.hold(body)로 감싸서 보낸다.
+
+        Returns:
+            AdmissionTicket | None: bypass=True면 None
+        """
+        if bypass:
+            return None
+        async with cancel_on_disconnect(request, endpoint):
+            return await self.admit(endpoint, request)
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str, request, bypass: bool = False):
+        """
+        블록을 실행하는 동안 자리를 잡아 둔다.
+        bypass=True(진행 중인 같은 요청에 합류하는 경우 등)면 자리 없이 바로 실행.
+        """
+        if bypass:
+            yield
+            return
+        ticket = await self.admit(endpoint, request)
+        try:
+            yield
+        finally:
+            ticket.release()
+
+    def stats(self) -> dict:
+        return {name: gate.stats() for name, gate in self.gates.items()}
+
+
+admission = Admission(_parse_limits(ADMISSION_LIMITS))
@@ -0,0 +1,195 @@
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class LRUCache:
+    """
+    스레드 안전한 인메모리 LRU 캐시.
+    항목 수(max_items)와 전체 크기(max_bytes, 0이면 무제한)를 넘으면 오래된 것부터 제거.
+    ttl(초, 0이면 무제한)이 지난 항목은 조회 시 만료 처리.
+    """
+
+    def __init__(self, max_items: int = 256, max_bytes: int = 0, ttl: float = 0):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            value, size, stored_at = self._data[key]
+            if self.ttl and time.time() - stored_at > self.ttl:
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size: int = 0):
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._data.pop(key)[1]
+            self._data[key] = (value, size, time.time())
+            self._bytes += size
+            while self._data and (
+                len(self._data) > self.max_items
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                _, (_, old_size, _) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def delete_if(self, predicate):
+        """predicate(key)가 True인 항목 제거"""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                self._bytes -= self._data.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "items": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteLRUCache:
+    """
+    SQLite 파일 기반 문자열 캐시. 마지막 사용 시각 기준 LRU로,
+    저장된 값의 전체 크기가 max_bytes를 넘으면 오래된 것부터 제거.
+
+    tag/version 컬럼으로 특정 그룹(예: 언어)의 이전 버전 항목만 골라 지울 수 있다.
+
+    조회할 때마다 커밋하지 않도록 마지막 사용 시각은 메모리에 모아 두었다가
+    일정 개수/시간마다(또는 저장/제거 전에) 한 번에 기록하고,
+    전체 크기는 처음 한 번만 합계를 구한 뒤 저장/삭제할 때마다 갱신한다.
+    """
+
+    # 마지막 사용 시각을 이 개수만큼 모이거나 이 시간(초)이 지나면 한 번에 기록
+    ACCESS_FLUSH_ITEMS = 64
+    ACCESS_FLUSH_SECONDS = 30.0
+
+    def __init__(self, db_path: str, table: str, max_bytes: int):
+        self.db_path = db_path
+        self.table = table
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._touched = {}  # key -> 아직 기록하지 않은 마지막 사용 시각
+        self._flushed_at = time.monotonic()
+        self._total = None  # 저장된 값의 전체 크기 (None이면 다음 저장 때 다시 계산)
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, tag TEXT, version TEXT, value TEXT, "
+                "size INTEGER, last_access REAL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_access ON {table}(last_access)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_tag ON {table}(tag, version)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str):
+        with self._lock, self._connect() as conn:
+            row = conn.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._touched[key] = time.time()
+            if (
+                len(self._touched) >= self.ACCESS_FLUSH_ITEMS
+                or time.monotonic() - self._flushed_at >= self.ACCESS_FLUSH_SECONDS
+            ):
+                self._flush_access(conn)
+            return row[0]
+
+    def set(self, key: str, value: str, tag: str = "", version: str = ""):
+        size = len(value.encode("utf-8"))
+        with self._lock, self._connect() as conn:
+            if self._total is None:
+                self._total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            old = conn.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, tag, version, value, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tag, version, value, size, time.time())
+            )
+            self._touched.pop(key, None)
+            self._total += size - (old[0] if old else 0)
+            self._evict(conn)
+
+    def _flush_access(self, conn):
+        if self._touched:
+            conn.executemany(
+                f"UPDATE {self.table} SET last_access = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._touched.items()]
+            )
+            self._touched.clear()
+        self._flushed_at = time.monotonic()
+
+    def _evict(self, conn):
+        if self._total <= self.max_bytes:
+            return
+        # 최근 조회 기록을 반영한 뒤 오래된 것부터 제거
+        self._flush_access(conn)
+        rows = conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access").fetchall()
+        expired = []
+        for key, size in rows:
+            if self._total <= self.max_bytes:
+                break
+            expired.append((key,))
+            self._total -= size
+        conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", expired)
+
+    def purge_stale(self, tag: str, version: str) -> int:
+        """tag 그룹에서 version이 다른(오래된) 항목 제거"""
+        with self._lock, self._connect() as conn:
+            cur = conn.execute(
+                f"DELETE FROM {self.table} WHERE tag = ? AND version != ?", (tag, version)
+            )
+            if cur.rowcount:
+                self._total = None
+            return cur.rowcount
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table}")
+            self._touched.clear()
+            self._total = 0
+
+    def __len__(self):
+        with self._lock, self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
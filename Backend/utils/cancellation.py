@@ -0,0 +1,160 @@
+import os
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from utils.metrics import metrics
+
+# 클라이언트 연결 종료를 확인하는 주기(초)
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+
+
+class RequestCancelled(Exception):
+    """클라이언트 연결이 끊겨 요청 처리를 중단"""
+
+
+class CancelToken:
+    """
+    요청 하나의 취소 신호. 이벤트 루프와 스레드(semgrep 대기 등) 양쪽에서 확인할 수 있다.
+    cancel() 하면 등록된 콜백(실행 중인 semgrep 프로세스 종료 등)을 한 번씩 호출한다.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback):
+        """취소되면 callback() 호출 (이미 취소됐으면 바로 호출)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise RequestCancelled("클라이언트 연결 종료")
+
+
+# 현재 요청의 취소 토큰 (asyncio task와 asyncio.to_thread 스레드로 함께 전달됨)
+_current_token: ContextVar = ContextVar("cancel_token", default=None)
+
+
+def current_cancel_token():
+    return _current_token.get()
+
+
+@contextmanager
+def use_cancel_token(token: CancelToken):
+    """블록 안에서 current_cancel_token()이 token이 되도록 설정 (요청과 분리해서 돌리는 공유 작업용)"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def cancelled_by_client() -> bool:
+    """현재 요청이 클라이언트 연결 종료로 취소됐는지"""
+    token = _current_token.get()
+    return token is not None and token.cancelled
+
+
+def raise_if_cancelled():
+    """파이프라인 단계 사이에서 호출: 연결이 끊겼으면 RequestCancelled"""
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def record_cancelled_llm_call(model: str, tokens: int, stage: str):
+    """
+    연결 종료로 취소된 LLM 호출을 집계 (연결 종료가 아닌 취소, 예: hedge 패자는 제외).
+    stage: waiting(동시 호출 자리 대기) / queued(스케줄러 대기) / in_flight(응답 대기 중)
+    tokens: 보내지 않아 아낀 토큰 추정치 (in_flight는 이미 보냈으므로 0)
+
+    스트리밍 응답은 서버가 연결 종료를 먼저 알고 task를 취소해서 토큰 취소보다 호출 취소가 먼저 올 수 있으므로,
+    토큰이 취소될 때(이미 취소됐으면 바로) 집계한다. 요청이 정상으로 끝나면 집계되지 않는다.
+    """
+    token = _current_token.get()
+    if token is None:
+        return
+
+    def _count():
+        metrics.inc("cancelled_llm_calls", model=model, stage=stage)
+        if tokens:
+            metrics.inc("cancelled_llm_tokens", tokens, model=model, stage=stage)
+
+    token.add_callback(_count)
+
+
+@asynccontextmanager
+async def cancel_on_disconnect(request, endpoint: str, poll_interval: float = DISCONNECT_POLL_INTERVAL):
+    """
+    블록 안의 작업을 클라이언트 연결이 끊기면 취소한다.
+
+    - request.is_disconnected()를 주기적으로 확인하고, 끊기면 토큰을 취소한 뒤 블록을 실행 중인 task를 cancel
+      (대기 중인 LLM 호출은 CancelledError로 정리되고, semgrep 프로세스는 토큰 콜백으로 종료)
+    - 블록이 취소로 끝나면(스트리밍 응답이 닫힌 경우 포함) 토큰도 취소해서 스레드 쪽 작업을 멈춤
+    - 연결 종료로 취소된 경우 RequestCancelled로 바꿔 올림
+
+    Yields:
+        CancelToken: 이 요청의 취소 토큰 (블록 안에서는 current_cancel_token()으로도 얻을 수 있음)
+    """
+    token = CancelToken()
+    reset = _current_token.set(token)
+    owner = asyncio.current_task()
+    disconnected = False
+
+    async def _watch():
+        nonlocal disconnected
+        while True:
+            await asyncio.sleep(poll_interval)
+            if await request.is_disconnected():
+                disconnected = True
+                token.cancel()
+                owner.cancel()
+                return
+
+    watcher = asyncio.create_task(_watch())
+    try:
+        yield token
+    except asyncio.CancelledError:
+        token.cancel()
+        metrics.inc("cancelled_requests", endpoint=endpoint)
+        if not disconnected:
+            raise
+        # 감시 task가 건 취소만 풀고 호출한 쪽에는 연결 종료로 알림
+        owner.uncancel()
+        raise RequestCancelled("클라이언트 연결 종료")
+    except (GeneratorExit, RequestCancelled):
+        # 스트리밍 응답이 중간에 닫힘 / 단계 사이 확인에서 연결 종료 발견
+        token.cancel()
+        metrics.inc("cancelled_requests", endpoint=endpoint)
+        raise
+    finally:
+        watcher.cancel()
+        try:
+            _current_token.reset(reset)
+        except ValueError:
+            # 스트리밍 제너레이터가 다른 context에서 정리되는 경우
+            pass
@@ -1,50 +1,116 @@
-import re
+from utils.tokens import estimate_tokens, chunk_token_budget
+from utils.structure_scan import split_units
 
-def smart_chunking(code: str, chunk_size: int, language: str = "Plain Text") -> list[str]:
-    lang_patterns = {
-        "Python": r'(\n(?:def|class)\s+\w+.*?:)',
-        "Java": r'(\n\s*(public|private|protected)?\s*(static)?\s*(class|interface|void|\w+)\s+\w+\s*\([^)]*\)\s*\{)',
-        "C#": r'(\n\s*(public|private|protected)?\s*(static)?\s*(class|interface|void|\w+)\s+\w+\s*\([^)]*\)\s*\{)',
-        "JavaScript": r'(\n\s*(function|class)\s+\w+\s*\([^)]*\)\s*\{)',
-        "TypeScript": r'(\n\s*(function|class)\s+\w+\s*\([^)]*\)\s*\{)',
-        "C++": r'(\n\s*(class|void|\w+)\s+\w+\s*\([^)]*\)\s*\{)',
-    }
-    
-    pattern = lang_patterns.get(language, r'\n')
-    parts = re.split(pattern, code)
+
+def _pack(units: list[str], sizes: list[int], limit: int) -> list[str]:
+    """단위들을 순서대로 limit 이하 크기의 chunk로 묶는다. (선형 시간)"""
     chunks = []
-    buffer = ""
-    i = 0
-    
-    while i < len(parts):
-        part = parts[i] or ""
-        if i + 1 < len(parts):
-            part += parts[i + 1] or ""
-            i += 2
-        else:
-            i += 1
+    buffer = []
+    buffer_size = 0
+    for unit, size in zip(units, sizes):
+        if buffer and buffer_size + size >= limit:
+            chunks.append("".join(buffer))
+            buffer = []
+            buffer_size = 0
+        buffer.append(unit)
+        buffer_size += size
+    if buffer:
+        chunks.append("".join(buffer))
+    return chunks
 
-        if len(buffer) + len(part) < chunk_size:
-            buffer += part
-        else:
-            if buffer:
-                chunks.append(buffer)
-            buffer = part
 
-    if buffer:
-        chunks.append(buffer)
+def smart_chunking(code: str, chunk_size: int, language: str = "Plain Text") -> list[str]:
+    units = split_units(code, language)
+    return _pack(units, [len(u) for u in units], chunk_size)
+
+
+def _budget_units(code: str, model: str, language: str, budget: int):
+    """최상위 선언 단위와 토큰 수. 예산보다 큰 단위는 줄 단위로 다시 나눔"""
+    units, sizes = [], []
+    for unit in split_units(code, language):
+        size = estimate_tokens(unit, model)
+        if size <= budget:
+            units.append(unit)
+            sizes.append(size)
+            continue
+        for line in unit.splitlines(keepends=True):
+            units.append(line)
+            sizes.append(estimate_tokens(line, model))
+    return units, sizes
+
+
+def chunk_with_overlap(
+    code: str,
+    model: str,
+    language: str = "Plain Text",
+    overlap_lines: int = 0,
+    budget: int = None
+) -> list[tuple[str, int]]:
+    """
+    token_budget_chunking()과 같지만 chunk마다 앞에 붙은 겹침 줄 수를 함께 돌려준다.
+    겹침 줄도 예산에 포함해서 묶으며, 겹침 때문에 예산을 넘게 되는 chunk는 겹침 없이 시작한다.
+
+    Returns:
+        list[tuple[str, int]]: (chunk, 앞 chunk에서 가져온 겹침 줄 수)
+    """
+    budget = budget or chunk_token_budget(model)
+    units, sizes = _budget_units(code, model, language, budget)
+    if overlap_lines <= 0:
+        return [(chunk, 0) for chunk in _pack(units, sizes, budget)]
+
+    chunks = []
+    buffer, buffer_size = [], 0
+    head = 0          # buffer 앞의 겹침 줄 수
+    own_start = 0     # buffer에서 이 chunk 자신의 단위가 시작하는 위치
+    for unit, size in zip(units, sizes):
+        if len(buffer) > own_start and buffer_size + size >= budget:
+            chunks.append(("".join(buffer), head))
+            tail_lines = "".join(buffer[own_start:]).splitlines(keepends=True)[-overlap_lines:]
+            tail = "".join(tail_lines)
+            if not tail.endswith("\n"):
+                tail += "\n"
+            tail_size = estimate_tokens(tail, model)
+            if tail_size + size >= budget:
+                buffer, buffer_size, head = [], 0, 0
+            else:
+                buffer, buffer_size, head = [tail], tail_size, len(tail_lines)
+            own_start = len(buffer)
+        buffer.append(unit)
+        buffer_size += size
+    if len(buffer) > own_start:
+        chunks.append(("".join(buffer), head))
     return chunks
 
+
+def token_budget_chunking(
+    code: str,
+    model: str,
+    language: str = "Plain Text",
+    overlap_lines: int = 0,
+    budget: int = None
+) -> list[str]:
+    """
+    모델별 토큰 예산(chunk_token_budget)에 맞춰 코드를 나눈다.
+
+    - 최상위 선언(함수/클래스/필드) 단위를 최대한 유지하고, 예산보다 큰 단위만 줄 단위로 다시 나눔
+    - overlap_lines > 0 이면 앞 chunk의 마지막 N줄을 다음 chunk 앞에 붙여 경계 맥락 보존 (겹침도 예산에 포함)
+    """
+    return [chunk for chunk, _ in chunk_with_overlap(code, model, language, overlap_lines, budget)]
+
+
 def smart_chunking_html(code: str, chunk_size: int) -> list[str]:
     parts = code.split('\n')
     chunks = []
-    buffer = ""
+    buffer = []
+    buffer_size = 0
     for line in parts:
-        if len(buffer) + len(line) < chunk_size:
-            buffer += line + "\n"
+        if buffer_size + len(line) < chunk_size:
+            buffer.append(line + "\n")
+            buffer_size += len(line) + 1
         else:
-            chunks.append(buffer)
-            buffer = line + "\n"
+            chunks.append("".join(buffer))
+            buffer = [line + "\n"]
+            buffer_size = len(line) + 1
     if buffer:
-        chunks.append(buffer)
-    return chunks
\ No newline at end of file
+        chunks.append("".join(buffer))
+    return chunks
@@ -14,19 +14,28 @@ def count_indent_level(text: str, indent_char: str = "\t") -> int:
 def convert_2space_to_tab_only_at_line_start(line: str) -> str:
     return re.sub(r"^(  )+", lambda m: "\t" * (len(m.group(0)) // 2), line)
 
-def build_chunk_prompt(code_chunk: str, ext: str, language: str, idx: int, total: int, summary: str):
+def build_chunk_system_prompt(language: str, ext: str, summary: str) -> str:
+    """
+    파일의 모든 chunk 리뷰 요청이 공유하는 앞부분 (역할, 리뷰 항목, 전체 요약).
+    chunk마다 달라지는 내용(번호, 코드)은 build_chunk_prompt()의 user 메시지로 보내서
+    같은 파일의 요청끼리 provider의 프롬프트 prefix 캐시를 공유하게 한다.
+    """
     return f"""
-너는 숙련된 {language} 코드 리뷰어야. 아래는 전체 코드 파일의 {idx+1}/{total}번째 조각이야.
-
-전체 코드 요약:
-{summary}
-
-이 조각의 코드를 리뷰해줘:
+너는 숙련된 {language} 코드 리뷰어야. 사용자가 전체 코드 파일의 조각 하나를 보내면 그 조각의 코드를 리뷰해줘:
 1. 기능 설명
 2. 개선이 필요한 부분 (특히 보안적으로 문제가 있는지 점검)
 3. 주요 변경 요약 (중요한 수정 또는 위험 요소에 주석 포함)
-4. 리팩토링 코드
+4. 리팩토링 코드 (```{ext} 코드 블록)
+
+전체 코드 요약:
+{summary}
+"""
 
+def build_chunk_prompt(code_chunk: str, ext: str, idx: int, total: int, overlap: int = 0):
+    context = f"\n처음 {overlap}줄은 앞 조각과 겹치는 맥락이니, 리팩토링 코드에는 그 다음 줄부터 넣어줘.\n" if overlap else ""
+    return f"""
+아래는 전체 코드 파일의 {idx+1}/{total}번째 조각이야.
+{context}
 ```{ext}
 {code_chunk}
 ```
@@ -34,4 +43,64 @@ def build_chunk_prompt(code_chunk: str, ext: str, language: str, idx: int, total
 
 def extract_refactored_code(text: str) -> str:
     matches = re.findall(r"```[a-zA-Z]*\n([\s\S]*?)\n```", text)
-    return matches[-1].strip() if matches else ""
\ No newline at end of file
+    return matches[-1].strip() if matches else ""
+
+def drop_overlap(refactored: str, chunk: str, overlap: int) -> str:
+    """
+    chunk 앞의 겹침 줄(앞 chunk와 같은 줄)이 리팩토링 코드 앞에 그대로 들어 있으면 떼어 낸다.
+    (최종 통합 코드에서 겹친 줄이 두 번 나오지 않도록)
+    """
+    if not overlap or not refactored:
+        return refactored
+    context = [line.strip() for line in chunk.splitlines()[:overlap] if line.strip()]
+    lines = refactored.splitlines()
+    idx = 0
+    for expected in context:
+        while idx < len(lines) and not lines[idx].strip():
+            idx += 1
+        if idx >= len(lines) or lines[idx].strip() != expected:
+            break
+        idx += 1
+    return "\n".join(lines[idx:]).strip("\n")
+
+class StreamingCodeExtractor:
+    """
+    스트리밍으로 들어오는 GPT 응답 조각을 받아 완성된 코드 줄만 돌려준다.
+    extract_code_from_markdown() + 줄 단위 탭 변환의 스트리밍 버전.
+
+    - 응답이 ``` 코드 블록으로 시작하면 블록 안쪽 줄만, 아니면 모든 줄을 코드로 본다.
+    - 각 줄은 convert_2space_to_tab_only_at_line_start() 적용 후 반환.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._state = "start"  # start → code → done
+        self._fenced = False
+
+    def _handle_line(self, line: str) -> list[str]:
+        if self._state == "done":
+            return []
+        if self._state == "start":
+            if not line.strip():
+                return []
+            self._state = "code"
+            if re.match(r"^```[a-zA-Z]*\s*$", line.strip()):
+                self._fenced = True
+                return []
+            self._fenced = False
+        if self._fenced and line.strip() == "```":
+            self._state = "done"
+            return []
+        return [convert_2space_to_tab_only_at_line_start(line)]
+
+    def feed(self, text: str) -> list[str]:
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        result = []
+        for line in lines:
+            result.extend(self._handle_line(line))
+        return result
+
+    def finish(self) -> list[str]:
+        rest, self._buffer = self._buffer, ""
+        return self._handle_line(rest) if rest else []
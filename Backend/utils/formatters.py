@@ -1,46 +1,983 @@
-def format_sql_extended(code: str, get_indent, comma: str) -> str:
-    lines = code.splitlines()
-    formatted = []
-    for line in lines:
-        line = line.strip()
-        if not line:
+"""
+로컬 코드 정렬 엔진 (토크나이저 기반, LLM 없이 결정적으로 들여쓰기만 다시 계산).
+
+- 중괄호 언어(Java/JS/TS/C#/C/C++/CSS): 문자열/주석/정규식/텍스트 블록을 건너뛰며 괄호 깊이로 들여쓰기
+- SQL: 절(SELECT, FROM, JOIN ...) 단위 줄바꿈, 콤마는 줄 앞(또는 뒤)
+- HTML/JSP: 태그 깊이로 들여쓰기, <script>/<style>/스크립틀릿 안쪽은 중괄호 엔진, <pre>/<textarea>는 그대로
+- Python: tokenize의 INDENT/DEDENT로 블록 깊이를 구해 들여쓰기 단위만 바꿈 (괄호 안 이어지는 줄은 상대 위치 유지)
+
+확신할 수 없는 구간(괄호 짝이 안 맞음, 닫히지 않은 문자열/주석, JSX, 프로시저 SQL 등)은
+formatted=None 으로 돌려주고 호출한 쪽(/gpt_format/은 LLM, /format/은 원본 유지)에서 처리한다.
+"""
+import io
+import re
+import tokenize
+from bisect import bisect_right
+from utils.structure_scan import brace_boundaries
+
+
+class FormatSpan:
+    """원본 코드의 연속 구간과 정렬 결과. formatted가 None이면 로컬 엔진이 확신하지 못한 구간"""
+
+    __slots__ = ("original", "formatted")
+
+    def __init__(self, original: str, formatted):
+        self.original = original
+        self.formatted = formatted
+
+
+# 언어 키(확장자 또는 /gpt_format/ language 값) → (엔진, 세부 문법)
+LOCAL_FORMAT_LANGUAGES = {
+    "java": ("brace", "java"),
+    "js": ("brace", "js"), "javascript": ("brace", "js"),
+    "ts": ("brace", "js"), "typescript": ("brace", "js"),
+    "cs": ("brace", "cs"), "c#": ("brace", "cs"), "csharp": ("brace", "cs"),
+    "c": ("brace", "c"), "cpp": ("brace", "c"), "c++": ("brace", "c"),
+    "css": ("brace", "css"),
+    "sql": ("sql", None),
+    "html": ("markup", "html"), "htm": ("markup", "html"), "jsp": ("markup", "jsp"),
+    "py": ("python", None), "python": ("python", None),
+}
+
+
+def local_format(code: str, language: str, indent: str = "\t", brace: str = "same-line", comma: str = "leading"):
+    """
+    code를 로컬 엔진으로 정렬.
+
+    Parameters:
+        language: 확장자 또는 언어 이름 (LOCAL_FORMAT_LANGUAGES 키)
+        indent: 들여쓰기 한 단계 문자열 (기본 탭)
+        brace: "same-line" 또는 "next-line" (중괄호 언어에서 여는 중괄호 위치)
+        comma: "leading" 또는 "trailing" (SQL 목록 콤마 위치)
+
+    Returns:
+        list[FormatSpan] | None: 원본 순서대로의 구간 목록 (이어 붙이면 전체 결과), 지원하지 않는 언어면 None
+    """
+    engine, flavor = LOCAL_FORMAT_LANGUAGES.get(language.lower(), (None, None))
+    code = code.replace("\r\n", "\n")
+    if engine == "brace":
+        return _brace_spans(code, flavor, indent, brace)
+    if engine == "sql":
+        return _sql_spans(code, indent, comma)
+    if engine == "markup":
+        return _markup_spans(code, flavor, indent)
+    if engine == "python":
+        return _python_spans(code, indent)
+    return None
+
+
+def indent_levels(code: str, language: str):
+    """
+    원본 코드의 줄마다 들여쓰기 깊이(탭 수)를 구조(괄호/태그 깊이)로 계산.
+    LLM으로 나눠 보내는 chunk의 시작 깊이를 미리 정할 때 사용 (확신하지 못한 구간도 최선의 추정값).
+
+    Returns:
+        list[int] | None: 줄 번호별 깊이, 줄 구조가 바뀌는 SQL이나 지원하지 않는 언어면 None
+    """
+    engine, flavor = LOCAL_FORMAT_LANGUAGES.get(language.lower(), (None, None))
+    code = code.replace("\r\n", "\n")
+    if engine == "brace":
+        rendered = _BraceScan(code, flavor).render("\t", "same-line")
+    elif engine == "markup":
+        rendered = _MarkupScan(code, flavor, "\t").render()
+    elif engine == "python":
+        rendered = _python_render(code, "\t") or code.split("\n")
+    else:
+        return None
+    return [len(line) - len(line.lstrip("\t")) for line in rendered]
+
+
+def join_spans(spans: list[FormatSpan]) -> str:
+    """구간 결과를 이어 붙임. 확신하지 못한 구간은 원본 그대로"""
+    return "\n".join(span.original if span.formatted is None else span.formatted for span in spans)
+
+
+# ---------------------------------------------------------------------------
+# 중괄호 언어
+
+_BRACE_EXCLUDED = {
+    "java": "\"'{}()\\[\\]\n/",
+    "js": "\"'`{}()\\[\\]\n/",
+    "cs": "\"'{}()\\[\\]\n/@$",
+    "c": "\"'{}()\\[\\]\n/",
+    "css": "\"'{}()\\[\\]\n/",
+}
+
+
+def _brace_token_pattern(flavor: str):
+    alts = [r"(?P<nl>\n)"]
+    if flavor != "css":
+        alts.append(r"(?P<line_comment>//[^\n]*)")
+    alts.append(r"(?P<block_comment>/\*[\s\S]*?(?:\*/|\Z))")
+    if flavor in ("java", "cs"):
+        alts.append(r'(?P<multiline>"""[\s\S]*?(?:"""|\Z))')
+    if flavor == "cs":
+        alts.append(r'(?P<verbatim>\$?@\$?"(?:[^"]|"")*(?:"|\Z))')
+    if flavor == "js":
+        alts.append(r"(?P<multiline_js>`(?:\\[\s\S]|[^`\\])*(?:`|\Z))")
+    alts += [
+        r'(?P<string>"(?:\\.|[^"\\\n])*"?)',
+        r"(?P<char>'(?:\\.|[^'\\\n])*'?)",
+        r"(?P<open>[{(\[])",
+        r"(?P<close>[})\]])",
+        r"(?P<run>[^" + _BRACE_EXCLUDED[flavor] + r"]+)",
+        r"(?P<other>[\s\S])",
+    ]
+    return re.compile("|".join(alts))
+
+
+_BRACE_PATTERNS = {flavor: _brace_token_pattern(flavor) for flavor in _BRACE_EXCLUDED}
+_JS_REGEX = re.compile(r"/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[A-Za-z]*")
+_JS_REGEX_AFTER_WORDS = {"return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void", "throw", "yield", "await"}
+_SWITCH_OR_SEMI = re.compile(r"\bswitch\b|;")
+_SWITCH_LABEL = re.compile(r"(?:case\b|default\s*(?::|->))")
+_TRAILING_WORD = re.compile(r"[\w$]+$")
+_CLOSERS = {")": "(", "]": "[", "}": "{"}
+# 줄 앞에 오면 이전 줄에서 이어지는 식 (메서드 체인, 연산자로 시작)
+_LEADING_CONTINUATION = (".", "&&", "||", "?", ":", "+", "-", "=", "|", "^", "%")
+_NOT_CONTINUATION = ("...", "++", "--", "::")
+# 이전 줄이 이 문자로 끝나면 다음 줄은 이어지는 식
+_TRAILING_CONTINUATION = set("=+-*/%&|^<>?.!~")
+
+
+class _BraceScan:
+    """
+    중괄호 언어 코드를 한 번 훑어 줄마다 들여쓰기 단계와 종류를 계산.
+
+    - 같은 줄에서 연 괄호 여러 개는 한 단계로 봄 (foo(bar(function() { → +1)
+    - 줄 맨 앞의 닫는 괄호는 먼저 닫고 단계를 계산 (} else {, }));)
+    - switch 안에서 case/default 다음 줄은 한 단계 더
+    - 세미콜론 언어(Java/C#/C)에서 문장이 안 끝났으면 다음 줄은 이어지는 줄(+1)
+    - 블록 주석 안쪽 줄은 주석 시작 줄 기준으로 이동, 여러 줄 문자열 안쪽 줄은 그대로(verbatim)
+    """
+
+    def __init__(self, code: str, flavor: str):
+        self.flavor = flavor
+        self.lines = code.split("\n")
+        count = len(self.lines)
+        self.levels = [0] * count
+        self.kinds = ["code"] * count  # code | comment | verbatim | preproc
+        self.comment_ws = [""] * count
+        self.brace_levels = {}  # 여는 중괄호로 끝나는 줄 → 그 블록 헤더의 단계 (next-line 스타일용)
+        self.lexical_errors = set()  # 그 줄만 불확실
+        self.structural_errors = set()  # 그 줄 이후 전체가 불확실
+        self._scan(code)
+
+    def _level(self, cont: int = 0, label: bool = False) -> int:
+        stack = self.stack
+        level = len({entry[1] for entry in stack}) + cont
+        for idx, entry in enumerate(stack):
+            if entry[2] and entry[3]:  # case 라벨이 나온 switch 블록
+                if idx == len(stack) - 1:
+                    level += 0 if label else 1
+                elif not stack[idx + 1][4]:
+                    level += 1
+        return level
+
+    def _begin_line(self, first: str, comment: bool = False):
+        """줄의 첫 번째 (닫는 괄호가 아닌) 토큰에서 들여쓰기 단계 결정"""
+        self.started = True
+        line = self.line
+        stripped = self.lines[line].lstrip()
+        stack = self.stack
+        top_is_switch = bool(stack) and stack[-1][2]
+        label = top_is_switch and not comment and bool(_SWITCH_LABEL.match(stripped))
+        if label:
+            stack[-1][3] = True
+        self.line_is_label = label
+        self.line_annotation = (
+            (stripped.startswith("@") and not stripped.startswith("@interface"))
+            or (self.flavor == "cs" and stripped.startswith("[") and stripped.rstrip().endswith("]"))
+        )
+
+        if self.flavor in ("c", "cs") and stripped.startswith("#"):
+            self.kinds[line] = "preproc"
+            self.levels[line] = 0 if self.flavor == "c" else self._level()
+            if stripped.rstrip().endswith("\\"):
+                self.lexical_errors.add(line)
+            return
+
+        if self.flavor == "js" and stripped.startswith("<"):
+            # JSX/제네릭으로 시작하는 줄은 태그 계층을 알 수 없음
+            self.lexical_errors.add(line)
+
+        cont = 0
+        in_block = not stack or stack[-1][0] == "{"
+        if in_block and not comment and not label and not self.leading_close and first != "{":
+            prev = self.prev_last
+            if stripped.startswith(_LEADING_CONTINUATION) and not stripped.startswith(_NOT_CONTINUATION):
+                cont = 1
+            elif prev in ("", ";", "{", "}", ",", ":"):
+                cont = 0
+            elif prev in _TRAILING_CONTINUATION:
+                cont = 1
+            elif self.flavor in ("java", "cs", "c") and not self.prev_annotation and (prev.isalnum() or prev in ")]\"'_$"):
+                cont = 1
+        self.levels[line] = self._level(cont, label or self.popped_label)
+
+    def _close(self, char: str):
+        stack = self.stack
+        opener = _CLOSERS[char]
+        if stack and stack[-1][0] == opener:
+            entry = stack.pop()
+        elif any(entry[0] == opener for entry in stack):
+            self.structural_errors.add(self.line)
+            while stack[-1][0] != opener:
+                stack.pop()
+            entry = stack.pop()
+        else:
+            self.structural_errors.add(self.line)
+            return
+        if not self.started and entry[4]:
+            self.popped_label = True
+
+    def _multiline(self, text: str, kind: str):
+        """여러 줄에 걸친 토큰: 안쪽 줄을 kind(comment/verbatim)로 표시"""
+        newlines = text.count("\n")
+        if not newlines:
+            return
+        start = self.line
+        level = self.levels[start] if kind == "comment" else 0
+        base_ws = self.lines[start][:len(self.lines[start]) - len(self.lines[start].lstrip())]
+        for line in range(start + 1, start + newlines + 1):
+            self.kinds[line] = kind
+            self.levels[line] = level
+            self.comment_ws[line] = base_ws
+        self._end_line()
+        self.line = start + newlines
+        self.started = True
+
+    def _end_line(self):
+        if self.line_last and self.kinds[self.line] != "preproc":
+            self.prev_last = self.line_last
+            self.prev_annotation = self.line_annotation
+        if self.brace_candidate:
+            self.brace_levels[self.line] = self._level() - 1
+        if not self.started and self.leading_close:
+            self.levels[self.line] = self._level(0, self.popped_label)
+        self.started = False
+        self.leading_close = False
+        self.popped_label = False
+        self.line_is_label = False
+        self.line_annotation = False
+        self.line_last = ""
+        self.brace_candidate = False
+
+    def _scan(self, code: str):
+        self.stack = []  # [여는 괄호, 연 줄, switch 블록 여부, case 라벨 나옴, 라벨 줄에서 열림]
+        self.line = 0
+        self.prev_last = ""
+        self.prev_annotation = False
+        self.started = False
+        self.leading_close = False
+        self.popped_label = False
+        self.line_is_label = False
+        self.line_annotation = False
+        self.line_last = ""
+        self.brace_candidate = False
+        switch_pending = False
+        last_sig, last_word = "", ""
+        flavor = self.flavor
+        pattern = _BRACE_PATTERNS[flavor]
+        pos, end = 0, len(code)
+
+        while pos < end:
+            if code[pos] == "/" and flavor == "js" and code[pos + 1:pos + 2] not in ("/", "*") and (
+                last_sig == "" or last_sig in "(,=:[!&|?{};+-*%<>~^" or last_word in _JS_REGEX_AFTER_WORDS
+            ):
+                match = _JS_REGEX.match(code, pos)
+                if match:
+                    if not self.started:
+                        self._begin_line("/")
+                    self.brace_candidate = False
+                    self.line_last = last_sig = "/"
+                    last_word = ""
+                    pos = match.end()
+                    continue
+
+            match = pattern.match(code, pos)
+            kind, text = match.lastgroup, match.group()
+            pos = match.end()
+
+            if kind == "nl":
+                self._end_line()
+                self.line += 1
+                continue
+
+            if kind == "run":
+                stripped = text.strip()
+                if not stripped:
+                    continue
+                if not self.started:
+                    self._begin_line(stripped[0])
+                if switch_pending or "switch" in text:
+                    for found in _SWITCH_OR_SEMI.finditer(text):
+                        switch_pending = found.group() == "switch"
+                self.brace_candidate = False
+                self.line_last = last_sig = stripped[-1]
+                if flavor == "js":
+                    word = _TRAILING_WORD.search(stripped)
+                    last_word = word.group() if word else ""
+                continue
+
+            if kind == "close":
+                if self.started:
+                    self.brace_candidate = False
+                else:
+                    self.leading_close = True
+                self._close(text)
+                if text == "}":
+                    switch_pending = False
+                self.line_last = last_sig = text
+                last_word = ""
+                continue
+
+            if kind in ("line_comment", "block_comment"):
+                if not self.started:
+                    self._begin_line(text[0], comment=True)
+                if kind == "block_comment":
+                    if len(text) < 4 or not text.endswith("*/"):
+                        self.lexical_errors.add(self.line)
+                    self._multiline(text, "comment")
+                continue
+
+            if not self.started:
+                self._begin_line(text[0])
+            self.brace_candidate = False
+            last_word = ""
+
+            if kind == "open":
+                self.stack.append([text, self.line, text == "{" and switch_pending, False, self.line_is_label])
+                if text == "{":
+                    switch_pending = False
+                    self.brace_candidate = True
+                self.line_last = last_sig = text
+            elif kind in ("string", "char"):
+                if len(text) < 2 or text[-1] != text[0] or text.endswith("\\" + text[0]) and not text.endswith("\\\\" + text[0]):
+                    self.lexical_errors.add(self.line)
+                self.line_last = last_sig = text[0]
+            elif kind in ("multiline", "multiline_js", "verbatim"):
+                closing = {"multiline": '"""', "multiline_js": "`", "verbatim": '"'}[kind]
+                if len(text) < 2 * len(closing) or not text.endswith(closing):
+                    self.lexical_errors.add(self.line)
+                self._multiline(text, "verbatim")
+                self.line_last = last_sig = closing[-1]
+            else:
+                self.line_last = last_sig = text
+
+        self._end_line()
+        if self.stack:
+            self.structural_errors.add(min(entry[1] for entry in self.stack))
+
+    def render(self, indent: str, brace: str) -> list[str]:
+        out = []
+        for idx, text in enumerate(self.lines):
+            kind = self.kinds[idx]
+            if kind == "verbatim":
+                out.append(text)
+                continue
+            stripped = text.strip()
+            if not stripped:
+                out.append("")
+                continue
+            prefix = indent * self.levels[idx]
+            if kind == "comment":
+                base_ws = self.comment_ws[idx]
+                body = text[len(base_ws):] if text.startswith(base_ws) else (
+                    " " + stripped if stripped.startswith("*") else stripped
+                )
+                out.append(prefix + body.rstrip())
+            elif kind == "preproc" and self.flavor == "c":
+                out.append(stripped)
+            elif brace == "next-line" and idx in self.brace_levels and stripped != "{":
+                out.append(prefix + stripped[:-1].rstrip())
+                out.append(indent * self.brace_levels[idx] + "{")
+            else:
+                out.append(prefix + stripped)
+        return out
+
+
+def _line_starts(code: str) -> list[int]:
+    starts = [0]
+    pos = code.find("\n")
+    while pos >= 0:
+        starts.append(pos + 1)
+        pos = code.find("\n", pos + 1)
+    return starts
+
+
+def _brace_spans(code: str, flavor: str, indent: str, brace: str) -> list[FormatSpan]:
+    scan = _BraceScan(code, flavor)
+    lines = scan.lines
+    count = len(lines)
+
+    # 선언 단위(클래스 멤버, 최상위 함수 등)를 구간으로 삼아 불확실한 단위만 골라냄
+    starts = _line_starts(code)
+    region_starts = sorted({0} | {bisect_right(starts, pos) - 1 for pos in brace_boundaries(code)})
+    region_ends = region_starts[1:] + [count]
+    regions = list(zip(region_starts, region_ends))
+
+    def region_of(line: int) -> int:
+        return bisect_right(region_starts, line) - 1
+
+    uncertain = set(region_of(line) for line in scan.lexical_errors)
+    if scan.structural_errors:
+        # 괄호 짝이 틀어진 뒤로는 깊이를 믿을 수 없음
+        uncertain.update(range(region_of(min(scan.structural_errors)), len(regions)))
+
+    if brace == "next-line":
+        # 줄이 늘어나므로 구간별로 따로 렌더링
+        return _merge_spans([
+            (lines[a:b], None if idx in uncertain else _render_range(scan, a, b, indent, brace))
+            for idx, (a, b) in enumerate(regions)
+        ])
+    rendered = scan.render(indent, brace)
+    return _merge_spans([
+        (lines[a:b], None if idx in uncertain else rendered[a:b])
+        for idx, (a, b) in enumerate(regions)
+    ])
+
+
+def _render_range(scan: _BraceScan, start: int, end: int, indent: str, brace: str) -> list[str]:
+    lines, levels, kinds, comment_ws, brace_levels = scan.lines, scan.levels, scan.kinds, scan.comment_ws, scan.brace_levels
+    scan.lines, scan.levels, scan.kinds, scan.comment_ws = lines[start:end], levels[start:end], kinds[start:end], comment_ws[start:end]
+    scan.brace_levels = {line - start: level for line, level in brace_levels.items() if start <= line < end}
+    try:
+        return scan.render(indent, brace)
+    finally:
+        scan.lines, scan.levels, scan.kinds, scan.comment_ws, scan.brace_levels = lines, levels, kinds, comment_ws, brace_levels
+
+
+def _merge_spans(parts: list[tuple]) -> list[FormatSpan]:
+    """(원본 줄 목록, 결과 줄 목록 | None) 목록에서 상태가 같은 이웃 구간을 합침"""
+    spans = []
+    for original, formatted in parts:
+        if spans and (spans[-1][1] is None) == (formatted is None):
+            spans[-1][0].extend(original)
+            if formatted is not None:
+                spans[-1][1].extend(formatted)
+        else:
+            spans.append((list(original), None if formatted is None else list(formatted)))
+    return [
+        FormatSpan("\n".join(original), None if formatted is None else "\n".join(formatted))
+        for original, formatted in spans
+    ]
+
+
+# ---------------------------------------------------------------------------
+# SQL
+
+_SQL_TOKEN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<line_comment>--[^\n]*)
+  | (?P<block_comment>/\*[\s\S]*?(?:\*/|\Z))
+  | (?P<string>[Nn]?'(?:[^']|'')*(?:'|\Z))
+  | (?P<quoted>"(?:[^"]|"")*(?:"|\Z)|`[^`]*(?:`|\Z)|\[[^\]\n]*\])
+  | (?P<word>[A-Za-z_@#$][\w@#$]*)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)
+  | (?P<open>\()
+  | (?P<close>\))
+  | (?P<comma>,)
+  | (?P<semi>;)
+  | (?P<op>[^\s\w'"`\[(),;]+|.)
+""", re.X)
+
+_SQL_STATEMENT_STARTS = {"SELECT", "WITH", "INSERT", "UPDATE", "DELETE"}
+# 프로시저/제어 구문이 있으면 절 단위 배치를 확신할 수 없음
+_SQL_PROCEDURAL = {"BEGIN", "DECLARE", "PROCEDURE", "FUNCTION", "TRIGGER", "CURSOR", "LOOP", "WHILE", "EXEC", "EXECUTE", "GO"}
+# 여러 단어 키워드 (긴 것부터)
+_SQL_MULTI_WORD = [
+    ("LEFT", "OUTER", "JOIN"), ("RIGHT", "OUTER", "JOIN"), ("FULL", "OUTER", "JOIN"),
+    ("GROUP", "BY"), ("ORDER", "BY"), ("UNION", "ALL"), ("INSERT", "INTO"), ("DELETE", "FROM"),
+    ("INNER", "JOIN"), ("LEFT", "JOIN"), ("RIGHT", "JOIN"), ("FULL", "JOIN"), ("CROSS", "JOIN"),
+]
+_SQL_CLAUSES = {
+    "SELECT", "FROM", "WHERE", "GROUP BY", "ORDER BY", "HAVING", "LIMIT", "OFFSET", "FETCH",
+    "UNION", "UNION ALL", "INTERSECT", "EXCEPT", "MINUS", "INSERT", "INSERT INTO", "VALUES",
+    "UPDATE", "SET", "DELETE", "DELETE FROM", "WITH", "RETURNING",
+    "JOIN", "INNER JOIN", "LEFT JOIN", "RIGHT JOIN", "FULL JOIN", "CROSS JOIN",
+    "LEFT OUTER JOIN", "RIGHT OUTER JOIN", "FULL OUTER JOIN",
+}
+_SQL_LIST_CLAUSES = {"SELECT", "GROUP BY", "ORDER BY", "SET", "VALUES", "WITH"}
+_SQL_CONDITION_CLAUSES = {"WHERE", "ON", "HAVING"}
+
+
+def _sql_tokens(code: str):
+    """(종류, 텍스트, 앞에 공백 여부, 앞 공백의 줄바꿈 수) 목록과 각 토큰의 (시작, 끝) 위치"""
+    tokens, bounds = [], []
+    space, newlines = False, 0
+    for match in _SQL_TOKEN.finditer(code):
+        kind, text = match.lastgroup, match.group()
+        if kind == "ws":
+            space, newlines = True, text.count("\n")
             continue
-        upper = line.upper()
-        if upper.startswith(("SELECT", "FROM", "WHERE", "JOIN", "ON", "AND", "OR", "GROUP BY", "ORDER BY")):
-            formatted.append("\n" + line)
-        elif comma == "leading" and line.startswith(","):
-            formatted.append("\n" + line)
-        elif comma == "trailing" and line.endswith(","):
-            formatted.append(line)
+        tokens.append((kind, text, space, newlines))
+        bounds.append(match.span())
+        space, newlines = False, 0
+    return tokens, bounds
+
+
+def _sql_keyword(tokens: list, idx: int):
+    """idx에서 시작하는 (여러 단어) 키워드와 단어 수"""
+    words = []
+    for kind, text, _, _ in tokens[idx:idx + 3]:
+        if kind != "word":
+            break
+        words.append(text.upper())
+    for combo in _SQL_MULTI_WORD:
+        if tuple(words[:len(combo)]) == combo:
+            return " ".join(combo), len(combo)
+    return (words[0], 1) if words else (None, 0)
+
+
+def _format_sql_statement(tokens: list, indent: str, comma: str):
+    """문장 하나(토큰 목록)를 절 단위로 배치. 확신할 수 없으면 None"""
+    words = [text.upper() for kind, text, _, _ in tokens if kind == "word"]
+    if not words or words[0] not in _SQL_STATEMENT_STARTS or _SQL_PROCEDURAL.intersection(words):
+        return None
+    for kind, text, _, _ in tokens:
+        if kind in ("string", "quoted", "block_comment") and (
+            len(text) < 2 or (kind == "block_comment" and not text.endswith("*/"))
+            or (kind == "string" and not text.endswith("'")) or (kind == "quoted" and text[-1] not in "\"`]")
+        ):
+            return None
+
+    lines = []  # [단계, 텍스트]
+    base = 0  # 현재 (서브쿼리) 절 키워드의 단계
+    inline_depth = 0  # 현재 서브쿼리 안에서 열린 일반 괄호 수
+    case_depth = 0
+    clause = None
+    between = False
+    stack = []  # 괄호: (서브쿼리 여부, 여는 줄 단계, 바깥 base, 바깥 inline_depth, 바깥 clause)
+    force_newline = False
+
+    def newline(level: int):
+        if lines and not lines[-1][1]:
+            lines[-1][0] = level
+        else:
+            lines.append([level, ""])
+
+    def emit(text: str, space: bool):
+        if not lines:
+            lines.append([base, ""])
+        line = lines[-1]
+        line[1] += (" " if space and line[1] else "") + text
+
+    idx = 0
+    while idx < len(tokens):
+        kind, text, space, _ = tokens[idx]
+        top_level = inline_depth == 0 and case_depth == 0
+        if force_newline:
+            newline(base + 1 if clause else base)
+            force_newline = False
+
+        if kind == "word":
+            keyword, size = _sql_keyword(tokens, idx)
+            upper = text.upper()
+            if top_level and keyword in _SQL_CLAUSES and not (keyword == "FROM" and clause in ("DELETE",)):
+                newline(base)
+                emit(" ".join(tok[1] for tok in tokens[idx:idx + size]), space)
+                clause = keyword
+                idx += size
+                continue
+            if top_level and upper == "ON":
+                newline(base + 1)
+                emit(text, space)
+                clause = "ON"
+                idx += 1
+                continue
+            if top_level and upper in ("AND", "OR") and clause in _SQL_CONDITION_CLAUSES:
+                if between and upper == "AND":
+                    between = False
+                else:
+                    newline(base + 1)
+                emit(text, space)
+                idx += 1
+                continue
+            if upper == "BETWEEN":
+                between = True
+            elif upper == "CASE":
+                case_depth += 1
+            elif upper == "END" and case_depth:
+                case_depth -= 1
+            emit(text, space)
+        elif kind == "open":
+            next_keyword = next((tok[1].upper() for tok in tokens[idx + 1:] if tok[0] != "line_comment"), "")
+            level = lines[-1][0] if lines else base
+            subquery = next_keyword in ("SELECT", "WITH")
+            stack.append((subquery, level, base, inline_depth, clause))
+            emit(text, space)
+            if subquery:
+                base, inline_depth, clause = level + 1, 0, None
+            else:
+                inline_depth += 1
+        elif kind == "close":
+            if not stack:
+                return None
+            subquery, level, base, inline_depth, clause = stack.pop()
+            if subquery:
+                newline(level)
+                emit(text, False)
+            else:
+                emit(text, space)
+        elif kind == "comma" and top_level and clause in _SQL_LIST_CLAUSES:
+            if comma == "trailing":
+                emit(text, False)
+                newline(base + 1)
+            else:
+                newline(base + 1)
+                emit(text, False)
+        elif kind == "line_comment":
+            emit(text, space)
+            force_newline = True
         else:
-            formatted.append(get_indent() + line)
-    return "\n".join(formatted)
-
-def format_block_style_extended(code: str, get_indent, brace: str) -> str:
-    lines = code.splitlines()
-    formatted = []
-    level = 0
-    for line in lines:
-        stripped = line.strip()
-        if not stripped:
+            emit(text, space and kind != "semi")
+        idx += 1
+
+    if stack or case_depth:
+        return None
+    return "\n".join(indent * level + text for level, text in lines if text)
+
+
+def _sql_spans(code: str, indent: str, comma: str) -> list[FormatSpan]:
+    """최상위 ; 로 문장을 나눠 문장마다 정렬 (문장 = 구간)"""
+    tokens, bounds = _sql_tokens(code)
+    spans = []
+    start = 0
+    depth = 0
+
+    def flush(end: int):
+        if start >= end:
+            return
+        statement = tokens[start:end]
+        formatted = _format_sql_statement(statement, indent, comma)
+        # 문장 사이 빈 줄은 유지
+        if spans and statement[0][3] > 1:
+            spans.append(FormatSpan("", ""))
+        spans.append(FormatSpan(code[bounds[start][0]:bounds[end - 1][1]], formatted))
+
+    for idx, token in enumerate(tokens):
+        if token[0] == "open":
+            depth += 1
+        elif token[0] == "close":
+            depth = max(0, depth - 1)
+        elif token[0] == "semi" and depth == 0:
+            flush(idx + 1)
+            start = idx + 1
+    flush(len(tokens))
+    if code.endswith("\n") and spans:
+        spans.append(FormatSpan("", ""))
+    return spans or [FormatSpan(code, code)]
+
+
+# ---------------------------------------------------------------------------
+# HTML / JSP
+
+_MARKUP_TOKEN = re.compile(r"""
+    (?P<comment><!--[\s\S]*?(?:-->|\Z))
+  | (?P<jsp_comment><%--[\s\S]*?(?:--%>|\Z))
+  | (?P<scriptlet><%[\s\S]*?(?:%>|\Z))
+  | (?P<decl><![^>]*>|<\?[\s\S]*?\?>)
+  | (?P<close></\s*(?P<close_name>[\w:.-]+)\s*>)
+  | (?P<open><(?P<open_name>[\w:.-]+)(?:"[^"]*"|'[^']*'|<%[\s\S]*?%>|[^'"<>])*?(?P<self>/?)>)
+  | (?P<text>[^<]+)
+  | (?P<lt><)
+""", re.X)
+
+_VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+# 안쪽을 그대로 두는 요소 / 안쪽을 중괄호 엔진으로 정렬하는 요소
+_VERBATIM_ELEMENTS = {"pre", "textarea"}
+_RAW_TEXT_ELEMENTS = {"script": "js", "style": "css"}
+# 닫는 태그를 생략할 수 있는 요소: 여기 있는 태그가 열리면 암묵적으로 닫힘
+_IMPLIED_CLOSE = {
+    "li": {"li"},
+    "dt": {"dt", "dd"}, "dd": {"dt", "dd"},
+    "tr": {"tr", "tbody", "tfoot"},
+    "td": {"td", "th", "tr", "tbody", "tfoot"}, "th": {"td", "th", "tr", "tbody", "tfoot"},
+    "thead": {"tbody", "tfoot"}, "tbody": {"tbody", "tfoot"},
+    "option": {"option", "optgroup"}, "optgroup": {"optgroup"},
+    "p": {"p", "div", "ul", "ol", "table", "h1", "h2", "h3", "h4", "h5", "h6", "form", "section", "article", "header", "footer", "pre", "blockquote"},
+}
+_OPTIONAL_CLOSE = set(_IMPLIED_CLOSE) | {"colgroup", "tfoot", "rt", "rp"}
+
+
+class _MarkupScan:
+    """
+    HTML/JSP를 태그 깊이로 다시 들여쓰기.
+    줄마다 (종류, 단계, 기준 공백)을 계산: code는 단계만큼 들여쓰고, shift는 기준 공백을 떼고 단계만큼 이동, verbatim은 그대로.
+    """
+
+    def __init__(self, code: str, flavor: str, indent: str):
+        self.flavor = flavor
+        self.indent = indent
+        self.lines = code.split("\n")
+        count = len(self.lines)
+        self.kinds = ["code"] * count
+        self.levels = [0] * count
+        self.base_ws = [""] * count
+        self.fixed = {}  # 줄 번호 → 이미 정렬된 줄 (스크립트/스크립틀릿 안쪽)
+        self.uncertain = set()  # 중괄호 엔진이 확신하지 못한 스크립트 본문 줄
+        self.error = False
+        self._scan(code)
+
+    def _leading_ws(self, line: int) -> str:
+        text = self.lines[line]
+        return text[:len(text) - len(text.lstrip())]
+
+    def _embedded(self, body: str, first_line: int, level: int, flavor: str):
+        """
+        여러 줄 스크립트 본문을 중괄호 엔진으로 정렬해 fixed에 넣음.
+        first_line은 body가 시작하는 줄(태그와 같은 줄), level은 본문 한 단계 바깥.
+        엔진이 확신하지 못하면 그 줄들을 uncertain에 넣고(호출한 쪽에서 처리), 깊이 추정용으로 기준 공백만 옮기는 shift로 둔다.
+        """
+        body_lines = body.split("\n")
+        scan = _BraceScan(body, flavor)
+        confident = not scan.lexical_errors and not scan.structural_errors
+        rendered = scan.render(self.indent, "same-line") if confident else None
+        base_ws = next((
+            text[:len(text) - len(text.lstrip())] for text in body_lines[1:] if text.strip()
+        ), "")
+        for offset in range(1, len(body_lines)):
+            line = first_line + offset
+            if rendered is not None:
+                text = rendered[offset]
+                if scan.kinds[offset] == "verbatim" or not text:
+                    self.fixed[line] = text
+                else:
+                    self.fixed[line] = self.indent * (level + 1) + text
+            else:
+                self.kinds[line] = "shift"
+                self.levels[line] = level + 1
+                self.base_ws[line] = base_ws
+                self.uncertain.add(line)
+
+    def _scan(self, code: str):
+        stack = []
+        line = 0
+        started = False
+        pos, end = 0, len(code)
+
+        def begin(level: int):
+            nonlocal started
+            if not started:
+                started = True
+                if self.kinds[line] == "code" and line not in self.fixed:
+                    self.levels[line] = level
+
+        while pos < end:
+            match = _MARKUP_TOKEN.match(code, pos)
+            kind, text = match.lastgroup, match.group()
+            pos = match.end()
+
+            if kind == "text":
+                # 줄마다 첫 글자에서 단계 결정
+                for offset, part in enumerate(text.split("\n")):
+                    if offset:
+                        line += 1
+                        started = False
+                    if part.strip():
+                        begin(len(stack))
+                continue
+
+            if kind == "close":
+                name = match.group("close_name").lower()
+                if name in stack:
+                    while stack[-1] != name:
+                        if stack.pop() not in _OPTIONAL_CLOSE:
+                            self.error = True
+                    stack.pop()
+                else:
+                    self.error = True
+                begin(len(stack))
+                continue
+
+            if kind == "open":
+                name = match.group("open_name").lower()
+                while stack and stack[-1] in _IMPLIED_CLOSE and name in _IMPLIED_CLOSE[stack[-1]]:
+                    stack.pop()
+            begin(len(stack))
+            level = self.levels[line] if self.kinds[line] == "code" else len(stack)
+            newlines = text.count("\n")
+
+            if kind == "open":
+                for offset in range(1, newlines + 1):
+                    # 여러 줄 속성은 한 단계 더
+                    self.kinds[line + offset] = "shift"
+                    self.levels[line + offset] = level + 1
+                    self.base_ws[line + offset] = self._leading_ws(line + offset)
+                line += newlines
+                if match.group("self") or name in _VOID_ELEMENTS or (self.flavor == "jsp" and ":" in name and text.endswith("/>")):
+                    continue
+                if name in _VERBATIM_ELEMENTS or name in _RAW_TEXT_ELEMENTS:
+                    close = re.compile(r"</\s*" + re.escape(name) + r"\s*>", re.I).search(code, pos)
+                    body_end = close.start() if close else end
+                    body = code[pos:body_end]
+                    if not close:
+                        self.error = True
+                    if name in _VERBATIM_ELEMENTS:
+                        for offset in range(1, body.count("\n") + 1):
+                            self.kinds[line + offset] = "verbatim"
+                    else:
+                        self._embedded(body, line, level, _RAW_TEXT_ELEMENTS[name])
+                    last = line + body.count("\n")
+                    if last != line and not body.rsplit("\n", 1)[-1].strip():
+                        # 닫는 태그로 시작하는 줄은 여는 태그와 같은 단계
+                        self.fixed.pop(last, None)
+                        self.uncertain.discard(last)
+                        self.kinds[last] = "code"
+                        self.levels[last] = level
+                    line = last
+                    pos = close.end() if close else end
+                    continue
+                stack.append(name)
+            elif kind == "scriptlet" and newlines:
+                if not text.endswith("%>"):
+                    self.error = True
+                body = (text[2:-2] if text.endswith("%>") else text[2:]).lstrip("=!@")
+                self._embedded(body, line, level, "java")
+                if not body.rsplit("\n", 1)[-1].strip():
+                    # %> 로 시작하는 줄은 <% 와 같은 단계
+                    self.fixed.pop(line + newlines, None)
+                    self.uncertain.discard(line + newlines)
+                    self.kinds[line + newlines] = "code"
+                    self.levels[line + newlines] = level
+                line += newlines
+            elif newlines:
+                if kind in ("comment", "jsp_comment") and not text.endswith("-->" if kind == "comment" else "--%>"):
+                    self.error = True
+                base_ws = self._leading_ws(line)
+                for offset in range(1, newlines + 1):
+                    self.kinds[line + offset] = "shift"
+                    self.levels[line + offset] = level
+                    self.base_ws[line + offset] = base_ws
+                line += newlines
+            elif kind == "lt":
+                self.error = True
+
+    def render(self) -> list[str]:
+        out = []
+        for idx, text in enumerate(self.lines):
+            if idx in self.fixed:
+                out.append(self.fixed[idx])
+                continue
+            kind = self.kinds[idx]
+            if kind == "verbatim":
+                out.append(text)
+                continue
+            stripped = text.strip()
+            if not stripped:
+                out.append("")
+                continue
+            prefix = self.indent * self.levels[idx]
+            if kind == "shift":
+                base_ws = self.base_ws[idx]
+                body = text[len(base_ws):] if text.startswith(base_ws) else stripped
+                out.append(prefix + body.rstrip())
+            else:
+                out.append(prefix + stripped)
+        return out
+
+
+def _markup_spans(code: str, flavor: str, indent: str) -> list[FormatSpan]:
+    scan = _MarkupScan(code, flavor, indent)
+    if scan.error:
+        return [FormatSpan(code, None)]
+    # 확신하지 못한 스크립트 본문 줄만 불확실 구간으로
+    rendered = scan.render()
+    return _merge_spans([
+        ([original], None if idx in scan.uncertain else [formatted])
+        for idx, (original, formatted) in enumerate(zip(scan.lines, rendered))
+    ])
+
+
+# ---------------------------------------------------------------------------
+# Python
+
+def _width(ws: str) -> int:
+    return len(ws.expandtabs(8))
+
+
+def _python_render(code: str, indent: str):
+    """
+    블록 깊이(INDENT/DEDENT)마다 indent 한 단계로 다시 들여쓴 줄 목록. 토큰화에 실패하면 None.
+    - 논리 줄의 첫 줄: 깊이만큼 들여쓰기
+    - 괄호/역슬래시로 이어지는 줄: 첫 줄 기준 상대 공백 유지
+    - 여러 줄 문자열 안쪽: 그대로
+    - 주석만 있는 줄: 원래 공백 폭에 맞는 블록 깊이
+    """
+    lines = code.split("\n")
+    count = len(lines)
+    kinds = ["blank"] * count
+    levels = [0] * count
+    anchors = [""] * count  # 이어지는 줄의 기준(논리 줄 첫 줄의 공백)
+
+    def leading_ws(line: int) -> str:
+        text = lines[line]
+        return text[:len(text) - len(text.lstrip())]
+
+    depth = 0
+    widths = [0]
+    logical_start = None
+    fstring_starts = []
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(code).readline):
+            kind, line = tok.type, tok.start[0] - 1
+            if kind == tokenize.INDENT:
+                depth += 1
+                widths.append(_width(tok.string))
+            elif kind == tokenize.DEDENT:
+                depth -= 1
+                widths.pop()
+            elif kind == tokenize.NEWLINE:
+                logical_start = None
+            elif kind == tokenize.COMMENT and logical_start is None:
+                if kinds[line] == "blank":
+                    width = _width(leading_ws(line))
+                    kinds[line] = "code"
+                    levels[line] = min(depth, max(k for k, w in enumerate(widths) if w <= width))
+            elif kind not in (tokenize.NL, tokenize.ENDMARKER):
+                if logical_start is None:
+                    logical_start = line
+                    kinds[line] = "code"
+                    levels[line] = depth
+                elif kinds[line] == "blank":
+                    kinds[line] = "cont"
+                    levels[line] = levels[logical_start]
+                    anchors[line] = leading_ws(logical_start)
+                if kind == tokenize.COMMENT:
+                    continue
+                if kind == getattr(tokenize, "FSTRING_START", None):
+                    fstring_starts.append(line)
+                    continue
+                first = fstring_starts.pop() if kind == getattr(tokenize, "FSTRING_END", None) else line
+                for inner in range(first + 1, tok.end[0]):
+                    kinds[inner] = "verbatim"
+    except (tokenize.TokenError, SyntaxError):
+        return None
+
+    out = []
+    for idx, text in enumerate(lines):
+        kind = kinds[idx]
+        if kind == "verbatim":
+            out.append(text)
             continue
-        if stripped.startswith("}") or stripped.startswith(");") or stripped.startswith("end"):
-            level = max(0, level - 1)
-        prefix = get_indent() * level
-        if brace == "next-line" and "{" in stripped and not stripped.startswith("{"):
-            parts = stripped.split("{")
-            formatted.append(prefix + parts[0].strip())
-            formatted.append(prefix + "{")
+        stripped = text.lstrip()
+        if kind == "blank" or not stripped:
+            out.append("" if not text.strip() else text)
+            continue
+        prefix = indent * levels[idx]
+        if kind == "cont":
+            ws, anchor = text[:len(text) - len(stripped)], anchors[idx]
+            extra = ws[len(anchor):] if ws.startswith(anchor) else " " * max(0, _width(ws) - _width(anchor))
+            out.append(prefix + extra + stripped)
         else:
-            formatted.append(prefix + stripped)
-        if stripped.endswith("{") or stripped.endswith("(") or stripped.endswith("then") or (
-            "{" in stripped and "}" not in stripped):
-            level += 1
-        elif stripped.endswith("begin"):
-            level += 1
-    return "\n".join(formatted)
-
-def format_html(code: str, format_block_style_extended, get_indent, brace):
-    import re
-    code = re.sub(r'>\s*<', '>\n<', code)
-    return format_block_style_extended(code, get_indent, brace)
\ No newline at end of file
+            out.append(prefix + stripped)
+    return out
+
+
+def _python_spans(code: str, indent: str) -> list[FormatSpan]:
+    rendered = _python_render(code, indent)
+    if rendered is None:
+        # 들여쓰기 오류, 닫히지 않은 문자열/괄호 등
+        return [FormatSpan(code, None)]
+    return [FormatSpan(code, "\n".join(rendered))]
@@ -1,8 +1,20 @@
+import os
 import re
-from typing import Callable
+from typing import Awaitable, Callable
+from utils.cache_store import LRUCache
 
-# 간단한 인메모리 캐시 (서버 재시작하면 초기화됨)
-_feedback_cache = {}
+# 피드백 프롬프트(gpt_sidekick.FEEDBACK_SYSTEM_PROMPT 등)를 바꾸면 이 값을 올려서 이전 답변을 무효화
+FEEDBACK_PROMPT_VERSION = "3"
+# GPT 한 번에 묶어서 요청할 최대 finding 수
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", "8"))
+
+FEEDBACK_CACHE_MAX_ITEMS = int(os.getenv("FEEDBACK_CACHE_MAX_ITEMS", "2000"))
+FEEDBACK_CACHE_MAX_BYTES = int(os.getenv("FEEDBACK_CACHE_MAX_BYTES", str(20 * 1024 * 1024)))
+FEEDBACK_CACHE_TTL = float(os.getenv("FEEDBACK_CACHE_TTL", str(24 * 60 * 60)))  # 0이면 만료 없음
+
+# 인메모리 LRU 캐시 (서버 재시작하면 초기화됨)
+# 키: (모델명, 프롬프트 버전, 정규화된 finding 메시지)
+_feedback_cache = LRUCache(FEEDBACK_CACHE_MAX_ITEMS, FEEDBACK_CACHE_MAX_BYTES, FEEDBACK_CACHE_TTL)
 
 
 def normalize_finding_message(summary: str) -> str:
@@ -18,34 +30,74 @@ def normalize_finding_message(summary: str) -> str:
     return re.sub(r':\d+\s*-\s*', ' - ', summary)
 
 
-def get_gpt_feedback_cached(
-    summary: str,
-    gpt_model: str,
-    gpt_call_func: Callable[[str, str], str]
-) -> str:
+def feedback_cache_key(summary: str, gpt_model: str) -> tuple:
     """
-    GPT 호출을 캐싱해 동일 메시지에 대해 GPT 재호출을 방지.
+    캐시 키 생성: 모델과 프롬프트 버전이 다르면 다른 키
+    """
+    return (gpt_model, FEEDBACK_PROMPT_VERSION, normalize_finding_message(summary))
 
-    Parameters:
-        summary (str): 원본 Semgrep finding summary
-        gpt_model (str): 사용할 GPT 모델명
-        gpt_call_func (Callable): GPT 호출 함수 (prompt, model) -> str
+
+def _rule_of(summary: str) -> str:
+    """'[rule] message' 형식에서 rule(check_id) 부분"""
+    match = re.match(r'\[([^\]]*)\]', summary)
+    return match.group(1) if match else ""
+
+
+def _lookup_many(summaries: list[str], gpt_model: str):
+    """
+    캐시 조회. 같은 메시지(정규화 기준)는 한 번만 세고, 캐시에 없는 것은
+    룰(check_id) 순으로 정렬해서 같은 룰의 finding이 같은 프롬프트에 모이도록 한다.
 
     Returns:
-        str: GPT가 생성한 피드백
+        (keys, 캐시에 있던 {key: 피드백}, 요청할 [(key, summary)])
+    """
+    keys = [feedback_cache_key(summary, gpt_model) for summary in summaries]
+    feedbacks = {}
+    misses = {}
+    for key, summary in zip(keys, summaries):
+        if key in feedbacks or key in misses:
+            continue
+        cached = _feedback_cache.get(key)
+        if cached is not None:
+            feedbacks[key] = cached
+        else:
+            misses[key] = summary
+    pending = sorted(misses.items(), key=lambda item: _rule_of(item[1]))
+    return keys, feedbacks, pending
+
+
+def _store_many(feedbacks: dict, batch: list[tuple], answers: list[str]):
+    for (key, _), feedback in zip(batch, answers):
+        feedbacks[key] = feedback
+        # 실패한 항목(빈 문자열)은 캐싱하지 않고 다음 요청 때 다시 시도
+        if feedback:
+            _feedback_cache.set(key, feedback, len(feedback.encode("utf-8")))
+
+
+async def get_gpt_feedbacks_cached_async(
+    summaries: list[str],
+    gpt_model: str,
+    gpt_bulk_func: Callable[[list[str], str], Awaitable[list[str]]]
+) -> list[str]:
     """
-    normalized_key = normalize_finding_message(summary)
+    여러 finding의 피드백을 한 번에 구한다.
 
-    # 캐시에 있으면 재사용
-    if normalized_key in _feedback_cache:
-        return _feedback_cache[normalized_key]
+    - 같은 메시지(정규화 기준)는 한 번만 요청하고, 캐시에 있는 것은 요청하지 않음
+    - 캐시에 없는 finding 전체(룰 순 정렬)를 gpt_bulk_func에 한 번에 넘기고,
+      묶음 크기와 동시 요청 수는 gpt_bulk_func(format_findings_with_gpt_bulk)가 정한다
+    - 받은 피드백은 finding별로 캐시에 저장. 실패한 항목은 빈 문자열로 돌려준다
 
-    # GPT 호출
-    feedback = gpt_call_func(summary, gpt_model)
+    Parameters:
+        summaries (list[str]): '[rule] message' 형식의 finding 목록
+        gpt_bulk_func (Callable): (finding 목록, 모델) -> 같은 순서의 피드백 목록 (코루틴)
 
-    # 캐시에 저장
-    _feedback_cache[normalized_key] = feedback
-    return feedback
+    Returns:
+        list[str]: summaries와 같은 순서의 피드백 목록
+    """
+    keys, feedbacks, pending = _lookup_many(summaries, gpt_model)
+    if pending:
+        _store_many(feedbacks, pending, await gpt_bulk_func([summary for _, summary in pending], gpt_model))
+    return [feedbacks.get(key, "") for key in keys]
 
 
 def clear_cache():
@@ -60,3 +112,10 @@ def cache_size() -> int:
     현재 캐시된 항목 개수
     """
     return len(_feedback_cache)
+
+
+def cache_stats() -> dict:
+    """
+    항목 수, 용량, 히트/미스/제거 횟수
+    """
+    return _feedback_cache.stats()
@@ -1,14 +1,18 @@
 import os
-import openai
+import json
 import asyncio
-from config import client
-from openai import AsyncOpenAI
+from config import LLM_MAX_CONCURRENCY, logger
+from utils.llm_cache import llm_cache
+from utils.gpt_feedback_cache import FEEDBACK_BATCH_SIZE
+from utils.llm_scheduler import chat_completion, chat_completion_sync, concurrency_slot
+
+DEFAULT_SYSTEM_PROMPT = "당신은 유용한 AI 어시스턴트입니다."
 
 def ask_sidekick(
     prompt: str,
     model: str = "gpt-3.5-turbo",
     temperature: float = 0.2,
-    system_prompt: str = "당신은 유용한 AI 어시스턴트입니다."
+    system_prompt: str = DEFAULT_SYSTEM_PROMPT
 ) -> str:
     """
     GPT 사이드킥에게 프롬프트를 보내 응답을 받습니다.
@@ -21,54 +25,231 @@ def ask_sidekick(
 
     Returns:
         str: GPT의 응답 텍스트
+
+    Raises:
+        재시도 후에도 실패하면 마지막 예외 (서킷이 열려 있으면 LLMUnavailable)
     """
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=temperature
-        )
-        return response.choices[0].message.content.strip()
+    response = chat_completion_sync(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=temperature
+    )
+    return response.choices[0].message.content.strip()
 
-    except Exception as e:
-        print(f"[Sidekick Error] GPT 요청 실패: {e}")
-        return ""
 
+def _messages(system_prompt: str, prompt: str) -> list[dict]:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
 
-def format_finding_with_gpt(finding: str, model: str = "gpt-3.5-turbo") -> str:
-    #client = AsyncOpenAI()
 
+async def ask_sidekick_async(
+    prompt: str,
+    model: str = "gpt-3.5-turbo",
+    temperature: float = 0.2,
+    system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+    use_cache: bool = False
+) -> str:
     """
-    단일 finding(문자열)에 대해 GPT에게 개선 피드백을 요청하는 함수
+    ask_sidekick()의 비동기 버전. AsyncOpenAI 클라이언트를 사용합니다.
+    use_cache=True 이면 동일 프롬프트/모델/temperature의 이전 응답을 재사용합니다.
+    실패하면 ask_sidekick()과 같이 예외를 올립니다.
     """
-    prompt = (
-        "아래 정적 분석 결과([Finding])를 참고해서 다음을 수행해 주세요.\n"
-        "1. 해당 문제를 초보 개발자도 이해할 수 있게 설명해 주세요.\n"
-        "2. 문제를 수정하는 구체적인 방법을 제안해 주세요.\n"
-        "3. 참고할 수 있는 개선된 코드 예제도 함께 제공해 주세요.\n\n"
-        f"[Finding]\n{finding}"
-    )
+    # 캐시는 SQLite 파일이라 이벤트 루프 밖에서 조회/저장
+    if use_cache and llm_cache:
+        cached = await asyncio.to_thread(llm_cache.get, prompt, model, temperature, system_prompt)
+        if cached is not None:
+            return cached
 
-    completion = client.chat.completions.create(
+    response = await chat_completion(
         model=model,
-        messages=[
-            {"role": "system", "content": "당신은 숙련된 소프트웨어 보안 전문가입니다."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3
+        messages=_messages(system_prompt, prompt),
+        temperature=temperature
     )
+    answer = response.choices[0].message.content.strip()
+    if use_cache and llm_cache:
+        await asyncio.to_thread(llm_cache.set, prompt, model, temperature, answer, system_prompt)
+    return answer
+
+
+async def ask_sidekick_as_completed(
+    prompts: list[str],
+    model: str = "gpt-3.5-turbo",
+    temperature: float = 0.2,
+    max_concurrency: int = LLM_MAX_CONCURRENCY,
+    use_cache: bool = False,
+    return_exceptions: bool = False,
+    system_prompt: str = DEFAULT_SYSTEM_PROMPT
+):
+    """
+    여러 프롬프트를 동시에 요청하고(요청 하나당 max_concurrency 개까지), 응답이 끝나는 순서대로
+    (index, 응답)을 내보내는 비동기 제너레이터.
+    공통 지시/맥락은 system_prompt로 넘기면 모든 요청이 같은 prefix로 시작해 provider의 프롬프트 캐시에 걸립니다.
+    return_exceptions=True 이면 실패한 항목은 (index, 예외 객체)로 내보내고 나머지 결과는 살립니다.
+    소비하는 쪽이 중간에 멈추면(연결 종료 등) 남은 요청은 취소합니다.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _ask(idx: int, prompt: str):
+        async with concurrency_slot(semaphore, model, _messages(system_prompt, prompt)):
+            try:
+                return idx, await ask_sidekick_async(prompt, model, temperature, system_prompt, use_cache=use_cache)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return idx, e
+
+    tasks = [asyncio.create_task(_ask(idx, p)) for idx, p in enumerate(prompts)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
 
-    return completion.choices[0].message.content.strip()
+# 지시문은 모두 system 메시지에 두고 user 메시지에는 finding만 보내서,
+# 모든 피드백 요청이 같은 prefix로 시작하도록 함 (provider 프롬프트 캐시)
+FEEDBACK_SYSTEM_PROMPT = (
+    "당신은 숙련된 소프트웨어 보안 전문가입니다.\n"
+    "사용자가 보내는 정적 분석 결과([Finding])를 참고해서 다음을 수행해 주세요.\n"
+    "1. 해당 문제를 초보 개발자도 이해할 수 있게 설명해 주세요.\n"
+    "2. 문제를 수정하는 구체적인 방법을 제안해 주세요.\n"
+    "3. 참고할 수 있는 개선된 코드 예제도 함께 제공해 주세요."
+)
+# 여러 건 요청: 단건 지시문 뒤에 JSON 형식 지시만 덧붙임 (단건/묶음 요청이 앞부분을 공유)
+FEEDBACK_BATCH_SYSTEM_PROMPT = (
+    FEEDBACK_SYSTEM_PROMPT + "\n\n"
+    "여러 건([Finding N])이 오면 각각에 대해 위 작업을 수행해 주세요.\n"
+    "같은 룰의 항목은 공통 설명을 반복해도 되지만, 항목마다 완결된 답변이어야 합니다.\n"
+    "반드시 아래 형식의 JSON 하나만 출력하세요. (id는 Finding 번호, feedback은 마크다운 문자열)\n"
+    '{"items": [{"id": 1, "feedback": "..."}]}'
+)
+# GPT 피드백 요청(묶음 요청, 단건 재요청 각각) 하나의 제한 시간(초)
+FEEDBACK_TIMEOUT = float(os.getenv("FEEDBACK_TIMEOUT", "60"))
 
 
-def format_findings_with_gpt_bulk(findings: list[str], model: str = "gpt-4o") -> list[str]:
+def build_finding_prompt(finding: str) -> str:
+    return f"[Finding]\n{finding}"
+
+
+def build_findings_batch_prompt(findings: list[str]) -> str:
+    """finding 여러 개(같은 룰끼리 모아서)에 번호를 붙여 한 번에 묻는 user 메시지 (JSON 답변 형식은 FEEDBACK_BATCH_SYSTEM_PROMPT)"""
+    return "\n\n".join(f"[Finding {idx}]\n{finding}" for idx, finding in enumerate(findings, 1))
+
+
+def parse_findings_batch_response(text: str) -> dict[int, str]:
+    """JSON 응답에서 {Finding 번호: 피드백}을 뽑는다. 형식이 깨졌으면 빈 dict"""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        data = json.loads(text[start:end + 1])
+        return {
+            int(item["id"]): str(item["feedback"]).strip()
+            for item in data.get("items", [])
+            if isinstance(item, dict) and "id" in item and item.get("feedback")
+        }
+    except (ValueError, TypeError, AttributeError):
+        return {}
+
+
+async def _feedback_request(messages: list[dict], model: str, semaphore: asyncio.Semaphore, timeout: float) -> str:
+    """피드백 요청 하나. 공용 동시 호출 자리를 잡은 뒤 요청마다 timeout 초 제한 (자리 대기 시간은 제외)"""
+    async with concurrency_slot(semaphore, model, messages):
+        completion = await asyncio.wait_for(
+            chat_completion(model=model, messages=messages, temperature=0.3), timeout
+        )
+    return (completion.choices[0].message.content or "").strip()
+
+
+async def format_finding_with_gpt_async(
+    finding: str,
+    model: str = "gpt-3.5-turbo",
+    semaphore: asyncio.Semaphore = None,
+    timeout: float = FEEDBACK_TIMEOUT
+) -> str:
+    """단일 finding(문자열)에 대해 GPT에게 개선 피드백을 요청"""
+    messages = [
+        {"role": "system", "content": FEEDBACK_SYSTEM_PROMPT},
+        {"role": "user", "content": build_finding_prompt(finding)}
+    ]
+    return await _feedback_request(messages, model, semaphore or asyncio.Semaphore(LLM_MAX_CONCURRENCY), timeout)
+
+
+async def format_findings_batch_with_gpt_async(
+    findings: list[str],
+    model: str = "gpt-3.5-turbo",
+    semaphore: asyncio.Semaphore = None,
+    timeout: float = FEEDBACK_TIMEOUT
+) -> list[str]:
     """
-    여러 finding 항목을 받아서 각 항목별 GPT 피드백을 병렬로 생성
-    기존 format_finding_with_gpt()를 그대로 활용
+    finding 여러 개를 GPT 한 번에 요청하고 응답(JSON)을 finding별로 나눠 반환.
+    묶음 요청이 실패했거나 JSON에서 빠진 항목만 동시에 단건으로 다시 요청하고,
+    이미 받은 항목은 그대로 둔다. 요청마다 timeout 초 제한이며, 단건 요청까지 실패한 항목은 빈 문자열.
+
+    Returns:
+        list[str]: findings와 같은 순서의 피드백 목록
     """
-    tasks = [format_finding_with_gpt(f, model) for f in findings]
-    results = asyncio.gather(*tasks)
-    return results
\ No newline at end of file
+    semaphore = semaphore or asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    parsed = {}
+    batch_answered = False
+    if len(findings) > 1:
+        messages = [
+            {"role": "system", "content": FEEDBACK_BATCH_SYSTEM_PROMPT},
+            {"role": "user", "content": build_findings_batch_prompt(findings)}
+        ]
+        try:
+            parsed = parse_findings_batch_response(await _feedback_request(messages, model, semaphore, timeout))
+            batch_answered = True
+        except asyncio.TimeoutError:
+            logger.warning(f"[Sidekick Error] GPT 피드백 시간 초과 ({timeout}초, {len(findings)}건), 단건으로 다시 요청")
+        except Exception as e:
+            logger.warning(f"[Sidekick Error] GPT 피드백 요청 실패 ({len(findings)}건), 단건으로 다시 요청: {e}")
+
+    missing = [idx for idx in range(1, len(findings) + 1) if not parsed.get(idx)]
+    if missing:
+        if batch_answered:
+            logger.info(f"[Sidekick] 일괄 응답에 {missing}번 항목이 없어 단건 요청")
+        retried = await asyncio.gather(
+            *[format_finding_with_gpt_async(findings[idx - 1], model, semaphore, timeout) for idx in missing],
+            return_exceptions=True
+        )
+        for idx, result in zip(missing, retried):
+            if isinstance(result, BaseException):
+                # 단건 요청도 실패한 항목만 빈 문자열 (나머지 결과는 살림)
+                reason = "시간 초과" if isinstance(result, asyncio.TimeoutError) else str(result)
+                logger.warning(f"[Sidekick Error] GPT 피드백 요청 실패 ({idx}번): {reason}")
+                result = ""
+            parsed[idx] = result
+    return [parsed[idx] for idx in range(1, len(findings) + 1)]
+
+
+async def format_findings_with_gpt_bulk(
+    findings: list[str],
+    model: str = "gpt-4o",
+    batch_size: int = FEEDBACK_BATCH_SIZE,
+    max_concurrency: int = LLM_MAX_CONCURRENCY,
+    timeout: float = FEEDBACK_TIMEOUT
+) -> list[str]:
+    """
+    여러 finding 항목의 GPT 피드백을 비동기로 동시에 생성.
+
+    - 앞에서부터 batch_size 개씩 묶어 한 요청으로 보냄 (같은 룰끼리 붙어 있도록 정렬해서 넘길 것)
+    - 묶음 요청과 단건 재요청 모두 concurrency_slot으로 같은 자리(max_concurrency 개)를 나눠 씀
+    - 요청마다 timeout 초 제한. 실패한 항목만 빈 문자열로 채우고 나머지 결과는 그대로 반환
+
+    Returns:
+        list[str]: findings와 같은 순서의 피드백 목록 (실패 항목은 "")
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    batch_size = max(1, batch_size)
+    batches = [findings[start:start + batch_size] for start in range(0, len(findings), batch_size)]
+    results = await asyncio.gather(
+        *[format_findings_batch_with_gpt_async(batch, model, semaphore, timeout) for batch in batches]
+    )
+    return [feedback for batch_result in results for feedback in batch_result]
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+from contextlib import contextmanager
+from config import logger
+
+JOB_DB = os.getenv("JOB_DB", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# 대기 중인 작업이 이 수를 넘으면 새 작업을 받지 않음 (LLM 비용 유입 제한)
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+# 끝난(done/failed) 작업을 이 시간(초)이 지나면 DB에서 삭제. 0이면 삭제하지 않음
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+JOB_POLL_SECONDS = 2.0
+JOB_SWEEP_SECONDS = 600.0
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """
+    SQLite에 저장되는 작업 큐 + asyncio 워커 풀.
+
+    - submit()으로 넣은 작업은 DB에 저장되므로 서버가 재시작돼도 남는다.
+    - 재시작 시 실행 중(running)이던 작업은 다시 대기(queued) 상태로 돌린다.
+    - 작업 종류(kind)별 처리 함수는 register()로 등록: async def handler(payload) -> result
+    - 끝난 작업은 retention초가 지나면 주기적으로 삭제 (0이면 보관)
+    """
+
+    def __init__(self, db_path: str, workers: int, max_queued: int, retention: float = JOB_RETENTION_SECONDS):
+        self.db_path = db_path
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self._handlers = {}
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT, status TEXT, payload TEXT, result TEXT, error TEXT, "
+                "created_at REAL, started_at REAL, finished_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def register(self, kind: str, handler):
+        self._handlers[kind] = handler
+
+    async def submit(self, kind: str, payload: dict) -> str:
+        """작업을 저장하고 id 반환 (DB 작업은 스레드에서). 대기 작업이 가득 차면 JobQueueFull"""
+        if kind not in self._handlers:
+            raise ValueError(f"알 수 없는 작업 종류: {kind}")
+        job_id = await asyncio.to_thread(self._insert, kind, payload)
+        if self._wakeup:
+            self._wakeup.set()
+        return job_id
+
+    def _insert(self, kind: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            # 개수 확인과 저장 사이에 다른 요청이 끼어들지 않도록 한 트랜잭션으로
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if queued >= self.max_queued:
+                    raise JobQueueFull("대기 중인 작업이 너무 많습니다.")
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                    (job_id, kind, json.dumps(payload, ensure_ascii=False), time.time())
+                )
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        return job_id
+
+    def get(self, job_id: str):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, kind, status, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            job = {
+                "job_id": row[0],
+                "kind": row[1],
+                "status": row[2],
+                "result": json.loads(row[3]) if row[3] else None,
+                "error": row[4],
+                "created_at": row[5],
+                "started_at": row[6],
+                "finished_at": row[7],
+            }
+            if job["status"] == "queued":
+                job["queue_position"] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (row[5],)
+                ).fetchone()[0] + 1
+            return job
+
+    def _claim(self):
+        """가장 오래된 대기 작업 하나를 running 으로 바꾸고 가져온다."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, kind, payload FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (time.time(), row[0]))
+            conn.execute("COMMIT")
+            return row
+
+    def _finish(self, job_id: str, result=None, error: str = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (
+                    "failed" if error else "done",
+                    None if error else json.dumps(result, ensure_ascii=False),
+                    error,
+                    time.time(),
+                    job_id,
+                )
+            )
+
+    def _purge(self) -> int:
+        """보관 기간이 지난 완료/실패 작업 삭제. 삭제한 수 반환"""
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - self.retention,)
+            ).rowcount
+
+    async def _sweeper(self):
+        while True:
+            try:
+                removed = await asyncio.to_thread(self._purge)
+                if removed:
+                    logger.info(f"[작업 정리] 보관 기간이 지난 작업 {removed}건 삭제")
+            except sqlite3.Error as e:
+                logger.warning(f"[작업 정리] 실패: {e}")
+            await asyncio.sleep(JOB_SWEEP_SECONDS)
+
+    async def _worker(self, worker_id: int):
+        while True:
+            row = await asyncio.to_thread(self._claim)
+            if row is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, kind, payload = row
+            logger.info(f"[작업 {worker_id}] {kind} 시작: {job_id}")
+            try:
+                result = await self._handlers[kind](json.loads(payload))
+                await asyncio.to_thread(self._finish, job_id, result)
+                logger.info(f"[작업 {worker_id}] {kind} 완료: {job_id}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[작업 {worker_id}] {kind} 실패: {job_id} - {e}")
+                await asyncio.to_thread(self._finish, job_id, None, str(e))
+
+    def start(self):
+        # 이전 실행에서 중단된 작업은 다시 대기열로
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i + 1)) for i in range(self.workers)]
+        if self.retention > 0:
+            self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+job_queue = JobQueue(JOB_DB, JOB_WORKERS, JOB_MAX_QUEUED)
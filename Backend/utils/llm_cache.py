@@ -0,0 +1,48 @@
+import os
+import json
+import hashlib
+from utils.cache_store import SqliteLRUCache
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ["true", "1", "yes"]
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "llm_cache.sqlite3")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+
+
+def llm_cache_key(prompt: str, model: str, temperature: float, system_prompt: str = "") -> str:
+    """
+    프롬프트 원문 + 모델 + temperature (+ 시스템 프롬프트)의 SHA-256
+    """
+    payload = json.dumps([model, temperature, system_prompt, prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    동일 프롬프트에 대한 LLM 응답을 디스크(SQLite)에 저장해 재사용.
+    용량(LLM_CACHE_MAX_BYTES)을 넘으면 가장 오래 사용되지 않은 응답부터 제거.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int):
+        self.store = SqliteLRUCache(db_path, "llm_responses", max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, prompt: str, model: str, temperature: float, system_prompt: str = ""):
+        response = self.store.get(llm_cache_key(prompt, model, temperature, system_prompt))
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def set(self, prompt: str, model: str, temperature: float, response: str, system_prompt: str = ""):
+        # 실패(빈 응답)는 저장하지 않음
+        if not response:
+            return
+        self.store.set(llm_cache_key(prompt, model, temperature, system_prompt), response, tag=model)
+
+    def clear(self):
+        self.store.clear()
+
+
+llm_cache = LLMResponseCache(LLM_CACHE_DB, LLM_CACHE_MAX_BYTES) if LLM_CACHE_ENABLED else None
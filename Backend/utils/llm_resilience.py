@@ -0,0 +1,171 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+import openai
+
+# 실패한 호출을 다시 시도하는 최대 횟수 (첫 시도 제외)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+# 재시도 대기 = 0 ~ min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2^시도) 사이 무작위 (Retry-After가 있으면 그 이상)
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+# 응답이 p95 지연을 넘기면 같은 요청을 하나 더 보내 먼저 온 응답을 사용 (토큰이 더 들어서 기본 꺼짐)
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ["true", "1", "yes"]
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# 모델별로 호출이 재시도까지 연속 N번 실패하면(429 제외) LLM_BREAKER_COOLDOWN 초 동안 호출하지 않고 바로 실패
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+_RETRYABLE_STATUS = {408, 409, 429}
+_LATENCY_WINDOW = 200
+
+
+class LLMUnavailable(Exception):
+    """서킷이 열려 있어(업스트림 장애) 호출하지 않고 바로 실패"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """다시 시도하면 성공할 수 있는 오류인지 (연결/시간 초과/429/5xx)"""
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in _RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return isinstance(error, openai.APIStatusError) and error.status_code == 429
+
+
+def retry_after(error: Exception):
+    """응답 헤더의 Retry-After(초 또는 HTTP 날짜) / retry-after-ms 값(초). 없으면 None"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    """attempt번째(0부터) 재시도 전 대기 시간: full jitter 지수 백오프, Retry-After가 더 길면 그 값"""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+    server_delay = retry_after(error)
+    return max(delay, server_delay) if server_delay is not None else delay
+
+
+class CircuitBreaker:
+    """
+    모델 하나의 서킷 브레이커.
+
+    - closed: 정상 호출. 재시도까지 실패한 호출이 연속 threshold 번이면 open
+      (시도마다가 아니라 호출 하나를 한 번으로 세고, 429는 한도 문제라 스케줄러 pause로만 처리)
+    - open: cooldown 동안 호출하지 않고 LLMUnavailable
+    - cooldown이 지나면 호출 하나만 시험으로 통과시키고(다시 cooldown 시작), 성공하면 closed
+    """
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.cooldown else "half_open"
+
+    def before_call(self, model: str):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            now = time.monotonic()
+            if now - self.opened_at < self.cooldown:
+                self.rejected += 1
+                remaining = self.cooldown - (now - self.opened_at)
+                raise LLMUnavailable(f"{model} 호출 일시 중단 (연속 실패, {remaining:.0f}초 후 재시도)")
+            # 시험 호출 하나만 통과, 나머지는 다음 cooldown까지 대기
+            self.opened_at = now
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """모델별 최근 응답 시간으로 p95를 구하고, hedge 요청 횟수를 센다"""
+
+    def __init__(self, window: int = _LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def p95(self, min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        with self._lock:
+            if len(self.samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+_breakers = {}
+_latencies = {}
+_registry_lock = threading.Lock()
+
+
+def breaker_for(model: str) -> CircuitBreaker:
+    with _registry_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker()
+        return _breakers[model]
+
+
+def latency_for(model: str) -> LatencyTracker:
+    with _registry_lock:
+        if model not in _latencies:
+            _latencies[model] = LatencyTracker()
+        return _latencies[model]
+
+
+def resilience_stats() -> dict:
+    with _registry_lock:
+        models = set(_breakers) | set(_latencies)
+    result = {}
+    for model in sorted(models):
+        breaker, latency = breaker_for(model), latency_for(model)
+        p95 = latency.p95(1)
+        result[model] = {
+            "circuit": breaker.state,
+            "consecutive_failures": breaker.failures,
+            "rejected": breaker.rejected,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "hedged": latency.hedged,
+            "hedge_wins": latency.hedge_wins,
+        }
+    return result
@@ -0,0 +1,370 @@
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager, asynccontextmanager
+from config import (
+    client, async_client, logger,
+    MODEL_RATE_LIMITS, DEFAULT_MODEL_RATE_LIMITS, LLM_RATE_LIMIT_RATIO,
+    MODEL_TOKEN_LIMITS, DEFAULT_MODEL_TOKEN_LIMITS
+)
+from utils.tokens import estimate_tokens
+from utils.metrics import record_llm_usage
+from utils.cancellation import record_cancelled_llm_call
+from utils.llm_resilience import (
+    LLM_MAX_RETRIES, LLM_HEDGE_ENABLED,
+    is_retryable, is_rate_limited, backoff_delay, breaker_for, latency_for
+)
+
+# 우선순위 (숫자가 작을수록 먼저)
+PRIORITY_INTERACTIVE = 0  # /gpt_format/ 처럼 사용자가 화면에서 기다리는 요청
+PRIORITY_NORMAL = 1       # 일반 API 요청 (/review/, /sast/)
+PRIORITY_BULK = 2         # 백그라운드 작업 큐
+
+# 대기 중인 앞 순번 요청이 있을 때 다시 확인하는 간격(초)
+_POLL_INTERVAL = 0.05
+# 메시지 하나당 붙는 포맷 토큰 (role 등)
+_TOKENS_PER_MESSAGE = 4
+
+_priority = contextvars.ContextVar("llm_priority", default=PRIORITY_NORMAL)
+
+
+@contextmanager
+def llm_priority(priority: int):
+    """
+    with 블록 안에서 나가는 LLM 호출의 우선순위 지정.
+    asyncio task / to_thread 로 넘어간 호출에도 그대로 이어진다.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class _Bucket:
+    """분당 한도를 초당 비율로 계속 채우는 토큰 버킷"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(1.0, per_minute)
+        self.rate = self.capacity / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+
+class _ModelState:
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = _Bucket(rpm * LLM_RATE_LIMIT_RATIO)
+        self.tokens = _Bucket(tpm * LLM_RATE_LIMIT_RATIO)
+        self.waiting = []  # (우선순위, 순번) 힙
+        self.sent = 0
+        self.charged_tokens = 0
+        self.used_tokens = 0
+
+
+class LLMScheduler:
+    """
+    모든 LLM 호출이 거쳐 가는 모델별 요청/토큰 버킷 스케줄러.
+
+    - 호출 전에 예상 토큰(프롬프트 + 예상 출력)을 먼저 차감하고,
+      응답의 usage로 실제 사용량과의 차이를 정산
+    - 같은 모델의 대기열은 (우선순위, 도착 순)으로 한 줄로 세워, 앞 순번이 지나가기 전에는
+      뒤 순번이 한도를 가져가지 못함
+    - 스레드(동기 클라이언트)와 이벤트 루프(비동기 클라이언트) 양쪽에서 함께 사용
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+        self._seq = itertools.count()
+
+    def _state(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            rpm, tpm = MODEL_RATE_LIMITS.get(model, DEFAULT_MODEL_RATE_LIMITS)
+            state = self._models[model] = _ModelState(rpm, tpm)
+        return state
+
+    def _enqueue(self, model: str, priority: int) -> tuple:
+        ticket = (priority, next(self._seq))
+        with self._lock:
+            heapq.heappush(self._state(model).waiting, ticket)
+        return ticket
+
+    def _cancel(self, model: str, ticket: tuple):
+        with self._lock:
+            waiting = self._state(model).waiting
+            if ticket in waiting:
+                waiting.remove(ticket)
+                heapq.heapify(waiting)
+
+    def _try_acquire(self, model: str, tokens: int, ticket: tuple) -> float:
+        """한도를 얻었으면 0, 아니면 다시 시도할 때까지 기다릴 시간(초)"""
+        with self._lock:
+            state = self._state(model)
+            if state.waiting[0] != ticket:
+                return _POLL_INTERVAL
+            now = time.monotonic()
+            state.requests.refill(now)
+            state.tokens.refill(now)
+            # 버킷보다 큰 요청은 버킷이 가득 찼을 때 보냄 (영원히 기다리지 않도록)
+            tokens = min(tokens, state.tokens.capacity)
+            wait = max(state.requests.wait_time(1), state.tokens.wait_time(tokens))
+            if wait > 0:
+                return wait
+            state.requests.level -= 1
+            state.tokens.level -= tokens
+            state.sent += 1
+            state.charged_tokens += tokens
+            heapq.heappop(state.waiting)
+            return 0.0
+
+    async def acquire(self, model: str, tokens: int, priority: int = None):
+        ticket = self._enqueue(model, _priority.get() if priority is None else priority)
+        try:
+            while (wait := self._try_acquire(model, tokens, ticket)) > 0:
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._cancel(model, ticket)
+            raise
+
+    def acquire_sync(self, model: str, tokens: int, priority: int = None):
+        ticket = self._enqueue(model, _priority.get() if priority is None else priority)
+        try:
+            while (wait := self._try_acquire(model, tokens, ticket)) > 0:
+                time.sleep(wait)
+        except BaseException:
+            self._cancel(model, ticket)
+            raise
+
+    def reconcile(self, model: str, charged: int, used: int):
+        """먼저 차감한 예상치(charged)를 실제 사용량(used)으로 정산. 더 썼으면 음수까지 내려감"""
+        with self._lock:
+            state = self._state(model)
+            charged = min(charged, state.tokens.capacity)
+            state.tokens.level = min(state.tokens.capacity, state.tokens.level + charged - used)
+            state.used_tokens += used
+
+    def pause(self, model: str, seconds: float):
+        """429를 받으면 해당 모델의 요청을 seconds 동안 멈춤 (대기 중인 요청도 함께 밀림)"""
+        with self._lock:
+            requests = self._state(model).requests
+            requests.refill(time.monotonic())
+            requests.level = min(requests.level, 1 - seconds * requests.rate)
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            result = {}
+            for model, state in self._models.items():
+                state.requests.refill(now)
+                state.tokens.refill(now)
+                result[model] = {
+                    "rpm": round(state.requests.capacity),
+                    "tpm": round(state.tokens.capacity),
+                    "available_requests": round(state.requests.level, 1),
+                    "available_tokens": round(state.tokens.level),
+                    "waiting": len(state.waiting),
+                    "sent": state.sent,
+                    "estimated_tokens": state.charged_tokens,
+                    "used_tokens": state.used_tokens,
+                }
+            return result
+
+
+llm_scheduler = LLMScheduler()
+
+
+def estimate_request_tokens(model: str, messages: list[dict], max_tokens: int = None) -> int:
+    """
+    요청 하나가 쓸 토큰 예상치 = 프롬프트 토큰 + 예상 출력 토큰.
+    출력 길이를 모르면 프롬프트만큼(정렬/리뷰 응답은 입력 코드 길이와 비슷)으로 보되 최대 출력 토큰을 넘지 않게 잡는다.
+    """
+    prompt_tokens = sum(
+        estimate_tokens(message.get("content") or "", model) + _TOKENS_PER_MESSAGE
+        for message in messages
+    )
+    if max_tokens is None:
+        max_tokens = min(prompt_tokens, MODEL_TOKEN_LIMITS.get(model, DEFAULT_MODEL_TOKEN_LIMITS)[1])
+    return prompt_tokens + max_tokens
+
+
+@asynccontextmanager
+async def concurrency_slot(semaphore: asyncio.Semaphore, model: str, messages: list[dict]):
+    """
+    요청 단위 동시 호출 제한(semaphore) 자리를 잡는다.
+    자리를 기다리다 클라이언트 연결 종료로 취소되면 보내지 않은 호출로 집계한다.
+    """
+    try:
+        await semaphore.acquire()
+    except asyncio.CancelledError:
+        record_cancelled_llm_call(model, estimate_request_tokens(model, messages), "waiting")
+        raise
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def _settle(model: str, charged: int, usage):
+    """먼저 차감한 예상 토큰을 usage로 정산하고 사용량(prefix 캐시 토큰 포함)을 기록"""
+    total = getattr(usage, "total_tokens", None)
+    llm_scheduler.reconcile(model, charged, total if isinstance(total, int) else charged)
+    record_llm_usage(model, usage)
+
+
+async def _reconciled_stream(stream, model: str, charged: int):
+    """스트리밍 응답을 그대로 넘기면서, 마지막 usage 이벤트로 정산"""
+    usage = None
+    try:
+        async for event in stream:
+            usage = getattr(event, "usage", None) or usage
+            yield event
+    finally:
+        _settle(model, charged, usage)
+
+
+async def _call_once(model: str, messages: list[dict], priority: int, kwargs: dict):
+    """스케줄러에서 한도를 받아 한 번 호출하고 usage로 정산"""
+    charged = estimate_request_tokens(model, messages, kwargs.get("max_tokens"))
+    try:
+        await llm_scheduler.acquire(model, charged, priority)
+    except asyncio.CancelledError:
+        record_cancelled_llm_call(model, charged, "queued")
+        raise
+    try:
+        response = await async_client.chat.completions.create(model=model, messages=messages, **kwargs)
+    except BaseException as e:
+        # 실패한 요청은 토큰을 쓰지 않은 것으로 보고 돌려줌 (요청 수는 그대로 차감)
+        llm_scheduler.reconcile(model, charged, 0)
+        if isinstance(e, asyncio.CancelledError):
+            record_cancelled_llm_call(model, 0, "in_flight")
+        raise
+
+    if kwargs.get("stream"):
+        return _reconciled_stream(response, model, charged)
+    _settle(model, charged, getattr(response, "usage", None))
+    return response
+
+
+async def _call_hedged(model: str, messages: list[dict], priority: int, kwargs: dict):
+    """
+    p95 지연을 넘기도록 응답이 없으면 같은 요청을 하나 더 보내고 먼저 성공한 응답을 사용.
+    지연 표본이 부족하거나 hedge가 꺼져 있으면 한 번만 호출.
+    """
+    latency = latency_for(model)
+    threshold = latency.p95() if LLM_HEDGE_ENABLED else None
+    if threshold is None:
+        return await _call_once(model, messages, priority, kwargs)
+
+    first = asyncio.create_task(_call_once(model, messages, priority, kwargs))
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=threshold)
+        if not done:
+            latency.hedged += 1
+            tasks.add(asyncio.create_task(_call_once(model, messages, priority, kwargs)))
+
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        latency.hedge_wins += 1
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in tasks | {first}:
+            task.cancel()
+
+
+async def chat_completion(model: str, messages: list[dict], priority: int = None, **kwargs):
+    """
+    비동기 LLM 호출의 단일 진입점 (async_client.chat.completions.create 대신 사용).
+
+    - 스케줄러에서 한도를 받은 뒤 호출하고 usage로 정산
+    - 연결 오류/429/5xx는 지터 지수 백오프로 최대 LLM_MAX_RETRIES 번 재시도 (Retry-After 준수)
+    - 모델별 서킷이 열려 있으면 LLMUnavailable로 바로 실패
+    - LLM_HEDGE_ENABLED 이면 p95 지연을 넘긴 요청에 hedge 요청을 추가 (스트리밍 제외)
+
+    stream=True 이면 이벤트를 그대로 돌려주는 비동기 이터레이터를 반환 (마지막 이벤트는 choices가 비어 있을 수 있음).
+    재시도는 스트림을 여는 단계까지만 적용된다.
+    재시도로도 실패하면 마지막 예외를 그대로 올린다.
+    """
+    stream = kwargs.get("stream")
+    if stream:
+        kwargs.setdefault("stream_options", {"include_usage": True})
+    breaker = breaker_for(model)
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        breaker.before_call(model)
+        started = time.monotonic()
+        try:
+            if stream:
+                response = await _call_once(model, messages, priority, kwargs)
+            else:
+                response = await _call_hedged(model, messages, priority, kwargs)
+        except Exception as e:
+            if not is_retryable(e):
+                # 요청 자체의 문제(400 등)는 업스트림 장애가 아니므로 서킷에 반영하지 않음
+                raise
+            if attempt == LLM_MAX_RETRIES:
+                # 재시도까지 실패한 호출 하나를 실패 한 번으로 (429만 계속된 경우는 장애가 아니므로 제외)
+                if not is_rate_limited(e):
+                    breaker.record_failure()
+                raise
+            delay = backoff_delay(attempt, e)
+            if is_rate_limited(e):
+                llm_scheduler.pause(model, delay)
+            logger.warning(f"[LLM 재시도] {model} {attempt + 1}/{LLM_MAX_RETRIES}, {delay:.1f}초 후: {e}")
+            await asyncio.sleep(delay)
+            continue
+
+        breaker.record_success()
+        if not stream:
+            latency_for(model).record(time.monotonic() - started)
+        return response
+
+
+def chat_completion_sync(model: str, messages: list[dict], priority: int = None, **kwargs):
+    """chat_completion()의 동기 버전 (스레드에서 호출하는 동기 클라이언트용, 스트리밍/hedge 미지원)"""
+    breaker = breaker_for(model)
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        breaker.before_call(model)
+        charged = estimate_request_tokens(model, messages, kwargs.get("max_tokens"))
+        llm_scheduler.acquire_sync(model, charged, priority)
+        started = time.monotonic()
+        try:
+            response = client.chat.completions.create(model=model, messages=messages, **kwargs)
+        except Exception as e:
+            llm_scheduler.reconcile(model, charged, 0)
+            if not is_retryable(e):
+                raise
+            if attempt == LLM_MAX_RETRIES:
+                # 재시도까지 실패한 호출 하나를 실패 한 번으로 (429만 계속된 경우는 장애가 아니므로 제외)
+                if not is_rate_limited(e):
+                    breaker.record_failure()
+                raise
+            delay = backoff_delay(attempt, e)
+            if is_rate_limited(e):
+                llm_scheduler.pause(model, delay)
+            logger.warning(f"[LLM 재시도] {model} {attempt + 1}/{LLM_MAX_RETRIES}, {delay:.1f}초 후: {e}")
+            time.sleep(delay)
+            continue
+
+        _settle(model, charged, getattr(response, "usage", None))
+        breaker.record_success()
+        latency_for(model).record(time.monotonic() - started)
+        return response
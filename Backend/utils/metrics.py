@@ -0,0 +1,68 @@
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """
+    프로세스 안에서 누적하는 간단한 카운터 모음 (서버 재시작하면 초기화됨).
+    카운터는 이름 + 라벨(model 등)로 구분한다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def get(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def snapshot(self) -> dict:
+        """{카운터 이름: {"라벨=값,...": 누적값}} (라벨이 없으면 키는 "")"""
+        result = {}
+        with self._lock:
+            items = list(self._counters.items())
+        for (name, labels), value in sorted(items):
+            label = ",".join(f"{k}={v}" for k, v in labels)
+            result.setdefault(name, {})[label] = int(value) if float(value).is_integer() else round(value, 3)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+metrics = Metrics()
+
+
+def record_llm_usage(model: str, usage):
+    """
+    LLM 응답의 usage를 모델별로 누적.
+    prompt_tokens_details.cached_tokens는 provider의 프롬프트 prefix 캐시에 걸린 입력 토큰 수.
+    """
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    metrics.inc("llm_calls", model=model)
+    metrics.inc("llm_prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0, model=model)
+    metrics.inc("llm_cached_tokens", getattr(details, "cached_tokens", 0) or 0, model=model)
+    metrics.inc("llm_completion_tokens", getattr(usage, "completion_tokens", 0) or 0, model=model)
+
+
+def llm_prompt_cache_stats() -> dict:
+    """모델별 입력 토큰 중 prefix 캐시에 걸린 비율"""
+    prompt_tokens = metrics.snapshot().get("llm_prompt_tokens", {})
+    result = {}
+    for label, total in prompt_tokens.items():
+        model = label.split("=", 1)[1]
+        cached = metrics.get("llm_cached_tokens", model=model)
+        result[model] = {
+            "prompt_tokens": total,
+            "cached_tokens": int(cached),
+            "cached_ratio": round(cached / total, 3) if total else 0.0,
+        }
+    return result
@@ -0,0 +1,362 @@
+import os
+import json
+import time
+import hashlib
+import asyncio
+import argparse
+import subprocess
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from config import LANGUAGE_MAP
+from utils.sast import EXT_MAP, semgrep_scan_code_findings, semgrep_scan_parts, format_findings_list, _get_config_path
+from utils.sast_cache import ruleset_fingerprint
+from utils.split_utils import split_embedded
+
+REPO_SCAN_WORKERS = int(os.getenv("REPO_SCAN_WORKERS", str(os.cpu_count() or 4)))
+# 압축 해제 후 전체 크기(바이트)와 항목 수 상한 (압축 폭탄 방지)
+REPO_SCAN_MAX_EXTRACTED_BYTES = int(os.getenv("REPO_SCAN_MAX_EXTRACTED_BYTES", str(1024 * 1024 * 1024)))
+REPO_SCAN_MAX_MEMBERS = int(os.getenv("REPO_SCAN_MAX_MEMBERS", "50000"))
+# 매니페스트 중간 저장 주기 (파일 수)
+MANIFEST_SAVE_EVERY = 200
+# 확장자별로 실제 분석하는 언어 (JSP/ASPX/HTML은 나눠서 분석)
+PART_EXTS = {"jsp": ["html", "java", "js"], "aspx": ["html", "cs", "js"], "html": ["html", "js"]}
+# 분석하지 않고 건너뛸 폴더
+SKIP_DIRS = {".git", ".svn", ".idea", ".vscode", "node_modules", "__pycache__"}
+
+_executor = None
+
+
+def detect_language(path: str):
+    """
+    확장자로 분석 대상 여부와 언어명을 판단. 분석 대상이 아니면 None
+    """
+    ext = path.rsplit(".", 1)[-1].lower() if "." in path else ""
+    if ext not in EXT_MAP:
+        return None
+    return ext, LANGUAGE_MAP.get(ext, ext.upper())
+
+
+def list_source_files(root: str) -> list[str]:
+    """root 아래 분석 대상 파일의 상대 경로 목록"""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+        for name in sorted(filenames):
+            if detect_language(name):
+                files.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return files
+
+
+def scan_file(root: str, rel_path: str) -> dict:
+    """
+    파일 하나 분석 (프로세스 풀 워커에서 실행)
+    JSP/ASPX/HTML은 언어별로 나눠 semgrep 한 번으로 스캔하고 라인은 원본 파일 기준으로 돌려준다.
+    """
+    ext, language = detect_language(rel_path)
+    result = {"path": rel_path.replace(os.sep, "/"), "language": language, "findings": [], "error": None}
+    try:
+        with open(os.path.join(root, rel_path), encoding="utf-8", errors="ignore") as f:
+            code = f.read()
+
+        if ext in PART_EXTS:
+            parts = [
+                part for part in split_embedded(code, ext).values()
+                if part.ext in PART_EXTS[ext] and part.code.strip()
+            ]
+            scanned = [
+                (part.ext, format_findings_list(findings))
+                for part, findings in zip(parts, semgrep_scan_parts(parts))
+            ]
+        else:
+            scanned = [(ext, semgrep_scan_code_findings(code, ext))] if code.strip() else []
+
+        errors = []
+        for part_ext, listed in scanned:
+            if "error" in listed:
+                errors.append(f"[{part_ext}] {listed['error']}")
+                continue
+            result["findings"].extend({"part": part_ext, **finding} for finding in listed["findings"])
+        result["error"] = "\n".join(errors) or None
+
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def rules_fingerprint_for(ext: str) -> str:
+    """파일 확장자 하나를 분석할 때 쓰이는 모든 룰셋의 지문"""
+    return "+".join(ruleset_fingerprint(_get_config_path(part_ext)) for part_ext in PART_EXTS.get(ext, [ext]))
+
+
+def load_manifest(manifest_path: str, root: str) -> dict:
+    """
+    이전 분석 결과 매니페스트 로드: {"root", "files": {상대경로: {"hash", "fingerprint", "findings", "error"}}}
+    분석 폴더가 다르거나 파일이 없으면 빈 매니페스트
+    """
+    empty = {"root": os.path.realpath(root), "files": {}}
+    if not manifest_path or not os.path.exists(manifest_path):
+        return empty
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception:
+        return empty
+    if manifest.get("root") != empty["root"]:
+        return empty
+    return manifest
+
+
+def save_manifest(manifest_path: str, manifest: dict):
+    if not manifest_path:
+        return
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def git_changed_files(root: str, since_ref: str) -> list[str]:
+    """since_ref 이후 변경/추가된 파일(+추적되지 않는 새 파일)의 root 기준 상대 경로"""
+    def _git(*args):
+        out = subprocess.run(
+            ["git", "-C", root, *args], capture_output=True, text=True, encoding="utf-8", check=True
+        ).stdout
+        return [line for line in out.splitlines() if line.strip()]
+
+    changed = _git("diff", "--name-only", "--relative", since_ref, "--")
+    changed += _git("ls-files", "--others", "--exclude-standard")
+    return sorted({os.path.normpath(p) for p in changed})
+
+
+def plan_scan(root: str, manifest: dict, since_ref: str = None):
+    """
+    다시 분석할 파일과 매니페스트에서 재사용할 결과를 나눈다.
+
+    - 기본: 내용 해시나 룰셋 지문이 바뀐 파일만 다시 분석
+    - since_ref: git diff 로 바뀐 파일만 다시 분석, 나머지는 매니페스트 결과 재사용
+      (매니페스트에 없거나 룰셋 지문이 다른 파일은 git 변경 여부와 상관없이 다시 분석)
+
+    Returns:
+        (to_scan: [(상대경로, 해시, 지문)], reused: [결과 dict])
+    """
+    previous = manifest["files"]
+    all_files = list_source_files(root)
+
+    if since_ref:
+        changed = {p for p in git_changed_files(root, since_ref) if detect_language(p)}
+    else:
+        changed = None
+
+    to_scan, reused, current = [], [], set()
+    for rel_path in all_files:
+        key = rel_path.replace(os.sep, "/")
+        current.add(key)
+        old = previous.get(key)
+        ext, _ = detect_language(rel_path)
+        fingerprint = rules_fingerprint_for(ext)
+
+        # git에서 안 바뀐 파일이라도 이전 결과가 없거나(첫 실행 등) 룰셋이 바뀌었으면 다시 분석
+        if changed is not None and rel_path not in changed and old and not old.get("error") and old.get("fingerprint") == fingerprint:
+            reused.append(_manifest_result(key, old))
+            continue
+
+        digest = file_hash(os.path.join(root, rel_path))
+        if old and not old.get("error") and old.get("hash") == digest and old.get("fingerprint") == fingerprint:
+            reused.append(_manifest_result(key, old))
+        else:
+            to_scan.append((rel_path, digest, fingerprint))
+
+    # 삭제된 파일은 매니페스트에서 제거
+    for key in list(previous):
+        if key not in current:
+            del previous[key]
+    return to_scan, reused
+
+
+def _manifest_result(key: str, entry: dict) -> dict:
+    _, language = detect_language(key)
+    return {"path": key, "language": language, "findings": entry.get("findings", []), "error": entry.get("error"), "reused": True}
+
+
+def _record(manifest: dict, result: dict, digest: str, fingerprint: str):
+    manifest["files"][result["path"]] = {
+        "hash": digest,
+        "fingerprint": fingerprint,
+        "findings": result["findings"],
+        "error": result["error"],
+    }
+
+
+def _init_worker():
+    # 워커는 파일을 하나씩 처리하므로 semgrep 배치 대기 시간이 필요 없음
+    from utils.semgrep_batch import semgrep_batcher
+    semgrep_batcher.window = 0
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=REPO_SCAN_WORKERS, initializer=_init_worker)
+    return _executor
+
+
+def _file_event(result: dict, done: int, total: int) -> dict:
+    return {"event": "file", "done": done, "total": total, "reused": False, **result}
+
+
+def _done_event(done: int, rescanned: int, with_findings: int, started: float) -> dict:
+    return {
+        "event": "done",
+        "scanned": done,
+        "rescanned": rescanned,
+        "reused": done - rescanned,
+        "files_with_findings": with_findings,
+        "elapsed": round(time.time() - started, 3),
+    }
+
+
+async def scan_tree_events(root: str, manifest_path: str = None, since_ref: str = None):
+    """
+    root 아래 파일을 프로세스 풀에서 병렬 분석하며 진행 이벤트를 내보내는 비동기 제너레이터.
+    manifest_path를 주면 바뀐 파일만 다시 분석하고 나머지는 이전 결과를 재사용.
+    이벤트: start → file(재사용 결과 먼저, 이후 완료 순) → done
+    """
+    started = time.time()
+    manifest = await asyncio.to_thread(load_manifest, manifest_path, root)
+    to_scan, reused = await asyncio.to_thread(plan_scan, root, manifest, since_ref)
+    total = len(to_scan) + len(reused)
+    yield {"event": "start", "total": total, "rescan": len(to_scan), "reuse": len(reused)}
+
+    done = 0
+    with_findings = 0
+    for result in reused:
+        done += 1
+        with_findings += 1 if result["findings"] else 0
+        yield _file_event(result, done, total)
+
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+
+    async def _scan(rel_path, digest, fingerprint):
+        result = await loop.run_in_executor(executor, scan_file, root, rel_path)
+        return result, digest, fingerprint
+
+    futures = [asyncio.ensure_future(_scan(*item)) for item in to_scan]
+    try:
+        for next_done in asyncio.as_completed(futures):
+            result, digest, fingerprint = await next_done
+            _record(manifest, result, digest, fingerprint)
+            done += 1
+            with_findings += 1 if result["findings"] else 0
+            if done % MANIFEST_SAVE_EVERY == 0:
+                await asyncio.to_thread(save_manifest, manifest_path, manifest)
+            yield _file_event(result, done, total)
+    finally:
+        for future in futures:
+            future.cancel()
+        await asyncio.to_thread(save_manifest, manifest_path, manifest)
+
+    yield _done_event(done, len(to_scan), with_findings, started)
+
+
+def scan_tree(root: str, workers: int = REPO_SCAN_WORKERS, manifest_path: str = None, since_ref: str = None):
+    """scan_tree_events()의 동기 버전 (CLI용)"""
+    started = time.time()
+    manifest = load_manifest(manifest_path, root)
+    to_scan, reused = plan_scan(root, manifest, since_ref)
+    total = len(to_scan) + len(reused)
+    yield {"event": "start", "total": total, "rescan": len(to_scan), "reuse": len(reused)}
+
+    done = 0
+    with_findings = 0
+    for result in reused:
+        done += 1
+        with_findings += 1 if result["findings"] else 0
+        yield _file_event(result, done, total)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = {executor.submit(scan_file, root, rel_path): (digest, fingerprint) for rel_path, digest, fingerprint in to_scan}
+            for future in as_completed(futures):
+                result = future.result()
+                _record(manifest, result, *futures[future])
+                done += 1
+                with_findings += 1 if result["findings"] else 0
+                if done % MANIFEST_SAVE_EVERY == 0:
+                    save_manifest(manifest_path, manifest)
+                yield _file_event(result, done, total)
+    finally:
+        save_manifest(manifest_path, manifest)
+
+    yield _done_event(done, len(to_scan), with_findings, started)
+
+
+def _is_safe_member(dest: str, name: str) -> bool:
+    target = os.path.realpath(os.path.join(dest, name))
+    return target.startswith(os.path.realpath(dest) + os.sep)
+
+
+def _check_extract_limits(count: int, total_size: int):
+    if count > REPO_SCAN_MAX_MEMBERS:
+        raise ValueError(f"압축 파일 안의 항목이 너무 많습니다. (최대 {REPO_SCAN_MAX_MEMBERS}개)")
+    if total_size > REPO_SCAN_MAX_EXTRACTED_BYTES:
+        raise ValueError(f"압축을 풀면 용량이 너무 큽니다. (최대 {REPO_SCAN_MAX_EXTRACTED_BYTES // (1024 * 1024)}MB)")
+
+
+def extract_archive(archive_path: str, dest: str):
+    """
+    zip / tar(.gz, .bz2 등) 압축 해제. 폴더 밖으로 나가는 경로와 링크는 건너뜀.
+    풀기 전에 항목 수와 풀린 뒤 전체 크기를 확인해서 상한을 넘으면 ValueError.
+    (zip은 헤더의 file_size만큼만 풀리고, tar는 헤더 크기가 곧 실제 데이터 크기)
+    """
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as zf:
+            members = [m for m in zf.infolist() if _is_safe_member(dest, m.filename)]
+            _check_extract_limits(len(members), sum(m.file_size for m in members))
+            for member in members:
+                zf.extract(member, dest)
+    elif tarfile.is_tarfile(archive_path):
+        with tarfile.open(archive_path) as tf:
+            members = []
+            total_size = 0
+            # getmembers()는 목록 전체를 먼저 읽으므로 하나씩 세면서 상한을 넘으면 바로 중단
+            for m in tf:
+                if (m.isfile() or m.isdir()) and _is_safe_member(dest, m.name):
+                    members.append(m)
+                    total_size += m.size
+                    _check_extract_limits(len(members), total_size)
+            tf.extractall(dest, members=members)
+    else:
+        raise ValueError("zip 또는 tar 압축 파일만 지원합니다.")
+
+
+if __name__ == "__main__":
+    # 사용법: python -m utils.repo_scan <분석할 폴더> [-o 결과.jsonl] [--manifest 파일] [--since git-ref]
+    parser = argparse.ArgumentParser(description="폴더 전체 정적분석 (변경된 파일만 다시 분석)")
+    parser.add_argument("target_path", help="분석할 폴더")
+    parser.add_argument("-o", "--output", default="repo_scan_result.jsonl", help="결과 JSONL 파일")
+    parser.add_argument("--manifest", default="repo_scan_manifest.json", help="이전 분석 결과 매니페스트 (빈 값이면 전체 분석)")
+    parser.add_argument("--since", default=None, help="이 git ref 이후 바뀐 파일만 다시 분석")
+    parser.add_argument("--workers", type=int, default=REPO_SCAN_WORKERS)
+    args = parser.parse_args()
+
+    with open(args.output, "w", encoding="utf-8") as out:
+        for event in scan_tree(args.target_path, args.workers, args.manifest or None, args.since):
+            out.write(json.dumps(event, ensure_ascii=False) + "\n")
+            out.flush()
+            if event["event"] == "file":
+                if not event["reused"]:
+                    print(f"정적분석 진행중 : {event['done']} / {event['total']} → {event['path']} ({len(event['findings'])}건)")
+            elif event["event"] == "start":
+                print(f"🔍 총 {event['total']}개 파일 중 {event['rescan']}개 분석 시작 (재사용 {event['reuse']}개)")
+            else:
+                print(f"✅ 모든 파일 분석 완료! ({event['elapsed']}초, 결과: {args.output})")
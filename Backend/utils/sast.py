@@ -1,7 +1,10 @@
-import subprocess, tempfile, os, uuid, requests, json
-from datetime import datetime
-from utils.gpt_sidekick import format_findings_with_gpt_bulk, format_finding_with_gpt
-from utils.gpt_feedback_cache import get_gpt_feedback_cached
+import subprocess, tempfile, os, uuid, requests, asyncio
+from config import logger
+from utils.gpt_sidekick import format_findings_with_gpt_bulk
+from utils.gpt_feedback_cache import get_gpt_feedbacks_cached_async
+from utils.semgrep_batch import semgrep_batcher
+from utils.sast_cache import sast_cache
+from utils.split_utils import EmbeddedPart
 
 SEM_GREP_RULES_PATH = "D:/003_Develop/05_Python/97.semgrep-rules/"  # 최상위 rules 폴더
 SEM_GREP_RULES_PATH_GPT_REPLACE = "D.003_Develop.05_Python.97.semgrep-rules."
@@ -31,56 +34,127 @@ def _get_config_path(ext):
     return SEM_GREP_RULES_PATH
 
 
+def _run_semgrep(code: str, ext: str) -> dict:
+    """
+    semgrep 스캔 공통 진입점. 같은 코드/룰셋 결과가 캐시에 있으면 재사용하고,
+    없으면 배치 스케줄러를 통해 다른 요청과 묶어서 실행.
+
+    Returns:
+        dict: semgrep JSON 결과 (실행 실패 시 {"error": stderr})
+    """
+    return _run_semgrep_many([(code, ext)])[0]
+
+
+def _rule_matches_ext(result: dict, ext: str) -> bool:
+    """
+    여러 룰셋을 한 번에 돌리면 모든 룰이 모든 파일에 적용되므로(generic 룰 등),
+    결과 룰이 이 언어의 룰 폴더 소속인지 check_id(룰 파일 경로 기반)로 확인.
+    """
+    rule_subdir = RULE_LANG_MAP.get(ext)
+    check_id = result.get("check_id", "")
+    if not rule_subdir or SEM_GREP_RULES_PATH_GPT_REPLACE not in check_id:
+        return True
+    return check_id.replace(SEM_GREP_RULES_PATH_GPT_REPLACE, "").split(".")[0] == rule_subdir
+
+
+def _run_semgrep_many(items: list[tuple[str, str]]) -> list[dict]:
+    """
+    (code, ext) 여러 개를 캐시에 없는 것만 모아 semgrep 한 번으로 스캔.
+
+    Returns:
+        list[dict]: items 순서대로 semgrep JSON 결과 (실행 실패 시 {"error": stderr})
+    """
+    results = [None] * len(items)
+    misses = []
+    for idx, (code, ext) in enumerate(items):
+        if sast_cache:
+            cached = sast_cache.get(code, ext, _get_config_path(ext))
+            if cached is not None:
+                results[idx] = cached
+                continue
+        misses.append(idx)
+
+    scanned = semgrep_batcher.scan_group([
+        (items[idx][0], EXT_MAP.get(items[idx][1], f"main.{items[idx][1]}"), _get_config_path(items[idx][1]))
+        for idx in misses
+    ])
+    multi_config = len({_get_config_path(items[idx][1]) for idx in misses}) > 1
+
+    for idx, findings in zip(misses, scanned):
+        code, ext = items[idx]
+        # 실행 오류는 캐싱하지 않음
+        if "error" not in findings:
+            if multi_config:
+                findings = {**findings, "results": [r for r in findings["results"] if _rule_matches_ext(r, ext)]}
+            if sast_cache:
+                sast_cache.set(code, ext, _get_config_path(ext), findings)
+        results[idx] = findings
+    return results
+
+
+def _to_source_lines(findings: dict, part: EmbeddedPart) -> dict:
+    """분리된 코드 기준 라인 번호를 원본 파일 기준으로 변환 (캐시된 결과는 건드리지 않도록 복사)"""
+    if "error" in findings:
+        return findings
+
+    def remap(result: dict) -> dict:
+        result = dict(result)
+        for key in ("start", "end"):
+            position = result.get(key)
+            if isinstance(position, dict) and isinstance(position.get("line"), int):
+                result[key] = {**position, "line": part.to_source_line(position["line"])}
+        return result
+
+    return {**findings, "results": [remap(r) for r in findings.get("results", [])]}
+
+
+def semgrep_scan_parts(parts: list[EmbeddedPart]) -> list[dict]:
+    """
+    JSP/ASPX/HTML에서 분리한 언어별 코드를 semgrep 한 번으로 스캔하고,
+    결과 라인 번호를 원본 파일 기준으로 바꿔서 반환.
+
+    Returns:
+        list[dict]: parts 순서대로 semgrep JSON 결과 (실행 실패 시 {"error": stderr})
+    """
+    scanned = _run_semgrep_many([(part.code, part.ext) for part in parts])
+    return [_to_source_lines(findings, part) for findings, part in zip(scanned, parts)]
+
+
 def semgrep_scan_code_detail(code: str, ext: str) -> str:
-    config_path = _get_config_path(ext)
-    now = datetime.now()
-    current_time = now.strftime("%H:%M:%S")
-    
-    filename = EXT_MAP.get(ext, f"main.{ext}")
+    logger.info(f"룰 경로 : {_get_config_path(ext)}")
 
-    print(f"룰 경로({current_time}) : {config_path}")
+    findings = _run_semgrep(code, ext)
 
-    with tempfile.TemporaryDirectory() as tempdir:
-        src_path = os.path.join(tempdir, filename)
-        with open(src_path, "w", encoding="utf-8") as f:
-            f.write(code)
+    if "error" in findings:
+        return "[Semgrep 실행 오류]\n" + findings["error"]
 
-        scan = subprocess.run(
-            ["semgrep", f"--config={config_path}", "--json", src_path],
-            capture_output=True, text=True, encoding="utf-8"
+    try:
+        results = findings.get("results", [])
+        parse_time = (
+            findings.get("time", {})
+            .get("profiling_times", {})
+            .get("total_time", 0.0)
         )
+        parseTime = f"\n⏱️ 분석 소요 시간: {parse_time:.3f}초"
 
-        if scan.returncode != 0 and not scan.stdout:
-            return "[Semgrep 실행 오류]\n" + scan.stderr
+        if not results:
+            return f"[✅ 취약점 없음]\n이 파일에는 Semgrep 룰셋에 해당하는 보안 이슈가 발견되지 않았습니다.{parseTime}"
 
-        try:
-            findings = json.loads(scan.stdout)
-            results = findings.get("results", [])
-            parse_time = (
-                findings.get("time", {})
-                .get("profiling_times", {})
-                .get("total_time", 0.0)
-            )
-            parseTime = f"\n⏱️ 분석 소요 시간: {parse_time:.3f}초"
-
-            if not results:
-                return f"[✅ 취약점 없음]\n이 파일에는 Semgrep 룰셋에 해당하는 보안 이슈가 발견되지 않았습니다.{parseTime}"
-
-            formatted = []
-            for r in results:
-                extra = r.get("extra", {})
-                meta = extra.get("metadata", {})
-                formatted.append(f"""🔢 라인: {r['start'].get('line', '?')}
+        formatted = []
+        for r in results:
+            extra = r.get("extra", {})
+            meta = extra.get("metadata", {})
+            formatted.append(f"""🔢 라인: {r['start'].get('line', '?')}
 ⚠️ 심각도: {extra.get('severity', '정보없음')}
 💬 설명: {extra.get('message', 'No message')}
 📚 관련: {", ".join(meta.get('cwe', []) + meta.get('owasp', []))}
 🔗 링크:
 {chr(10).join(meta.get('references', [])) if meta.get('references') else '-'}{parseTime}
 """)
-            return "\n---\n".join(formatted)
+        return "\n---\n".join(formatted)
 
-        except Exception as e:
-            return "[Semgrep 결과 파싱 오류]\n" + str(e)
+    except Exception as e:
+        return "[Semgrep 결과 파싱 오류]\n" + str(e)
 
 def semgrep_scan_code_detail_with_gpt(
     code: str,
@@ -88,167 +162,202 @@ def semgrep_scan_code_detail_with_gpt(
     use_gpt: bool = False,
     gpt_model: str = "gpt-3.5-turbo"
 ) -> dict:
-    config_path = _get_config_path(ext)
-    now = datetime.now()
-    current_time = now.strftime("%H:%M:%S")    
-    filename = EXT_MAP.get(ext, f"main.{ext}")
+    """
+    동기 호출용(스크립트 등). GPT 피드백은 format_findings_detail_with_gpt_async()와 같은 경로로 받는다.
+    이벤트 루프 안에서는 format_findings_detail_with_gpt_async()를 직접 사용할 것.
+    """
+    logger.info(f"룰 경로 : {_get_config_path(ext)}")
 
-    print(f"룰 경로({current_time}) : {config_path}")
+    findings_json = _run_semgrep(code, ext)
+    return asyncio.run(format_findings_detail_with_gpt_async([findings_json], use_gpt, gpt_model))[0]
 
-    with tempfile.TemporaryDirectory() as tempdir:
-        src_path = os.path.join(tempdir, filename)
-        with open(src_path, "w", encoding="utf-8") as f:
-            f.write(code)
 
-        scan = subprocess.run(
-            ["semgrep", f"--config={config_path}", "--json", src_path],
-            capture_output=True, text=True, encoding="utf-8"
+# ⭐️ 무시할 메시지 정의
+IGNORE_MESSAGES = [
+    "This page denies crawlers from indexing the page. Remove the robots 'meta' tag.",
+    "found alert() call; should this be in production code?"
+]
+
+
+def _filter_ignored(results: list) -> list:
+    return [
+        r for r in results
+        if not any(ignored in r.get("extra", {}).get("message", "") for ignored in IGNORE_MESSAGES)
+    ]
+
+
+def finding_summaries_for_gpt(findings_json: dict) -> list[str]:
+    """GPT 피드백을 요청할 '[rule] message' 목록 (format_findings_detail_with_gpt의 결과 순서와 동일)"""
+    if "error" in findings_json:
+        return []
+    summaries = []
+    for r in _filter_ignored(findings_json.get("results", [])):
+        rule = r.get("check_id", "").replace(SEM_GREP_RULES_PATH_GPT_REPLACE, "")
+        message = r.get("extra", {}).get("message", "No message")
+        summaries.append(f"[{rule}] {message}")
+    return summaries
+
+
+def format_findings_detail_with_gpt(
+    findings_json: dict,
+    use_gpt: bool = False,
+    gpt_model: str = "gpt-3.5-turbo",
+    gpt_feedbacks: list[str] = None
+) -> dict:
+    """
+    semgrep JSON 결과를 상세 텍스트 목록(+GPT 개선 제안)으로 변환.
+    GPT는 호출하지 않는다. use_gpt면 format_findings_detail_with_gpt_async()가 미리 받아 둔 피드백을
+    gpt_feedbacks로 넘긴다. (없거나 모자라면 생성 실패로 표시)
+    """
+    if "error" in findings_json:
+        return {"error": "[Semgrep 실행 오류]", "details": findings_json["error"]}
+
+    try:
+        results = findings_json.get("results", [])
+        parse_time = (
+            findings_json.get("time", {})
+            .get("profiling_times", {})
+            .get("total_time", 0.0)
         )
 
-        #print("====1====")
-        if scan.returncode != 0 and not scan.stdout:
-            return {"error": "[Semgrep 실행 오류]", "details": scan.stderr}
+        if not results:
+            return {
+                "results": [f"[✅ 취약점 없음]\n이 파일에는 Semgrep 룰셋에 해당하는 보안 이슈가 발견되지 않았습니다."],
+                "parse_time": parse_time
+            }
 
-        #print("====2====")
-        try:
-            #print("====3====")
-            findings_json = json.loads(scan.stdout)
-            results = findings_json.get("results", [])
-            parse_time = (
-                findings_json.get("time", {})
-                .get("profiling_times", {})
-                .get("total_time", 0.0)
-            )
-
-            #print("====4====")
-
-            if not results:
-                return {
-                    "results": [f"[✅ 취약점 없음]\n이 파일에는 Semgrep 룰셋에 해당하는 보안 이슈가 발견되지 않았습니다."],
-                    "parse_time": parse_time
-                }
-
-            #print("====5====")
-
-            # ⭐️ 무시할 메시지 정의
-            IGNORE_MESSAGES = [
-                "This page denies crawlers from indexing the page. Remove the robots 'meta' tag.",
-                "found alert() call; should this be in production code?"
-            ]
-
-            # ✅ 필터링 적용
-            filtered_results = []
-            for r in results:
-                message = r.get("extra", {}).get("message", "")
-                if any(ignored in message for ignored in IGNORE_MESSAGES):
-                    continue  # 제외
-                filtered_results.append(r)
-
-            # ✅ results 변수 교체
-            results = filtered_results
-
-            if not results:
-                return {
-                    "results": [f"[✅ 취약점 없음]\n모든 결과가 필터링되어 취약점이 남지 않았습니다."],
-                    "parse_time": parse_time
-                }
-
-            finding_summaries = []
-            for r in results:
-                rule = r.get("check_id", "").replace(SEM_GREP_RULES_PATH_GPT_REPLACE, "")
-                path = r.get("path", "")
-                line = r.get("start", {}).get("line", "?")
-                message = r.get("extra", {}).get("message", "No message")
-                #finding_summaries.append(f"[{rule}] {path}:{line} - {message}")
-                finding_summaries.append(f"[{rule}] {message}")
-                #print(f"====5-{line}====")
-                #print(f"[{rule}] {message}")
-
-            #print("====6====")
-
-            # GPT 피드백 생성
-            #gpt_feedbacks = []
-
-            #if use_gpt:
-                #gpt_feedbacks = format_findings_with_gpt_bulk(finding_summaries, gpt_model)
-
-            #print("====7====")
-
-            # 포맷 텍스트 생성
-            formatted_results = []
-            for idx, r in enumerate(results):
-                extra = r.get("extra", {})
-                meta = extra.get("metadata", {})
-                links = r.get("extra", {}).get("metadata", {}).get("references", [])
-
-                base_text = f"""🔢 라인: {r['start'].get('line', '?')}
+        # ✅ 필터링 적용
+        results = _filter_ignored(results)
+
+        if not results:
+            return {
+                "results": [f"[✅ 취약점 없음]\n모든 결과가 필터링되어 취약점이 남지 않았습니다."],
+                "parse_time": parse_time
+            }
+
+        gpt_feedbacks = gpt_feedbacks or []
+
+        # 포맷 텍스트 생성
+        formatted_results = []
+        for idx, r in enumerate(results):
+            extra = r.get("extra", {})
+            meta = extra.get("metadata", {})
+            links = r.get("extra", {}).get("metadata", {}).get("references", [])
+
+            base_text = f"""🔢 라인: {r['start'].get('line', '?')}
 ⚠️ 심각도: {extra.get('severity', '정보없음')}
 💬 설명: {extra.get('message', 'No message')}
 📚 관련: {", ".join(meta.get('cwe', []) + meta.get('owasp', []))}
 🔗 링크:
 {chr(10).join(links) if links else '-'}
 """
-                #일괄로 불러오는게 잘 안되어서 건바이건으로 처리
-                #if use_gpt and idx < len(gpt_feedbacks):
-                    #base_text += f"\n✍️ GPT 개선 제안:\n{gpt_feedbacks[idx]}"
-                if use_gpt:
-                    #base_text += f"\n✍️ GPT 개선 제안:\n{format_finding_with_gpt(finding_summaries[idx], gpt_model)}"
-                    feedback = get_gpt_feedback_cached(finding_summaries[idx],gpt_model,format_finding_with_gpt)
-                    base_text += f"\n✍️ GPT 개선 제안:\n{feedback}"
-                
-                #print(f"{base_text}")
-
-                formatted_results.append(base_text)
-            
-            #print("====8====")
-            return {
-                "results": formatted_results,
-                "parse_time": parse_time
-            }
+            if use_gpt:
+                feedback = gpt_feedbacks[idx] if idx < len(gpt_feedbacks) else ""
+                base_text += f"\n✍️ GPT 개선 제안:\n{feedback or '[GPT 피드백 생성 실패 - 다시 요청하면 재시도합니다]'}"
 
-        except Exception as e:
-            formatted_results = []
-            formatted_results.append(f"❌ 오류 메시지\n{str(e)}")
-            return {
-                "results": formatted_results,
-                "parse_time": 0
-            }
+            formatted_results.append(base_text)
 
-def semgrep_scan_code(code: str, ext: str) -> str:
-    config_path = _get_config_path(ext)
-    print(f"룰 경로 : {config_path}")
+        return {
+            "results": formatted_results,
+            "parse_time": parse_time
+        }
 
-    filename = EXT_MAP.get(ext, f"main.{ext}")
-    with tempfile.TemporaryDirectory() as tempdir:
-        src_path = os.path.join(tempdir, filename)
-        with open(src_path, "w", encoding="utf-8") as f:
-            f.write(code)
+    except Exception as e:
+        formatted_results = []
+        formatted_results.append(f"❌ 오류 메시지\n{str(e)}")
+        return {
+            "results": formatted_results,
+            "parse_time": 0
+        }
 
-        scan = subprocess.run(
-            ["semgrep", f"--config={config_path}", "--json", src_path],
-            capture_output=True, text=True, encoding="utf-8"
+
+async def format_findings_detail_with_gpt_async(
+    findings_list: list[dict],
+    use_gpt: bool = False,
+    gpt_model: str = "gpt-3.5-turbo"
+) -> list[dict]:
+    """
+    여러 semgrep 결과(JSP의 언어별 결과 등)를 format_findings_detail_with_gpt()로 변환.
+    GPT 피드백은 모든 결과의 finding을 모아 비동기로 동시에 요청하므로
+    전체 대기 시간은 가장 느린 요청 하나 정도로 끝난다.
+    """
+    feedbacks_per_result = [None] * len(findings_list)
+    if use_gpt:
+        summaries = [finding_summaries_for_gpt(findings) for findings in findings_list]
+        flat = await get_gpt_feedbacks_cached_async(
+            [summary for part in summaries for summary in part], gpt_model, format_findings_with_gpt_bulk
         )
+        pos = 0
+        for idx, part in enumerate(summaries):
+            feedbacks_per_result[idx] = flat[pos:pos + len(part)]
+            pos += len(part)
 
-        if scan.returncode != 0 and not scan.stdout:
-            return "[Semgrep 실행 오류]\n" + scan.stderr
+    return [
+        format_findings_detail_with_gpt(findings, use_gpt, gpt_model, feedbacks)
+        for findings, feedbacks in zip(findings_list, feedbacks_per_result)
+    ]
 
-        try:
-            findings = json.loads(scan.stdout)
-            results = findings.get("results", [])
-            if not results:
-                return "[Semgrep 취약점 없음]"
 
-            summary = ""
-            for r in results:
-                extra = r.get("extra", {})
-                line = r.get("start", {}).get("line", "?")
-                message = extra.get("message", "No message")
-                summary += f"\n[라인: {line}] {message}\n"
+def semgrep_scan_json(code: str, ext: str) -> dict:
+    """semgrep JSON 결과 그대로 반환 (캐시/배치 적용, 실행 실패 시 {"error": stderr})"""
+    logger.info(f"룰 경로 : {_get_config_path(ext)}")
+    return _run_semgrep(code, ext)
 
-            return summary.strip()
 
-        except Exception as e:
-            return "[Semgrep 결과 파싱 오류] " + str(e)
+def semgrep_scan_code(code: str, ext: str) -> str:
+    logger.info(f"룰 경로 : {_get_config_path(ext)}")
+    return format_findings_summary(_run_semgrep(code, ext))
+
+
+def format_findings_summary(findings: dict) -> str:
+    """semgrep JSON 결과를 "[라인: N] 메시지" 형식의 요약 텍스트로 변환"""
+    if "error" in findings:
+        return "[Semgrep 실행 오류]\n" + findings["error"]
+
+    try:
+        results = findings.get("results", [])
+        if not results:
+            return "[Semgrep 취약점 없음]"
+
+        summary = ""
+        for r in results:
+            extra = r.get("extra", {})
+            line = r.get("start", {}).get("line", "?")
+            message = extra.get("message", "No message")
+            summary += f"\n[라인: {line}] {message}\n"
+
+        return summary.strip()
+
+    except Exception as e:
+        return "[Semgrep 결과 파싱 오류] " + str(e)
+
+def semgrep_scan_code_findings(code: str, ext: str) -> dict:
+    """
+    semgrep 결과를 텍스트가 아닌 구조화된 목록으로 반환 (폴더/압축 파일 일괄 분석용)
+
+    Returns:
+        dict: {"findings": [{"line", "severity", "rule", "message"}, ...]}
+              실행 실패 시 {"error": ...}
+    """
+    return format_findings_list(_run_semgrep(code, ext))
+
+
+def format_findings_list(findings: dict) -> dict:
+    """semgrep JSON 결과를 {"findings": [...]} 목록으로 변환 (실행 실패 시 {"error": ...})"""
+    if "error" in findings:
+        return {"error": findings["error"]}
+
+    return {
+        "findings": [
+            {
+                "line": r.get("start", {}).get("line"),
+                "severity": r.get("extra", {}).get("severity", ""),
+                "rule": r.get("check_id", "").replace(SEM_GREP_RULES_PATH_GPT_REPLACE, ""),
+                "message": r.get("extra", {}).get("message", "No message"),
+            }
+            for r in findings.get("results", [])
+        ]
+    }
 
 def sonarqube_scan_java_code(code: str, sonar_host: str, sonar_token: str) -> str:
     sonar_project = f"upload-{uuid.uuid4()}"
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from utils.cache_store import LRUCache, SqliteLRUCache
+
+SAST_CACHE_ENABLED = os.getenv("SAST_CACHE_ENABLED", "true").lower() in ["true", "1", "yes"]
+SAST_CACHE_DB = os.getenv("SAST_CACHE_DB", "sast_cache.sqlite3")
+SAST_CACHE_MEMORY_ITEMS = int(os.getenv("SAST_CACHE_MEMORY_ITEMS", "256"))
+SAST_CACHE_MAX_BYTES = int(os.getenv("SAST_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+# 룰 폴더를 다시 훑어보는 주기(초). 이 시간 안에는 직전 지문을 그대로 사용
+RULESET_RECHECK_SECONDS = float(os.getenv("RULESET_RECHECK_SECONDS", "5"))
+
+_fingerprint_lock = threading.Lock()
+# config_path -> (파일 stat 목록, 지문, 마지막 확인 시각)
+_fingerprints: dict[str, tuple] = {}
+# (파일 경로, mtime_ns, size) -> 내용 해시
+_file_hashes: dict[tuple, str] = {}
+
+
+def _file_hash(path: str, mtime_ns: int, size: int) -> str:
+    key = (path, mtime_ns, size)
+    if key not in _file_hashes:
+        with open(path, "rb") as f:
+            _file_hashes[key] = hashlib.sha256(f.read()).hexdigest()
+    return _file_hashes[key]
+
+
+def ruleset_fingerprint(config_path: str) -> str:
+    """
+    config_path 아래 룰 파일들의 (상대경로, mtime, 내용 해시)로 만든 지문.
+    룰 파일이 추가/수정/삭제되면 값이 바뀐다.
+    """
+    now = time.time()
+    with _fingerprint_lock:
+        cached = _fingerprints.get(config_path)
+        if cached and now - cached[2] < RULESET_RECHECK_SECONDS:
+            return cached[1]
+
+        stats = []
+        if os.path.isfile(config_path):
+            st = os.stat(config_path)
+            stats.append((config_path, os.path.basename(config_path), st.st_mtime_ns, st.st_size))
+        else:
+            for root, dirs, files in os.walk(config_path):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    st = os.stat(path)
+                    stats.append((path, os.path.relpath(path, config_path), st.st_mtime_ns, st.st_size))
+
+        if cached and cached[0] == stats:
+            _fingerprints[config_path] = (stats, cached[1], now)
+            return cached[1]
+
+        h = hashlib.sha256()
+        for path, rel_path, mtime_ns, size in stats:
+            h.update(f"{rel_path}:{mtime_ns}:{_file_hash(path, mtime_ns, size)}\n".encode("utf-8"))
+        fingerprint = h.hexdigest()
+        _fingerprints[config_path] = (stats, fingerprint, now)
+        return fingerprint
+
+
+class SastResultCache:
+    """
+    semgrep 결과 캐시. 키 = (ext, 코드 SHA-256, 룰셋 지문)
+    인메모리 LRU + SQLite(용량 기준 LRU 제거) 2단계 구성.
+
+    어떤 언어의 룰셋 지문이 바뀌면 그 언어(ext)의 이전 항목만 제거한다.
+    """
+
+    def __init__(self, db_path: str, memory_items: int, max_bytes: int):
+        self.memory = LRUCache(memory_items)
+        self.disk = SqliteLRUCache(db_path, "sast_results", max_bytes)
+        self._versions: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, code: str, ext: str, config_path: str) -> tuple:
+        fingerprint = ruleset_fingerprint(config_path)
+        with self._lock:
+            previous = self._versions.get(ext)
+            self._versions[ext] = fingerprint
+        if previous != fingerprint:
+            # 룰이 바뀐 언어의 이전 결과만 무효화
+            self.memory.delete_if(lambda k: k[0] == ext and k[2] != fingerprint)
+            self.disk.purge_stale(ext, fingerprint)
+        code_hash = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        return (ext, code_hash, fingerprint)
+
+    def get(self, code: str, ext: str, config_path: str):
+        key = self._key(code, ext, config_path)
+        findings = self.memory.get(key)
+        if findings is not None:
+            return findings
+
+        raw = self.disk.get(":".join(key))
+        if raw is None:
+            return None
+        findings = json.loads(raw)
+        self.memory.set(key, findings)
+        return findings
+
+    def set(self, code: str, ext: str, config_path: str, findings: dict):
+        key = self._key(code, ext, config_path)
+        self.memory.set(key, findings)
+        self.disk.set(":".join(key), json.dumps(findings, ensure_ascii=False), tag=ext, version=key[2])
+
+    def clear(self):
+        self.memory.clear()
+        self.disk.clear()
+
+
+sast_cache = SastResultCache(SAST_CACHE_DB, SAST_CACHE_MEMORY_ITEMS, SAST_CACHE_MAX_BYTES) if SAST_CACHE_ENABLED else None
@@ -0,0 +1,216 @@
+import os
+import json
+import tempfile
+import threading
+import subprocess
+from config import logger
+from utils.cancellation import current_cancel_token, RequestCancelled
+from utils.metrics import metrics
+
+# 스캔 요청을 모으는 시간(초). 이 시간 동안 들어온 요청은 semgrep 한 번으로 처리
+SEMGREP_BATCH_WINDOW = float(os.getenv("SEMGREP_BATCH_WINDOW", "0.3"))
+# 한 번의 semgrep 실행에 넣을 최대 파일 수 (넘으면 즉시 실행)
+SEMGREP_BATCH_MAX_FILES = int(os.getenv("SEMGREP_BATCH_MAX_FILES", "64"))
+
+
+class _ScanRequest:
+    def __init__(self, code: str, filename: str):
+        self.code = code
+        self.filename = filename
+        self.done = threading.Event()
+        self.result: dict = {}
+        self.cancelled = False
+
+
+def _merge_configs(config_paths) -> tuple:
+    """중복/포함 관계(상위 폴더가 하위 폴더를 포함)인 룰 경로를 정리해 정렬된 튜플로"""
+    by_norm = {os.path.normpath(path): path for path in config_paths}
+    merged = []
+    for norm in sorted(by_norm):
+        if not any(norm == parent or norm.startswith(parent + os.sep) for parent in merged):
+            merged.append(norm)
+    # semgrep 룰 ID(check_id)가 경로 표기를 따르므로 원래 문자열 그대로 넘김
+    return tuple(by_norm[norm] for norm in merged)
+
+
+class SemgrepBatcher:
+    """
+    여러 요청의 semgrep 스캔을 짧은 시간(window) 동안 모아서
+    룰 설정(config) 조합별로 semgrep 프로세스를 한 번만 실행하는 스케줄러.
+
+    각 요청의 코드는 하나의 임시 폴더 아래 req<N>/<파일명> 으로 저장되고,
+    semgrep JSON 결과의 path 값으로 요청별 결과를 다시 나눠 돌려준다.
+    JSP처럼 언어가 섞인 업로드는 scan_group으로 여러 파일을 여러 룰셋과 함께 한 번에 스캔한다.
+
+    요청의 클라이언트 연결이 끊기면(취소 토큰) 대기열의 파일은 빼고,
+    실행 중인 semgrep은 같은 실행에 묶인 요청이 모두 취소됐을 때만 종료한다.
+    """
+
+    def __init__(self, window: float = SEMGREP_BATCH_WINDOW, max_files: int = SEMGREP_BATCH_MAX_FILES):
+        self.window = window
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._pending: dict[tuple, list[_ScanRequest]] = {}
+        self._timers: dict[tuple, threading.Timer] = {}
+        self._running: dict[int, tuple] = {}  # id(batch) → (batch, semgrep 프로세스)
+        self.spawn_count = 0
+
+    def scan(self, code: str, filename: str, config_path: str) -> dict:
+        """
+        코드 하나를 스캔 대기열에 넣고 결과가 나올 때까지 기다린다. (블로킹)
+
+        Returns:
+            dict: 해당 파일에 대한 semgrep JSON ({"results", "errors", "time"})
+                  semgrep 실행 자체가 실패하면 {"error": stderr}
+        """
+        return self.scan_group([(code, filename, config_path)])[0]
+
+    def scan_group(self, items: list[tuple[str, str, str]]) -> list[dict]:
+        """
+        (code, filename, config_path) 여러 개를 같은 semgrep 실행에 넣고 모두 끝날 때까지 기다린다.
+        semgrep은 모든 룰셋을 모든 파일에 적용하므로, 룰셋별 결과 구분은 호출하는 쪽에서 한다.
+
+        Returns:
+            list[dict]: items 순서대로 scan()과 같은 형식의 결과
+
+        Raises:
+            RequestCancelled: 기다리는 중에 현재 요청의 연결이 끊긴 경우
+        """
+        if not items:
+            return []
+        requests = [_ScanRequest(code, filename) for code, filename, _ in items]
+        key = _merge_configs(config_path for _, _, config_path in items)
+        flush_now = False
+
+        with self._lock:
+            batch = self._pending.setdefault(key, [])
+            was_empty = not batch
+            batch.extend(requests)
+            if len(batch) >= self.max_files:
+                flush_now = True
+            elif was_empty:
+                timer = threading.Timer(self.window, self._flush, args=(key,))
+                timer.daemon = True
+                self._timers[key] = timer
+                timer.start()
+
+        if flush_now:
+            self._flush(key)
+
+        token = current_cancel_token()
+        on_cancel = lambda: self.cancel(requests)
+        if token is not None:
+            token.add_callback(on_cancel)
+        try:
+            for request in requests:
+                request.done.wait()
+        finally:
+            if token is not None:
+                token.remove_callback(on_cancel)
+        if any(request.cancelled for request in requests):
+            raise RequestCancelled("클라이언트 연결 종료로 semgrep 스캔 취소")
+        return [request.result for request in requests]
+
+    def cancel(self, requests: list[_ScanRequest]):
+        """요청들을 대기열에서 빼고, 실행 중인 semgrep에 남은 요청이 없으면 프로세스를 종료"""
+        with self._lock:
+            for request in requests:
+                request.cancelled = True
+            for key, batch in list(self._pending.items()):
+                kept = [request for request in batch if not request.cancelled]
+                if len(kept) == len(batch):
+                    continue
+                metrics.inc("cancelled_semgrep_files", len(batch) - len(kept))
+                if kept:
+                    self._pending[key] = kept
+                else:
+                    del self._pending[key]
+                    timer = self._timers.pop(key, None)
+                    if timer:
+                        timer.cancel()
+            procs = [proc for batch, proc in self._running.values() if all(request.cancelled for request in batch)]
+        for proc in procs:
+            proc.kill()
+            metrics.inc("cancelled_semgrep_runs")
+        for request in requests:
+            request.done.set()
+
+    def _flush(self, key: tuple):
+        with self._lock:
+            batch = self._pending.pop(key, [])
+            timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        if not batch:
+            return
+
+        try:
+            self._run_batch(key, batch)
+        except Exception as e:
+            for request in batch:
+                if not request.done.is_set():
+                    request.result = {"error": str(e)}
+        finally:
+            for request in batch:
+                request.done.set()
+
+    def _run_batch(self, config_paths: tuple, batch: list[_ScanRequest]):
+        batch = [request for request in batch if not request.cancelled]
+        if not batch:
+            return
+        with tempfile.TemporaryDirectory() as tempdir:
+            by_path: dict[str, _ScanRequest] = {}
+            for idx, request in enumerate(batch):
+                rel_path = os.path.join(f"req{idx}", request.filename)
+                os.makedirs(os.path.join(tempdir, f"req{idx}"))
+                with open(os.path.join(tempdir, rel_path), "w", encoding="utf-8") as f:
+                    f.write(request.code)
+                by_path[os.path.normpath(rel_path)] = request
+
+            logger.info(f"[Semgrep 배치] 룰 경로: {', '.join(config_paths)}, 파일 {len(batch)}개")
+            self.spawn_count += 1
+            proc = subprocess.Popen(
+                ["semgrep", *(f"--config={path}" for path in config_paths), "--json", *by_path.keys()],
+                cwd=tempdir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding="utf-8"
+            )
+            with self._lock:
+                self._running[id(batch)] = (batch, proc)
+                abandoned = all(request.cancelled for request in batch)
+            if abandoned:
+                # 대기열에서 꺼내는 사이에 모두 취소됨
+                proc.kill()
+                metrics.inc("cancelled_semgrep_runs")
+            try:
+                stdout, stderr = proc.communicate()
+            finally:
+                with self._lock:
+                    self._running.pop(id(batch), None)
+
+        if all(request.cancelled for request in batch):
+            return
+
+        if proc.returncode != 0 and not stdout:
+            for request in batch:
+                request.result = {"error": stderr}
+            return
+
+        try:
+            findings = json.loads(stdout)
+        except Exception as e:
+            for request in batch:
+                request.result = {"error": f"[Semgrep 결과 파싱 오류] {e}"}
+            return
+
+        for request in batch:
+            request.result = {"results": [], "errors": [], "time": findings.get("time", {})}
+
+        # path 기준으로 요청별 결과 분배
+        for key in ("results", "errors"):
+            for item in findings.get(key, []):
+                request = by_path.get(os.path.normpath(item.get("path", "")))
+                if request:
+                    request.result[key].append(item)
+
+
+# 프로세스 전체에서 공유하는 스케줄러
+semgrep_batcher = SemgrepBatcher()
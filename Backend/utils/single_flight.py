@@ -0,0 +1,150 @@
+import os
+import asyncio
+import hashlib
+from config import logger
+from utils.cache_store import LRUCache
+from utils.cancellation import CancelToken, use_cancel_token
+from utils.metrics import metrics
+
+# 끝난 결과를 이 시간(초) 동안 같은 요청에 재사용. 0이면 진행 중인 요청끼리만 공유하고 끝나면 바로 버림
+SINGLE_FLIGHT_CACHE_TTL = float(os.getenv("SINGLE_FLIGHT_CACHE_TTL", "0"))
+SINGLE_FLIGHT_CACHE_ITEMS = int(os.getenv("SINGLE_FLIGHT_CACHE_ITEMS", "64"))
+
+
+def flight_key(endpoint: str, content: bytes, ext: str, model: str, **options) -> tuple:
+    """(endpoint, 업로드 내용 SHA-256, 확장자, 모델, 옵션) - 파일 이름은 결과에 영향이 없으므로 제외"""
+    return (endpoint, hashlib.sha256(content).hexdigest(), ext, model, tuple(sorted(options.items())))
+
+
+class _Flight:
+    """진행 중인 공유 작업 하나. 스트리밍이면 지금까지 나온 값을 items에 모아 둔다"""
+
+    def __init__(self, cacheable):
+        self.cacheable = cacheable
+        self.token = CancelToken()
+        self.task = None
+        self.waiters = 0
+        self.items = []
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """
+    같은 키로 동시에 들어온 요청들이 작업 하나를 함께 기다리게 한다.
+
+    - 작업은 요청과 분리된 task에서 자체 취소 토큰으로 실행 (처음 요청한 쪽이 끊겨도 나머지는 결과를 받음)
+    - 기다리는 요청이 모두 떠나면 작업을 취소 (남은 LLM 호출 취소, semgrep 프로세스 종료)
+    - 작업이 끝나면 바로 목록에서 빠진다. cache_ttl > 0이면 성공한 결과만 그 시간 동안 재사용
+    """
+
+    def __init__(self, cache_ttl: float = SINGLE_FLIGHT_CACHE_TTL, cache_items: int = SINGLE_FLIGHT_CACHE_ITEMS):
+        self._flights: dict[tuple, _Flight] = {}
+        self.cache = LRUCache(cache_items, ttl=cache_ttl) if cache_ttl > 0 else None
+
+    def in_flight(self, key: tuple) -> bool:
+        """같은 키의 작업이 진행 중인지 (합류하면 새 작업 없이 결과를 받음)"""
+        return key in self._flights
+
+    def _join(self, key: tuple, start, cacheable) -> _Flight:
+        flight = self._flights.get(key)
+        if flight is not None:
+            metrics.inc("single_flight_requests", endpoint=key[0], outcome="joined")
+            logger.info(f"[요청 합치기] {key[0]} 진행 중인 동일 요청에 합류 (함께 대기 {flight.waiters + 1}건)")
+        else:
+            metrics.inc("single_flight_requests", endpoint=key[0], outcome="leader")
+            flight = self._flights[key] = _Flight(cacheable)
+
+            async def _run():
+                with use_cancel_token(flight.token):
+                    return await start(flight)
+
+            flight.task = asyncio.create_task(_run())
+            flight.task.add_done_callback(lambda task: self._finish(key, flight, task))
+        flight.waiters += 1
+        return flight
+
+    def _finish(self, key: tuple, flight: _Flight, task: asyncio.Task):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        flight.notify()
+        if task.cancelled() or task.exception() is not None:
+            return
+        if self.cache is not None and flight.cacheable(task.result()):
+            self.cache.set(key, task.result())
+
+    def _leave(self, key: tuple, flight: _Flight):
+        flight.waiters -= 1
+        if flight.waiters or flight.task.done():
+            return
+        # 기다리는 요청이 없으면 작업 중단 (이후 같은 요청은 새로 시작)
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        metrics.inc("single_flight_abandoned", endpoint=key[0])
+        flight.token.cancel()
+        flight.task.cancel()
+
+    def _cached(self, key: tuple):
+        if self.cache is None:
+            return None
+        result = self.cache.get(key)
+        if result is not None:
+            metrics.inc("single_flight_requests", endpoint=key[0], outcome="cache_hit")
+        return result
+
+    async def do(self, key: tuple, fn, cache_if=None):
+        """
+        fn()(코루틴 함수)의 결과를 같은 키의 요청들과 공유한다. 작업이 실패하면 모두 같은 예외를 받는다.
+        cache_if(result)가 False인 결과(일부 실패 등)는 캐시하지 않는다.
+        """
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+
+        flight = self._join(
+            key, lambda flight: fn(),
+            lambda result: result is not None and (cache_if is None or cache_if(result))
+        )
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(key, flight)
+
+    async def stream(self, key: tuple, fn):
+        """
+        fn()(비동기 제너레이터 함수)의 값을 같은 키의 요청들과 공유한다.
+        나중에 합류한 요청은 그때까지 나온 값부터 받은 뒤 이어서 받는다.
+        """
+        cached = self._cached(key)
+        if cached is not None:
+            for item in cached:
+                yield item
+            return
+
+        async def _produce(flight: _Flight):
+            async for item in fn():
+                flight.items.append(item)
+                flight.notify()
+            return flight.items
+
+        flight = self._join(key, _produce, bool)
+        try:
+            idx = 0
+            while True:
+                if idx < len(flight.items):
+                    idx += 1
+                    yield flight.items[idx - 1]
+                    continue
+                if flight.task.done():
+                    # 작업이 실패했으면 같은 예외를 올림
+                    flight.task.result()
+                    return
+                await flight.changed.wait()
+        finally:
+            self._leave(key, flight)
+
+
+single_flight = SingleFlight()
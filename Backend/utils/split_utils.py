@@ -1,35 +1,169 @@
 import re
+from bisect import bisect_right
+
+# 서버 코드(<% %>) / <script> / <style> 경계가 될 수 있는 태그
+_JSP_TAG = re.compile(r'<%|<script\b[^>]*>|</script\s*>|<style\b[^>]*>|</style\s*>', re.IGNORECASE)
+_HTML_TAG = re.compile(r'<script\b[^>]*>|</script\s*>|<style\b[^>]*>|</style\s*>', re.IGNORECASE)
+_RUNAT_SERVER = re.compile(r'runat\s*=\s*["\']?server', re.IGNORECASE)
+
+# 파일 유형별로 나눠지는 언어 (순서 = 결과 순서)
+PART_LAYOUT = {
+    "jsp": ["html", "java", "js", "css"],
+    "aspx": ["html", "cs", "js", "css"],
+    "html": ["html", "js", "css"],
+}
+PART_LABELS = {"html": "HTML", "java": "Java", "cs": "C#", "js": "JS", "css": "CSS"}
+
+
+class EmbeddedPart:
+    """
+    원본 문서에서 추출한 언어 하나의 코드와, 그 코드의 줄 → 원본 줄 매핑.
+
+    - 같은 영역(예: <script> 하나) 안에서는 다른 언어로 빠진 부분을 그 안의 줄바꿈만 남겨
+      채우므로 줄 간격이 원본과 같다. (html은 문서 전체가 한 영역 → 줄 번호가 원본과 동일)
+    - 서로 다른 영역(블록)은 줄바꿈으로 이어 붙이고, line_map에 블록마다
+      (이 코드에서의 시작 줄, 원본에서의 시작 줄)을 기록한다.
+    """
+
+    def __init__(self, ext: str):
+        self.ext = ext
+        self._pieces = []
+        self._part_lines = []
+        self._source_lines = []
+        self._line = 1  # 다음 텍스트가 들어갈 줄 (이 코드 기준)
+        self._ends_with_newline = True
+
+    def add(self, text: str, source_line: int, new_block: bool = False):
+        if not text:
+            return
+        if new_block or not self._pieces:
+            if self._pieces and not self._ends_with_newline:
+                self._pieces.append("\n")
+                self._line += 1
+            self._part_lines.append(self._line)
+            self._source_lines.append(source_line)
+        self._pieces.append(text)
+        self._line += text.count("\n")
+        self._ends_with_newline = text.endswith("\n")
+
+    def add_newlines(self, count: int):
+        """다른 언어로 빠진 부분 자리에 줄바꿈만 채움"""
+        if count:
+            # 아직 비어 있으면 문서 첫 줄부터 시작하는 셈
+            self.add("\n" * count, 1)
+
+    @property
+    def code(self) -> str:
+        return "".join(self._pieces)
+
+    @property
+    def line_map(self) -> list[tuple[int, int]]:
+        return list(zip(self._part_lines, self._source_lines))
+
+    def to_source_line(self, line: int) -> int:
+        """이 코드의 줄 번호(1부터)를 원본 문서의 줄 번호로 변환"""
+        idx = bisect_right(self._part_lines, line) - 1
+        if idx < 0:
+            return line
+        return self._source_lines[idx] + (line - self._part_lines[idx])
+
+
+def split_embedded(source: str, ext: str) -> dict[str, EmbeddedPart]:
+    """
+    JSP/ASPX/HTML 문서를 한 번 훑어서 언어별 코드로 나눈다. (원본 줄 매핑 포함)
+
+    - JSP: <% %>, <%= %>, <%! %> → java / <%-- --%> 주석, <%@ %> 지시자는 제외
+    - ASPX: <script runat="server"> → cs (인라인 <% %>는 기존처럼 html에 남김)
+    - <script> → js, <style> → css, 나머지 → html (script/style 태그 자체는 html에 남김)
+
+    Returns:
+        dict: PART_LAYOUT[ext] 순서의 {언어: EmbeddedPart}
+    """
+    layout = PART_LAYOUT[ext]
+    parts = {part_ext: EmbeddedPart(part_ext) for part_ext in layout}
+    html = parts["html"]
+    tag_pattern = _JSP_TAG if ext == "jsp" else _HTML_TAG
+    server_ext = layout[1] if ext in ("jsp", "aspx") else None
+
+    line = 1
+    line_pos = 0  # line을 센 위치
+
+    def take(part_ext: str, start: int, end: int, new_block: bool = False):
+        nonlocal line, line_pos
+        if start >= end:
+            return
+        line += source.count("\n", line_pos, start)
+        line_pos = start
+        if part_ext == "html":
+            html.add(source[start:end], line)
+        else:
+            parts[part_ext].add(source[start:end], line, new_block)
+            html.add_newlines(source.count("\n", start, end))
+
+    mode = "html"  # 현재 영역: html / js / css / (aspx) cs
+    block_start = False  # 영역이 막 열렸으면 다음 텍스트는 새 블록
+    pos = 0
+    n = len(source)
+    while pos < n:
+        match = tag_pattern.search(source, pos)
+        if not match:
+            take(mode, pos, n, block_start)
+            break
+
+        tag = match.group().lower()
+        if match.start() > pos:
+            take(mode, pos, match.start(), block_start)
+            block_start = False
+
+        if tag == "<%":
+            # JSP 서버 코드는 어느 영역 안에 있든 java
+            body_start = match.end()
+            closer = "--%>" if source.startswith("--", body_start) else "%>"
+            close = source.find(closer, body_start)
+            body_end = n if close < 0 else close
+            pos = n if close < 0 else close + len(closer)
+            if closer == "%>" and not source.startswith("@", body_start):
+                if source.startswith(("=", "!"), body_start):
+                    body_start += 1
+                take(server_ext, body_start, body_end, new_block=True)
+            else:
+                html.add_newlines(source.count("\n", match.start(), pos))
+            if mode != "html":
+                parts[mode].add_newlines(source.count("\n", match.start(), pos))
+            continue
+
+        pos = match.end()
+        if mode == "html" and tag.startswith("<script"):
+            new_mode = server_ext if ext == "aspx" and _RUNAT_SERVER.search(tag) else "js"
+        elif mode == "html" and tag.startswith("<style"):
+            new_mode = "css"
+        elif mode != "html" and tag.startswith("</style" if mode == "css" else "</script"):
+            new_mode = "html"
+        else:
+            # 영역을 바꾸지 않는 태그 (<script> 안의 "<style>" 문자열 등)
+            take(mode, match.start(), pos, block_start)
+            block_start = False
+            continue
+
+        # 영역을 여닫는 태그 자체는 html로
+        take("html", match.start(), pos)
+        mode = new_mode
+        block_start = True
+
+    return parts
+
 
 def split_jsp(html: str):
-    # JSP에서 Java 코드만 추출
-    java_blocks = re.findall(r'<%[=!\-]?([\s\S]*?)%>', html)
-    html_only = re.sub(r'<%[=!\-]?[\s\S]*?%>', '', html)
-    js_blocks = re.findall(r'<script[\s\S]*?>([\s\S]*?)<\/script>', html_only, re.IGNORECASE)
-    css_blocks = re.findall(r'<style[\s\S]*?>([\s\S]*?)<\/style>', html_only, re.IGNORECASE)
-    java_code = "\n".join(java_blocks)
-    js_code = "\n".join(js_blocks)
-    css_code = "\n".join(css_blocks)
-    return html_only, java_code, js_code, css_code
+    # JSP에서 html, java, js, css 코드 추출
+    parts = split_embedded(html, "jsp")
+    return tuple(part.code for part in parts.values())
 
 def split_aspx(html: str):
-    # ASPX: C# 코드 블록 추출
-    cs_blocks = re.findall(r'<script\s+runat="server"[\s\S]*?>([\s\S]*?)<\/script>', html, re.IGNORECASE)
-    html_only = re.sub(r'<script\s+runat="server"[\s\S]*?>([\s\S]*?)<\/script>', '', html, flags=re.IGNORECASE)
-    js_blocks = re.findall(r'<script(?![^>]*runat="server")[\s\S]*?>([\s\S]*?)<\/script>', html_only, re.IGNORECASE)
-    css_blocks = re.findall(r'<style[\s\S]*?>([\s\S]*?)<\/style>', html_only, re.IGNORECASE)
-    cs_code = "\n".join(cs_blocks)
-    js_code = "\n".join(js_blocks)
-    css_code = "\n".join(css_blocks)
-    return html_only, cs_code, js_code, css_code
+    # ASPX에서 html, C#, js, css 코드 추출
+    parts = split_embedded(html, "aspx")
+    return tuple(part.code for part in parts.values())
 
 def split_html(html: str):
-    # <script> 내부 js 추출
-    js_blocks = re.findall(r'<script[\s\S]*?>([\s\S]*?)<\/script>', html, re.IGNORECASE)
-    # <style> 내부 css 추출
-    css_blocks = re.findall(r'<style[\s\S]*?>([\s\S]*?)<\/style>', html, re.IGNORECASE)
-    # <script>, <style> 블록 제거한 html만 남기기
-    html_only = re.sub(r'<script[\s\S]*?>([\s\S]*?)<\/script>', '', html, flags=re.IGNORECASE)
-    html_only = re.sub(r'<style[\s\S]*?>([\s\S]*?)<\/style>', '', html_only, flags=re.IGNORECASE)
-    js_code = "\n".join(js_blocks)
-    css_code = "\n".join(css_blocks)
-    return html_only, js_code, css_code
\ No newline at end of file
+    # HTML에서 html, js, css 코드 추출
+    parts = split_embedded(html, "html")
+    return tuple(part.code for part in parts.values())
@@ -0,0 +1,194 @@
+import re
+
+BRACE_LANGUAGES = {"Java", "C#", "JavaScript", "TypeScript", "C++", "C", "Vue"}
+
+# JS 정규식 리터럴의 여는 '/' 앞에 올 수 있는 것: 연산자/여는 괄호(공백 한 칸까지), 일부 키워드.
+# 그 밖의 '/'(식별자, 닫는 괄호 뒤)는 나눗셈으로 본다.
+_REGEX_START = "|".join(
+    [r"(?<=[=(,:!&|?\[{;~^]/)", r"(?<=[=(,:!&|?\[{;~^][ \t]/)"]
+    + [rf"(?<=\b{word} /)" for word in ("return", "typeof", "case", "throw", "yield", "await", "void", "delete")]
+)
+
+# 구조 토큰 사이의 "나머지"(일반 코드, 문자열, 주석)를 한 번에 삼키는 패턴.
+# 닫는 따옴표나 */ 가 없어도 끝까지 매칭되게 만들어서 매칭이 실패하지 않음 → 백트래킹 없이 선형.
+# (되돌아갈 일이 없으므로 소유 수량자 *+, ++ 로 되돌아갈 위치도 저장하지 않음)
+# findall 한 번으로 (나머지, 구조 토큰) 목록을 만들고 파이썬 루프는 구조 토큰 수만큼만 돈다.
+_BRACE_TOKEN = re.compile(
+    r'((?:[^/"\'`@{};]++'
+    r'|//[^\n]*+'                     # 한 줄 주석
+    r'|/\*[\s\S]*?(?:\*/|\Z)'        # 블록 주석
+    r'|"""[\s\S]*?(?:"""|\Z)'        # Java 텍스트 블록
+    r'|@"(?:[^"]|"")*+"?'            # C# verbatim 문자열
+    r'|"(?:\\.|[^"\\\n])*+"?'        # 문자열
+    r"|'(?:\\.|[^'\\\n])*+'?"        # 문자 / JS 문자열
+    r'|`(?:\\[\s\S]|[^`\\])*+`?'     # JS 템플릿 문자열
+    r'|/(?:' + _REGEX_START + r')'   # JS 정규식 리터럴 (같은 줄에서 닫힐 때만, 아니면 나눗셈)
+    r'(?:\\.|\[(?:\\.|[^\]\\\n])*+\]|[^/\\\n\[])++/[A-Za-z]*+'
+    r'|[/@])*+)'
+    r'([{};]|\Z)'
+)
+
+_PY_TOKEN = re.compile(
+    r'((?:[^#"\'()\[\]{}\n]++'
+    r'|\([^#"\'()\[\]{}\n]*+\)|\[[^#"\'()\[\]{}\n]*+\]'   # 한 줄 안에서 닫히는 단순 괄호는 깊이에 영향 없음
+    r'|#[^\n]*+'
+    r'|"""[\s\S]*?(?:"""|\Z)'          # 문자열 접두사(r, b, f ...)는 일반 코드로 넘어감
+    r"|'''[\s\S]*?(?:'''|\Z)"
+    r'|"(?:\\.|[^"\\\n])*+"?'
+    r"|'(?:\\.|[^'\\\n])*+'?)*+)"
+    # 괄호, 또는 줄바꿈 + 다음 줄의 들여쓰기와 선언 키워드(데코레이터/def/class)
+    # (빈 줄과 주석만 있는 줄은 줄바꿈 토큰에 함께 포함)
+    r'(?:([(\[{]|[)\]}])|(\n(?:[ \t]*(?:#[^\n]*)?\r?\n)*)([ \t]*)(@|(?:async[ \t]+)?def\b|class\b)?|\Z)'
+)
+
+# 앞 블록에 이어지는 절 (들여쓰기가 0으로 돌아와도 최상위 코드가 새로 시작된 게 아님)
+_PY_CLAUSE = re.compile(r'(?:else|elif|except|finally)\b')
+
+# 이 키워드가 헤더에 있는 블록은 선언을 담는 "컨테이너" (클래스, 네임스페이스 등)
+_CONTAINER_HEADER = re.compile(r'\b(class|interface|enum|namespace|struct|record|module|union)\b|extern\s+"C"')
+_CONTAINER_WORDS = ("class", "interface", "enum", "namespace", "struct", "record", "module", "union", "extern")
+_HEADER_COMMENT = re.compile(r'//[^\n]*+|/\*[\s\S]*?(?:\*/|\Z)')
+
+
+def _line_end(code: str, pos: int) -> int:
+    """pos 이후 첫 줄바꿈 다음 위치 (= 다음 줄 시작)"""
+    nl = code.find("\n", pos)
+    return len(code) if nl < 0 else nl + 1
+
+
+def _is_container(header: str) -> bool:
+    """
+    블록 헤더(앞 선언 끝 ~ '{')가 컨테이너인지. 주석(Javadoc 등) 속 단어는 보지 않는다.
+    헤더 대부분은 메서드 선언이라 키워드가 없으므로 문자열 검색으로 먼저 거른다.
+    """
+    if not any(word in header for word in _CONTAINER_WORDS):
+        return False
+    return bool(_CONTAINER_HEADER.search(_HEADER_COMMENT.sub(" ", header)))
+
+
+def brace_boundaries(code: str) -> list[int]:
+    """
+    중괄호 언어(Java, C#, JS/TS, C/C++)에서 최상위 선언 단위의 시작 위치 목록.
+
+    문자열/주석/정규식 리터럴은 건너뛰고 중괄호 깊이를 따라가면서, 블록이 닫혀 클래스/네임스페이스 같은
+    컨테이너 블록(또는 파일 최상위)으로 돌아오는 지점과 컨테이너 수준의 ';'(필드 선언 등)
+    다음 줄을 경계로 본다. 여러 줄에 걸친 메서드 선언도 중간에 잘리지 않는다.
+    """
+    boundaries = []
+    containers = 0  # 열려 있는 컨테이너 블록 수
+    body = 0  # 메서드 본문처럼 컨테이너가 아닌 블록의 깊이 (0이면 컨테이너 또는 최상위 수준)
+    stmt_start = 0  # 컨테이너 수준에서 현재 선언(블록 헤더)이 시작된 위치
+    cut = 0  # 마지막 경계 (같은 줄의 토큰은 같은 경계)
+    end = 0  # 현재 토큰 바로 다음 위치
+
+    for rest, token in _BRACE_TOKEN.findall(code):
+        end += len(rest) + 1
+        if body:
+            # 본문 안에서는 깊이만 따라감 (토큰 대부분이 여기서 끝나도록)
+            if token == "{":
+                body += 1
+            elif token == "}":
+                body -= 1
+                if not body:
+                    stmt_start = end
+                    if end > cut:
+                        cut = _line_end(code, end - 1)
+                        boundaries.append(cut)
+            continue
+        if token == "{":
+            if _is_container(code[stmt_start:end - 1]):
+                containers += 1
+            else:
+                body = 1
+            stmt_start = end
+        elif token:
+            # 컨테이너 수준의 '}'(컨테이너가 닫힘) 또는 ';'(필드 선언 등)
+            if token == "}" and containers:
+                containers -= 1
+            stmt_start = end
+            if end > cut:
+                cut = _line_end(code, end - 1)
+                boundaries.append(cut)
+
+    return boundaries
+
+
+def python_boundaries(code: str) -> list[int]:
+    """
+    Python에서 함수 밖에 있는 def/class(데코레이터 포함) 줄과,
+    def/class 블록이 끝나고 들여쓰기 0으로 돌아온 최상위 코드 줄의 시작 위치 목록.
+    삼중따옴표 문자열과 괄호 안의 줄바꿈은 논리적 줄 경계로 보지 않는다.
+    """
+    boundaries = []
+    scopes = []  # (들여쓰기, def 여부)
+    def_depth = 0  # scopes 중 def 개수
+    depth = 0
+    decorated = False
+    pos = -1  # 첫 줄도 줄바꿈 뒤에 오는 줄처럼 처리하기 위해 "\n"을 앞에 붙임
+
+    for rest, bracket, newline, indent, decl in _PY_TOKEN.findall("\n" + code):
+        pos += len(rest)
+        if bracket:
+            pos += 1
+            if bracket in "([{":
+                depth += 1
+            elif depth:
+                depth -= 1
+            continue
+        if not newline:
+            continue
+
+        line_start = pos + len(newline)
+        pos = line_start + len(indent) + len(decl)
+        if depth:
+            continue
+        if not decl:
+            # 빈 줄과 주석 줄은 블록을 닫지 않음
+            if code.startswith(("\n", "\r", "#"), pos) or pos >= len(code):
+                continue
+            decorated = False
+
+        closed = False
+        while scopes and len(indent) <= scopes[-1][0]:
+            def_depth -= scopes.pop()[1]
+            closed = True
+
+        if decl == "@":
+            if not decorated and not def_depth:
+                boundaries.append(line_start)
+            decorated = True
+        elif decl:
+            if not decorated and not def_depth:
+                boundaries.append(line_start)
+            is_def = not decl.startswith("class")
+            scopes.append((len(indent), is_def))
+            def_depth += is_def
+            decorated = False
+        elif closed and not indent and not _PY_CLAUSE.match(code, pos):
+            # 마지막 메서드 뒤의 최상위 코드가 그 메서드 단위에 붙지 않도록 새 단위로
+            boundaries.append(line_start)
+
+    return boundaries
+
+
+def split_units(code: str, language: str) -> list[str]:
+    """
+    선언 경계에서 코드를 잘라 단위 목록으로 반환 (이어 붙이면 원본과 동일).
+    지원하지 않는 언어는 줄 단위.
+    """
+    if language in BRACE_LANGUAGES:
+        boundaries = brace_boundaries(code)
+    elif language == "Python":
+        boundaries = python_boundaries(code)
+    else:
+        return code.splitlines(keepends=True)
+
+    units = []
+    start = 0
+    for cut in boundaries:
+        if cut > start:
+            units.append(code[start:cut])
+            start = cut
+    if start < len(code):
+        units.append(code[start:])
+    return units
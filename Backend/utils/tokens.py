@@ -0,0 +1,52 @@
+from config import MODEL_TOKEN_LIMITS, DEFAULT_MODEL_TOKEN_LIMITS, CHUNK_CONTEXT_RATIO
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken이 없으면 추정치 사용
+    tiktoken = None
+
+_encodings = {}
+
+
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model]
+
+
+def estimate_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """
+    텍스트의 토큰 수. tiktoken이 있으면 정확히 세고, 없으면 빠르게 추정.
+
+    추정: ASCII(코드)는 약 3글자당 1토큰, 한글 등 비ASCII 문자는 글자당 약 1토큰
+    """
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    non_ascii_chars = len(text) - ascii_chars
+    return ascii_chars // 3 + non_ascii_chars + 1
+
+
+def clip_to_tokens(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> str:
+    """text가 max_tokens를 넘으면 앞부분만 남기고 잘라낸 표시를 붙인다 (토큰 비율로 글자 수 계산)"""
+    tokens = estimate_tokens(text, model)
+    if tokens <= max_tokens:
+        return text
+    return text[:max(1, len(text) * max_tokens // tokens)] + "\n...(이하 생략)"
+
+
+def chunk_token_budget(model: str) -> int:
+    """
+    모델에 맞는 chunk 하나의 토큰 예산.
+    리뷰/정렬 응답은 입력 코드만큼 길어지므로 최대 출력 토큰도 함께 고려.
+    """
+    context_tokens, max_output_tokens = MODEL_TOKEN_LIMITS.get(model, DEFAULT_MODEL_TOKEN_LIMITS)
+    budget = min(context_tokens * CHUNK_CONTEXT_RATIO, max_output_tokens * 0.75)
+    return max(500, int(budget))